@@ -0,0 +1,339 @@
+import difflib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+# 記事の版（リビジョン）を保存するストア
+# 各版は生成・調整・グラウンディング・手動編集のどれで作られたかと、そのときのパラメータを持つ
+# 本文は直前の版との行単位の差分を圧縮して保存し、一定間隔で全文（スナップショット）を挟む
+# 最新版の本文は記事ごとに全文でも持っておき、差分をたどらずに読み込めるようにする
+# 記事は作成したユーザー（所有者）ごとに一覧し、他のユーザーの下書きは見せない
+
+# 保存先（環境変数で上書き可能）
+DATA_DIR = os.environ.get("LLMO_DATA_DIR", ".data")
+STORE_DB_PATH = os.path.join(DATA_DIR, "articles.sqlite3")
+
+# この版数ごとに全文を保存し、復元時にたどる差分の数を抑える
+SNAPSHOT_INTERVAL = 20
+# 復元した本文をプロセス内に保持する件数
+MEMORY_MAX_ENTRIES = 64
+
+ORIGINS = ("generation", "rewrite", "grounding", "manual", "revert", "repair")
+ORIGIN_LABELS = {
+    "generation": "記事生成",
+    "rewrite": "AI調整",
+    "grounding": "グラウンディング",
+    "manual": "手動編集",
+    "revert": "版の復元",
+    "repair": "LLMO要件の修正",
+}
+
+# articles() で所有者を絞り込まないことを表す値
+ALL_OWNERS = object()
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 9)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def make_delta(before, after):
+    # 直前の版の行範囲のコピー [start, end] と、追加された行の文字列を並べた差分
+    old_lines = before.splitlines(keepends=True)
+    new_lines = after.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append("".join(new_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(before, ops):
+    old_lines = before.splitlines(keepends=True)
+    pieces = []
+    for op in ops:
+        if isinstance(op, str):
+            pieces.append(op)
+        else:
+            pieces.extend(old_lines[op[0] : op[1]])
+    return "".join(pieces)
+
+
+class ArticleStore:
+    def __init__(
+        self,
+        db_path=STORE_DB_PATH,
+        snapshot_interval=SNAPSHOT_INTERVAL,
+        memory_max_entries=MEMORY_MAX_ENTRIES,
+    ):
+        self.db_path = db_path
+        self.snapshot_interval = snapshot_interval
+        self.memory_max_entries = memory_max_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streamlitのスクリプトスレッドは実行ごとに変わるため、ロックで直列化して共有する
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS articles (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                head INTEGER NOT NULL,
+                head_text BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT
+            );
+            CREATE TABLE IF NOT EXISTS revisions (
+                article_id TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                origin TEXT NOT NULL,
+                params TEXT NOT NULL,
+                grounding BLOB,
+                snapshot INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (article_id, number)
+            );
+            """
+        )
+        # 所有者の列がない古いデータベースには列を足す（既存の記事は所有者なしとして誰にも一覧しない）
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(articles)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE articles ADD COLUMN owner TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS articles_owner ON articles (owner, updated_at)"
+        )
+        self._conn.commit()
+
+    def create(self, title, text, origin="generation", params=None, owner=None):
+        article_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO articles (id, title, head, head_text, created_at,"
+                " updated_at, owner) VALUES (?, ?, 0, ?, ?, ?, ?)",
+                (article_id, title, zlib.compress(b""), now, now, owner),
+            )
+            number = self._append(article_id, "", 0, text, origin, params, None, now)
+            self._conn.commit()
+        return article_id, number
+
+    def commit(self, article_id, text, origin, params=None, grounding=None):
+        # 新しい版を追加して、その版番号を返す。本文が最新版と同じで付随情報もなければ追加しない
+        if origin not in ORIGINS:
+            raise ValueError(f"不明な版の種類です: {origin}")
+        with self._lock:
+            head, head_text = self._head(article_id)
+            if text == head_text and not params and grounding is None:
+                return head
+            number = self._append(
+                article_id, head_text, head, text, origin, params, grounding
+            )
+            self._conn.commit()
+        return number
+
+    def head(self, article_id):
+        with self._lock:
+            return self._head(article_id)
+
+    def load(self, article_id, number=None):
+        with self._lock:
+            head, head_text = self._head(article_id)
+            if number is None or number == head:
+                return head_text
+            return self._reconstruct(article_id, number)
+
+    def revert(self, article_id, number):
+        # 指定した版の本文を、新しい版として最新に積む（履歴は消さない）
+        text = self.load(article_id, number)
+        return self.commit(article_id, text, "revert", {"reverted_to": number})
+
+    def diff(self, article_id, before, after):
+        return "\n".join(
+            difflib.unified_diff(
+                self.load(article_id, before).splitlines(),
+                self.load(article_id, after).splitlines(),
+                fromfile=f"版{before}",
+                tofile=f"版{after}",
+                lineterm="",
+            )
+        )
+
+    def revisions(self, article_id):
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT number, origin, params, grounding IS NOT NULL, snapshot,
+                       size, stored_size, created_at
+                FROM revisions WHERE article_id = ? ORDER BY number
+                """,
+                (article_id,),
+            ).fetchall()
+        return [
+            {
+                "number": row[0],
+                "origin": row[1],
+                "params": json.loads(row[2]),
+                "grounded": bool(row[3]),
+                "snapshot": bool(row[4]),
+                "size": row[5],
+                "stored_size": row[6],
+                "created_at": row[7],
+            }
+            for row in rows
+        ]
+
+    def latest_grounding(self, article_id):
+        # 最後にグラウンディングした版の番号と、そのときのグラウンディング情報を返す
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT number, grounding FROM revisions
+                WHERE article_id = ? AND grounding IS NOT NULL
+                ORDER BY number DESC LIMIT 1
+                """,
+                (article_id,),
+            ).fetchone()
+            if row is None:
+                return None, None
+            key = ("grounding", article_id, row[0])
+            if key not in self._memory:
+                self._remember(key, _unpack(row[1]))
+            self._memory.move_to_end(key)
+            return row[0], self._memory[key]
+
+    def articles(self, owner, limit=20):
+        # 指定した所有者の記事を、更新の新しい順に返す
+        # owner に ALL_OWNERS を渡すと全員の記事を返す（プロセス内の処理で使う）
+        query = "SELECT id, title, head, updated_at FROM articles"
+        args = []
+        if owner is not ALL_OWNERS:
+            query += " WHERE owner = ?"
+            args.append(owner)
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY updated_at DESC LIMIT ?", (*args, limit)
+            ).fetchall()
+        return [
+            {"id": row[0], "title": row[1], "head": row[2], "updated_at": row[3]}
+            for row in rows
+        ]
+
+    def _head(self, article_id):
+        key = ("head", article_id)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        row = self._conn.execute(
+            "SELECT head, head_text FROM articles WHERE id = ?", (article_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(article_id)
+        head = (row[0], zlib.decompress(row[1]).decode("utf-8"))
+        self._remember(key, head)
+        return head
+
+    def _append(
+        self, article_id, head_text, head, text, origin, params, grounding, now=None
+    ):
+        now = now or time.time()
+        number = head + 1
+        # 差分のほうが大きくなる場合や、前回の全文から間隔が空いた場合は全文で保存する
+        full = zlib.compress(text.encode("utf-8"), 9)
+        snapshot = number == 1 or number % self.snapshot_interval == 1
+        data = full
+        if not snapshot:
+            delta = _pack(make_delta(head_text, text))
+            if len(delta) < len(full):
+                data = delta
+            else:
+                snapshot = True
+
+        self._conn.execute(
+            "INSERT INTO revisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                article_id,
+                number,
+                origin,
+                json.dumps(params or {}, ensure_ascii=False),
+                None if grounding is None else _pack(grounding),
+                int(snapshot),
+                data,
+                len(text.encode("utf-8")),
+                len(data),
+                now,
+            ),
+        )
+        self._conn.execute(
+            "UPDATE articles SET head = ?, head_text = ?, updated_at = ? WHERE id = ?",
+            (number, full, now, article_id),
+        )
+        self._remember(("head", article_id), (number, text))
+        return number
+
+    def _reconstruct(self, article_id, number):
+        key = ("text", article_id, number)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        # 指定の版から直近の全文までさかのぼり、そこから差分を順に当てる
+        rows = self._conn.execute(
+            """
+            SELECT number, snapshot, data FROM revisions
+            WHERE article_id = ? AND number <= ? AND number >= (
+                SELECT MAX(number) FROM revisions
+                WHERE article_id = ? AND number <= ? AND snapshot = 1
+            )
+            ORDER BY number
+            """,
+            (article_id, number, article_id, number),
+        ).fetchall()
+        if not rows or rows[-1][0] != number:
+            raise KeyError((article_id, number))
+        text = ""
+        for _, snapshot, data in rows:
+            if snapshot:
+                text = zlib.decompress(data).decode("utf-8")
+            else:
+                text = apply_delta(text, _unpack(data))
+        self._remember(key, text)
+        return text
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # 全セッションで共有するプロセス単位のストア
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArticleStore()
+        return _store
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+import tomllib
+
+import fact_store
+import grounding_client
+import incremental_grounding
+import llm
+import prompts
+import router
+import title_generation
+
+# 使い方:
+#   python batch.py keywords.csv -o drafts.jsonl --concurrency 4 --ground
+#
+# 入力はCSVまたはJSONL。各行に keywords（必須）と summary / style / wordcount / id（任意）を持つ。
+# keywords はカンマ・読点区切りの文字列、またはJSONLの場合は配列でもよい。
+# 出力JSONLには1行ずつ結果が追記され、同じ出力ファイルで再実行すると成功済みの行は読み飛ばされる。
+
+DEFAULT_MODEL = f"models/{router.primary('article')}"
+DEFAULT_WORDCOUNT = 400
+
+
+def load_api_key():
+    # CLIではStreamlitを起動しないため、環境変数 → .streamlit/secrets.toml の順に探す
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if api_key:
+        return api_key
+    secrets_path = os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(secrets_path):
+        with open(secrets_path, "rb") as f:
+            api_key = tomllib.load(f).get("GEMINI_API_KEY")
+    if not api_key:
+        sys.exit(
+            "APIキーが見つかりません。環境変数 GEMINI_API_KEY か .streamlit/secrets.toml を設定してください。"
+        )
+    return api_key
+
+
+def split_keywords(value):
+    if isinstance(value, list):
+        return [str(k).strip() for k in value if str(k).strip()]
+    value = (value or "").replace("、", ",")
+    return [k.strip() for k in value.split(",") if k.strip()]
+
+
+def normalize_row(row):
+    keywords = split_keywords(row.get("keywords"))
+    job = {
+        "keywords": keywords,
+        "summary": (row.get("summary") or "").strip(),
+        "style": (row.get("style") or "").strip(),
+        "wordcount": int(row.get("wordcount") or DEFAULT_WORDCOUNT),
+    }
+    # IDが指定されていなければ、入力内容から決まるIDを振って再開時の突き合わせに使う
+    job_id = row.get("id")
+    if not job_id:
+        material = json.dumps(job, ensure_ascii=False, sort_keys=True)
+        job_id = hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+    job["id"] = str(job_id)
+    return job
+
+
+def read_jobs(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    jobs = [normalize_row(row) for row in rows]
+    return [job for job in jobs if job["keywords"]]
+
+
+def read_completed_ids(path):
+    # 途中でクラッシュした場合でも、書き終えた行だけを完了扱いにする
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def select_title(titles, keywords):
+    # キーワードを最も多く含むタイトルを選ぶ（同数ならモデルが先に挙げたもの）
+    def score(title):
+        return sum(1 for keyword in keywords if keyword in title)
+
+    return max(titles, key=score)
+
+
+def ground_article(api_key, article_text):
+    payload = grounding_client.build_grounding_payload(
+        prompts.build_grounding_prompt(article_text)
+    )
+    response = grounding_client.generate_content(api_key, payload)
+    response_json = response.json()
+    grounded_text = grounding_client.extract_text(response_json)
+    grounding_meta = response_json["candidates"][0].get("groundingMetadata", {})
+    # 出典付きの文は、アプリの高速グラウンディングでも使えるように保存しておく
+    fact_store.get_store().add_grounding(
+        incremental_grounding.build_paragraph_states(grounded_text, grounding_meta),
+        grounding_meta.get("webSearchQueries", []),
+    )
+    return grounded_text, grounding_meta
+
+
+async def run_job(job, model, api_key, ground):
+    keywords_str = ", ".join(job["keywords"])
+
+    title_items = await asyncio.to_thread(
+        title_generation.generate, model, keywords_str, job["summary"]
+    )
+    titles = [item["title"] for item in title_items]
+    if not titles:
+        raise ValueError("タイトル案を解析できませんでした。")
+    selected_title = select_title(titles, job["keywords"])
+
+    prompt_for_article = prompts.build_article_prompt(
+        selected_title, keywords_str, job["wordcount"], job["summary"], job["style"]
+    )
+    article_text = await asyncio.to_thread(
+        llm.generate_text, model, prompt_for_article, kind="article"
+    )
+
+    record = {
+        "titles": titles,
+        "title_details": title_items,
+        "selected_title": selected_title,
+        "article_text": article_text,
+    }
+    if ground:
+        grounded_text, grounding_meta = await asyncio.to_thread(
+            ground_article, api_key, article_text
+        )
+        record["grounded_text"] = grounded_text
+        record["grounding_metadata"] = grounding_meta
+    return record
+
+
+async def run_pipeline(jobs, model, api_key, output_path, concurrency, ground):
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    counts = {"ok": 0, "error": 0}
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def worker(job):
+            async with semaphore:
+                started = time.perf_counter()
+                record = {"id": job["id"], "input": job}
+                try:
+                    record.update(await run_job(job, model, api_key, ground))
+                    record["status"] = "ok"
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = f"{type(e).__name__}: {e}"
+                record["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+
+            # 1行ずつ書き込んでfsyncし、クラッシュしても完了済みの結果は失わない
+            async with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                counts[record["status"]] += 1
+                print(
+                    f"[{record['status']}] {job['id']} ({record['elapsed_seconds']}s)",
+                    file=sys.stderr,
+                )
+
+        await asyncio.gather(*(worker(job) for job in jobs))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="キーワードセットから記事ドラフトを一括生成します。"
+    )
+    parser.add_argument("input", help="キーワードセットのCSVまたはJSONL")
+    parser.add_argument(
+        "-o", "--output", default="drafts.jsonl", help="結果を追記するJSONL"
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="同時に処理する行数"
+    )
+    parser.add_argument(
+        "--ground", action="store_true", help="生成後にWeb検索で事実補強する"
+    )
+    parser.add_argument(
+        "--model",
+        help="タイトル・記事生成のモデルを固定する（省略時は種別ごとの振り分けに従う）",
+    )
+    args = parser.parse_args(argv)
+
+    import google.generativeai as genai
+
+    api_key = load_api_key()
+    llm.configure_sdk(genai, api_key)
+    if args.model:
+        router.override(args.model)
+    model = genai.GenerativeModel(args.model or DEFAULT_MODEL)
+
+    jobs = read_jobs(args.input)
+    completed = read_completed_ids(args.output)
+    pending = [job for job in jobs if job["id"] not in completed]
+    print(
+        f"{len(jobs)}件中{len(jobs) - len(pending)}件は完了済みのため、{len(pending)}件を処理します。",
+        file=sys.stderr,
+    )
+
+    counts = asyncio.run(
+        run_pipeline(
+            pending,
+            model,
+            api_key,
+            args.output,
+            max(1, args.concurrency),
+            args.ground,
+        )
+    )
+    print(f"完了: 成功 {counts['ok']}件 / 失敗 {counts['error']}件", file=sys.stderr)
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import llm
+import llmo_validator
+import longform
+import prompts
+
+TITLE = "中小企業のDX入門：補助金を活用して始める業務改善"
+KEYWORDS = "DX, 中小企業, 補助金"
+
+
+def bench_article_stream(measure, model, placeholder):
+    prompt = prompts.build_article_prompt(TITLE, KEYWORDS, 1500)
+    text = measure(llm.stream_text, model, prompt, placeholder, use_cache=False)
+    assert text
+
+
+def bench_article_longform(measure, model):
+    def run():
+        outline = longform.generate_outline(
+            model, TITLE, KEYWORDS, 4000, use_cache=False
+        )
+        return longform.generate_sections(
+            model, TITLE, KEYWORDS, outline, 4000, use_cache=False
+        )
+
+    assert measure(run)
+
+
+def bench_llmo_repair(measure, model):
+    # 1セクションだけ要件を満たしていない記事を、そのセクションだけ修正する
+    # （記事全体を作り直すbench_article_streamとの比較用）
+    prompt = prompts.build_article_prompt(TITLE, KEYWORDS, 1500)
+    article = llm.generate_text(model, prompt)
+    broken = "\n".join(
+        line for line in article.splitlines() if not line.startswith("|")
+    )
+    checks = llmo_validator.validate(broken)
+    assert [check["rule"] for check in llmo_validator.failing(checks)] == ["table"]
+    text, locations = measure(
+        llmo_validator.repair, model, broken, checks, TITLE, False
+    )
+    assert len(locations) == 1 and not llmo_validator.failing(
+        llmo_validator.validate(text)
+    )
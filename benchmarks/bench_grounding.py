@@ -0,0 +1,130 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+import fact_store
+import fast_grounding
+import grounding_client
+import incremental_grounding
+import llm
+import prompts
+
+from conftest import API_KEY, ROOT
+
+ARTICLE = "\n\n".join(
+    f"DXの取り組み{i}では、補助金を活用して業務を改善します。" for i in range(1, 9)
+)
+
+
+def bench_grounding_stream(measure, api_key, placeholder):
+    payload = grounding_client.build_grounding_payload(
+        prompts.build_grounding_prompt(ARTICLE)
+    )
+
+    def run():
+        response = grounding_client.generate_content(api_key, payload, stream=True)
+        return llm.stream_rest_response(response, placeholder)
+
+    response_json = measure(run)
+    assert response_json["candidates"][0]["groundingMetadata"]
+
+
+def bench_grounding_incremental(measure, api_key):
+    _, states, _ = incremental_grounding.reground(api_key, ARTICLE, [])
+    # 1段落だけ書き換えた状態から再グラウンディングする
+    edited = ARTICLE.replace("取り組み3", "取り組み三")
+
+    new_text, _, _ = measure(incremental_grounding.reground, api_key, edited, states)
+    assert new_text
+
+
+def bench_grounding_fast(measure, api_key, placeholder, tmp_path):
+    # 一度Google検索でグラウンディングした結果を事実として保存し、同じ記事を高速モードで処理する
+    store = fact_store.FactStore(str(tmp_path / "facts.sqlite3"))
+    _, states, _ = incremental_grounding.reground(api_key, ARTICLE, [])
+    store.add_grounding(states)
+
+    def run():
+        facts, recall = fast_grounding.retrieve(ARTICLE, store)
+        assert recall >= fast_grounding.MIN_RECALL
+        response = fast_grounding.open_stream(api_key, ARTICLE, facts)
+        return fast_grounding.build_result(
+            llm.stream_rest_response(response, placeholder), facts
+        )
+
+    _, states, _ = measure(run)
+    assert any(state["supports"] for state in states)
+
+
+def bench_fact_search(measure, tmp_path):
+    # 5000件の事実から、1段落に関係するものを検索する
+    store = fact_store.FactStore(str(tmp_path / "facts.sqlite3"))
+    topics = ["手作業", "自動化", "ワークフロー", "DX", "請求書", "勤怠", "残業"]
+    store.add_many(
+        (
+            f"{topics[i % 7]}と{topics[(i * 3) % 7]}に関する調査{i}では、"
+            f"業務時間が{i % 90}%削減されたと報告されています。",
+            [{"title": f"ex{i % 50}", "uri": f"https://example.com/{i}"}],
+        )
+        for i in range(5000)
+    )
+    paragraph = "請求書の手作業による入力は残業の原因になりやすく、ワークフローの自動化で業務時間を削減できます。"
+
+    results = measure(store.search, paragraph, fast_grounding.FACTS_PER_PARAGRAPH)
+    assert results
+
+
+def bench_grounding_fact_check_page(measure):
+    # 生成からファクトチェック表示までを、Streamlitの1回の再実行として測る
+    def run():
+        at = AppTest.from_file(
+            os.path.join(ROOT, "groundingtest.py"), default_timeout=60
+        )
+        at.secrets["GEMINI_API_KEY"] = API_KEY
+        at.run()
+        at.button[0].click().run()
+        return at
+
+    at = measure(run)
+    assert not at.exception
+
+
+def _fact_check_app():
+    import streamlit as st
+
+    import fact_check
+
+    segments = [
+        f"文{i}では、調査によると業務時間が{i % 90}%削減されました。"
+        for i in range(500)
+    ]
+    response_json = {
+        "candidates": [
+            {
+                "groundingMetadata": {
+                    "groundingChunks": [
+                        {"web": {"uri": f"https://example.com/{i}", "title": f"ex{i}"}}
+                        for i in range(50)
+                    ],
+                    "groundingSupports": [
+                        {"segment": {"text": s}, "groundingChunkIndices": [i % 50]}
+                        for i, s in enumerate(segments)
+                    ],
+                }
+            }
+        ]
+    }
+    index = fact_check.build_index(response_json)
+    fact_check.render(index, "bench_fact_check", "\n\n".join(segments))
+    st.session_state["rendered"] = True
+
+
+def bench_fact_check_large_response(measure):
+    # 根拠500件・ソース50件のレスポンスを描画する
+    def run():
+        at = AppTest.from_function(_fact_check_app, default_timeout=60)
+        at.run()
+        return at
+
+    at = measure(run)
+    assert not at.exception
@@ -0,0 +1,19 @@
+import llm
+import patch_rewrite
+import prompts
+
+ARTICLE = "\n\n".join(
+    f"## 見出し{i}\n\nDXの取り組み{i}について説明します。" * 3 for i in range(1, 9)
+)
+INSTRUCTION = "もっとやさしい表現にしてください"
+
+
+def bench_rewrite_patch(measure, model):
+    result = measure(patch_rewrite.rewrite, model, ARTICLE, INSTRUCTION, False)
+    assert result["text"]
+
+
+def bench_rewrite_full(measure, model, placeholder):
+    prompt = prompts.build_rewrite_prompt(ARTICLE, INSTRUCTION)
+    text = measure(llm.stream_text, model, prompt, placeholder, use_cache=False)
+    assert text
@@ -0,0 +1,8 @@
+import title_generation
+
+KEYWORDS = "DX, 中小企業, 補助金"
+
+
+def bench_titles(measure, model):
+    titles = measure(title_generation.generate, model, KEYWORDS, use_cache=False)
+    assert len(titles) == title_generation.TITLE_COUNT
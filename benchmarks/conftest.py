@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# ネットワークを使わずに、ローカルの代替サーバーに対して各フローの所要時間を測る
+#
+#   python -m pytest benchmarks                          # 計測してbaseline.jsonと比較
+#   python -m pytest benchmarks --bench-update-baseline  # 現在の結果をbaselineとして保存
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import stub_server  # noqa: E402
+
+# 代替サーバーの応答速度（環境変数で調整できる）
+STUB_LATENCY = float(os.environ.get("LLMO_BENCH_LATENCY", "0.02"))
+STUB_TOKENS_PER_SECOND = float(os.environ.get("LLMO_BENCH_TOKENS_PER_SECOND", "5000"))
+
+# 各モジュールが接続先を読み込む前に、代替サーバーを起動して向き先を切り替える
+_server = stub_server.start(
+    config=stub_server.StubConfig(
+        latency=STUB_LATENCY, tokens_per_second=STUB_TOKENS_PER_SECOND, seed=0
+    )
+)
+os.environ["LLMO_GEMINI_ENDPOINT"] = stub_server.endpoint(_server)
+os.environ.setdefault("LLMO_CACHE_DIR", tempfile.mkdtemp(prefix="llmo-bench-"))
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "latest.json")
+
+API_KEY = "stub-api-key"
+ROUNDS = 15
+
+_results = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-update-baseline",
+        action="store_true",
+        help="今回の結果を benchmarks/baseline.json に保存する",
+    )
+    parser.addoption(
+        "--bench-tolerance",
+        type=float,
+        default=1.5,
+        help="baselineのp95に対して何倍までを許容するか",
+    )
+
+
+class Placeholder:
+    # st.empty() の代わりに、描画された文字列を捨てる
+    def markdown(self, text):
+        pass
+
+
+@pytest.fixture(scope="session")
+def api_key():
+    return API_KEY
+
+
+@pytest.fixture(scope="session")
+def model():
+    import google.generativeai as genai
+
+    import llm
+
+    llm.configure_sdk(genai, API_KEY)
+    return genai.GenerativeModel("models/gemini-2.5-flash-lite")
+
+
+@pytest.fixture
+def placeholder():
+    return Placeholder()
+
+
+@pytest.fixture
+def measure(benchmark, request):
+    # 1回ずつ実行した生の所要時間を集め、p50/p95を計算できるようにする
+    def run(fn, *args, **kwargs):
+        result = benchmark.pedantic(
+            fn, args=args, kwargs=kwargs, rounds=ROUNDS, iterations=1, warmup_rounds=1
+        )
+        _results[request.node.name] = sorted(benchmark.stats.stats.data)
+        return result
+
+    return run
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _summaries():
+    return {
+        name: {
+            "p50": round(_percentile(data, 0.5), 4),
+            "p95": round(_percentile(data, 0.95), 4),
+            "rounds": len(data),
+        }
+        for name, data in sorted(_results.items())
+    }
+
+
+def _regressions(summaries, baseline, tolerance):
+    regressions = []
+    for name, summary in summaries.items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base and summary["p95"] > base["p95"] * tolerance:
+            regressions.append((name, base["p95"], summary["p95"]))
+    return regressions
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not _results:
+        return
+    summaries = _summaries()
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    write = terminalreporter.write_line
+    terminalreporter.section("p50 / p95 wall time (seconds)")
+    write(f"{'benchmark':40} {'p50':>8} {'p95':>8} {'base p95':>9}")
+    for name, summary in summaries.items():
+        base = baseline.get("benchmarks", {}).get(name, {}).get("p95")
+        base_text = f"{base:9.4f}" if base is not None else f"{'-':>9}"
+        write(f"{name:40} {summary['p50']:8.4f} {summary['p95']:8.4f} {base_text}")
+
+    tolerance = config.getoption("--bench-tolerance")
+    for name, base, current in _regressions(summaries, baseline, tolerance):
+        write(
+            f"REGRESSION {name}: p95 {current:.4f}s > baseline {base:.4f}s x {tolerance}",
+            red=True,
+        )
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results:
+        return
+    summaries = _summaries()
+    report = {
+        "stub": {
+            "latency": STUB_LATENCY,
+            "tokens_per_second": STUB_TOKENS_PER_SECOND,
+        },
+        "benchmarks": summaries,
+    }
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if session.config.getoption("--bench-update-baseline"):
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        return
+
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        tolerance = session.config.getoption("--bench-tolerance")
+        if _regressions(summaries, baseline, tolerance) and exitstatus == 0:
+            session.exitstatus = 1
@@ -1,24 +1,401 @@
-import google.generativeai as genai
-import streamlit as st
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import grounding_client
+import llm
+import prompts
+import response_cache
+import router
+import title_generation
 
+# 利用できるモデルの一覧と、モデルごとの応答速度を確認するCLI
+#
+#   python check_models.py                      # モデル一覧（キャッシュがあればAPIを呼ばない）
+#   python check_models.py list --refresh       # 一覧を取り直してキャッシュを更新する
+#   python check_models.py probe --models gemini-2.5-flash-lite,gemini-2.5-flash \
+#       --steps titles,article --requests 10 --concurrency 2 --json probe.json
+#
+# probe はアプリと同じプロンプトを実際に送り、TTFT・出力速度・所要時間・エラー率を集計する
+# LLMO_GEMINI_ENDPOINT を設定すれば stub_server.py に対しても実行できる
 
-try:
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+MODEL_LIST_PATH = os.path.join(response_cache.CACHE_DIR, "models.json")
+MODEL_LIST_TTL_SECONDS = int(os.environ.get("LLMO_MODEL_LIST_TTL", str(24 * 60 * 60)))
 
+# probeで送るサンプルの入力
+SAMPLE_KEYWORDS = "業務効率化, SaaS, 中小企業"
+SAMPLE_SUMMARY = "手作業の多い中小企業が、SaaSで業務を効率化する方法を紹介する"
+SAMPLE_TITLE = "中小企業のための業務効率化入門：SaaSで手作業を減らす5つのステップ"
+SAMPLE_WORDCOUNT = 800
+SAMPLE_ARTICLE = (
+    "## 手作業が多いと何が起きるか\n"
+    "請求書の作成や勤怠の集計を手作業で続けると、担当者の残業が増え、入力ミスも起きやすくなります。\n\n"
+    "## SaaSで変わること\n"
+    "クラウド会計や勤怠管理のSaaSを使うと、入力した情報が自動で集計され、確認の手間が減ります。"
+)
 
-    print("利用可能なモデルの一覧を取得します...")
-    print("-" * 20)
+# probeの手順名と、呼び出しの種別・グラウンディングを使うか
+PROBE_STEPS = {
+    "titles": ("probe_titles", False),
+    "article": ("probe_article", False),
+    "grounding": ("probe_grounding", True),
+}
 
-    for model in genai.list_models():
+
+def _fetch_models(api_key):
+    session = grounding_client.get_session()
+    models = []
+    page_token = None
+    while True:
+        params = {"pageSize": 1000}
+        if page_token:
+            params["pageToken"] = page_token
+        response = session.get(
+            f"{grounding_client.API_BASE}/models",
+            headers={"x-goog-api-key": api_key},
+            params=params,
+            timeout=(grounding_client.CONNECT_TIMEOUT_SECONDS, 30),
+        )
+        response.raise_for_status()
+        body = response.json()
+        for model in body.get("models", []):
+            models.append(
+                {
+                    "name": model["name"].split("/")[-1],
+                    "display_name": model.get("displayName", ""),
+                    "methods": model.get("supportedGenerationMethods", []),
+                    "input_token_limit": model.get("inputTokenLimit"),
+                    "output_token_limit": model.get("outputTokenLimit"),
+                }
+            )
+        page_token = body.get("nextPageToken")
+        if not page_token:
+            return models
+
+
+def _read_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_models(
+    api_key, refresh=False, path=MODEL_LIST_PATH, ttl=MODEL_LIST_TTL_SECONDS
+):
+    # 一覧と各モデルの機能を、TTLの間はディスクのキャッシュから返す
+    # 取得に失敗した場合は、期限切れでもキャッシュがあればそれを返す
+    cached = _read_cache(path)
+    if (
+        not refresh
+        and cached is not None
+        and time.time() - cached["fetched_at"] < ttl
+        and cached.get("endpoint") == grounding_client.ENDPOINT
+    ):
+        return cached["models"]
+    try:
+        models = _fetch_models(api_key)
+    except Exception:
+        if cached is not None and cached.get("endpoint") == grounding_client.ENDPOINT:
+            return cached["models"]
+        raise
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "fetched_at": time.time(),
+                "endpoint": grounding_client.ENDPOINT,
+                "models": models,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    os.replace(tmp_path, path)
+    return models
+
+
+def validate_routes(api_key, routes=None):
+    # router.ROUTES に書かれたモデルが、一覧にあって generateContent に対応しているかを確かめる
+    # 問題のあるものを (種別, モデル, 理由) のリストで返す
+    routes = router.ROUTES if routes is None else routes
+    available = {model["name"]: model for model in load_models(api_key)}
+    problems = []
+    for kind, models in sorted(routes.items()):
+        for name in models:
+            model = available.get(name.split("/")[-1])
+            if model is None:
+                problems.append((kind, name, "利用できるモデルの一覧にありません"))
+            elif "generateContent" not in model["methods"]:
+                problems.append((kind, name, "generateContentに対応していません"))
+    return problems
+
+
+def build_probe_payload(step):
+    if step == "titles":
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompts.build_title_prompt(
+                                SAMPLE_KEYWORDS, SAMPLE_SUMMARY
+                            )
+                        }
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "responseMimeType": "application/json",
+                "responseSchema": title_generation.TITLE_SCHEMA,
+            },
+        }
+    if step == "article":
+        prompt = prompts.build_article_prompt(
+            SAMPLE_TITLE, SAMPLE_KEYWORDS, SAMPLE_WORDCOUNT, SAMPLE_SUMMARY, ""
+        )
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+    return grounding_client.build_grounding_payload(
+        prompts.build_grounding_prompt(SAMPLE_ARTICLE)
+    )
+
+
+class _NullPlaceholder:
+    def markdown(self, text):
+        pass
+
+
+def _probe_once(api_key, model, step):
+    # ストリーミングで送り、最初のチャンクまでの時間と全体の所要時間を測る
+    kind = PROBE_STEPS[step][0]
+    started = time.perf_counter()
+    try:
+        response = grounding_client.generate_content(
+            api_key, build_probe_payload(step), model=model, stream=True, kind=kind
+        )
+        response_json = llm.stream_rest_response(response, _NullPlaceholder())
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    duration = time.perf_counter() - started
+    call = response.telemetry_call
+    output_tokens = response_json.get("usageMetadata", {}).get(
+        "candidatesTokenCount", 0
+    )
+    generating = duration - (call.ttft or 0.0)
+    return {
+        "ok": True,
+        "ttft": call.ttft,
+        "duration": duration,
+        "output_tokens": output_tokens,
+        "tokens_per_second": output_tokens / generating if generating > 0 else None,
+    }
+
+
+def _percentile(values, q):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def summarize_probe(model, step, results):
+    ok = [r for r in results if r["ok"]]
+    return {
+        "model": model,
+        "step": step,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": _round((len(results) - len(ok)) / len(results)),
+        "ttft_p50": _round(_percentile([r["ttft"] for r in ok], 0.5)),
+        "ttft_p95": _round(_percentile([r["ttft"] for r in ok], 0.95)),
+        "latency_p50": _round(_percentile([r["duration"] for r in ok], 0.5)),
+        "latency_p95": _round(_percentile([r["duration"] for r in ok], 0.95)),
+        "tokens_per_second": _round(
+            _percentile([r["tokens_per_second"] for r in ok], 0.5)
+        ),
+        "output_tokens": _round(
+            sum(r["output_tokens"] for r in ok) / len(ok) if ok else None
+        ),
+        "sample_errors": sorted({r["error"] for r in results if not r["ok"]})[:3],
+    }
+
+
+def probe(api_key, models, steps, requests=5, concurrency=1):
+    rows = []
+    for model in models:
+        for step in steps:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(
+                    executor.map(
+                        lambda _: _probe_once(api_key, model, step), range(requests)
+                    )
+                )
+            rows.append(summarize_probe(model, step, results))
+            print(
+                f"  {model} / {step}: {rows[-1]['requests'] - rows[-1]['errors']}/{rows[-1]['requests']}件成功",
+                file=sys.stderr,
+            )
+    return rows
+
+
+PROBE_COLUMNS = [
+    ("model", "モデル"),
+    ("step", "手順"),
+    ("requests", "回数"),
+    ("error_rate", "エラー率"),
+    ("ttft_p50", "TTFT p50"),
+    ("ttft_p95", "TTFT p95"),
+    ("latency_p50", "p50(秒)"),
+    ("latency_p95", "p95(秒)"),
+    ("tokens_per_second", "tokens/秒"),
+    ("output_tokens", "出力トークン"),
+]
+
+
+def format_table(rows, columns):
+    header = [label for _, label in columns]
+    body = [
+        ["-" if row[key] is None else str(row[key]) for key, _ in columns]
+        for row in rows
+    ]
+    widths = [max(_width(cell) for cell in column) for column in zip(header, *body)]
+    lines = []
+    for cells in [header] + body:
+        lines.append(
+            "  ".join(
+                cell + " " * (width - _width(cell))
+                for cell, width in zip(cells, widths)
+            ).rstrip()
+        )
+    return "\n".join(lines)
+
+
+def _width(text):
+    # 全角文字は2桁として数える
+    return sum(1 if ord(ch) < 0x80 else 2 for ch in text)
+
+
+def _split(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    # batch.pyと同じく、環境変数 → .streamlit/secrets.toml の順にAPIキーを探す
+    from batch import load_api_key
+
+    parser = argparse.ArgumentParser(
+        description="利用できるモデルの一覧と、モデルごとの応答速度を確認します。"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    list_parser = subparsers.add_parser("list", help="モデル一覧を表示する")
+    list_parser.add_argument(
+        "--refresh", action="store_true", help="キャッシュを使わずに取得し直す"
+    )
+    list_parser.add_argument(
+        "--all", action="store_true", help="generateContent非対応のモデルも表示する"
+    )
+
+    probe_parser = subparsers.add_parser(
+        "probe", help="アプリのプロンプトでモデルごとの応答速度を測る"
+    )
+    probe_parser.add_argument(
+        "--models",
+        default=",".join(dict.fromkeys(m for ms in router.ROUTES.values() for m in ms)),
+        help="測るモデル（カンマ区切り、既定は router.ROUTES に含まれるすべて）",
+    )
+    probe_parser.add_argument(
+        "--steps",
+        default=",".join(PROBE_STEPS),
+        help=f"測る手順（カンマ区切り、{' / '.join(PROBE_STEPS)}）",
+    )
+    probe_parser.add_argument(
+        "-n", "--requests", type=int, default=5, help="手順ごとの呼び出し回数"
+    )
+    probe_parser.add_argument(
+        "-c", "--concurrency", type=int, default=1, help="同時に送る呼び出し数"
+    )
+    probe_parser.add_argument("--json", help="結果を書き出すJSONファイル")
+    args = parser.parse_args(argv)
+
+    api_key = load_api_key()
+
+    if args.command == "probe":
+        steps = _split(args.steps)
+        unknown = [step for step in steps if step not in PROBE_STEPS]
+        if unknown:
+            parser.error(f"不明な手順です: {', '.join(unknown)}")
+        models = _split(args.models)
+        print(
+            f"{len(models)}モデル × {len(steps)}手順を、各{args.requests}回"
+            f"（同時{args.concurrency}件）測ります...",
+            file=sys.stderr,
+        )
+        rows = probe(api_key, models, steps, args.requests, args.concurrency)
+        print(format_table(rows, PROBE_COLUMNS))
+        for row in rows:
+            for error in row["sample_errors"]:
+                print(f"[{row['model']} / {row['step']}] {error}", file=sys.stderr)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"endpoint": grounding_client.ENDPOINT, "results": rows},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+        return
+
+    try:
+        models = load_models(api_key, refresh=getattr(args, "refresh", False))
+    except Exception as e:
+        print("モデル一覧の取得中にエラーが発生しました。")
+        print(
+            "APIキーが有効か、またはGoogle CloudプロジェクトでGenerative Language APIが有効になっているか確認してください。"
+        )
+        print(e)
+        sys.exit(1)
+
+    if not getattr(args, "all", False):
         # generateContent（文章生成）が可能なモデルのみをフィルタリング
-        if 'generateContent' in model.supported_generation_methods:
-            print(model.name)
+        models = [m for m in models if "generateContent" in m["methods"]]
+    print(
+        format_table(
+            [
+                {
+                    "name": m["name"],
+                    "input": m["input_token_limit"],
+                    "output": m["output_token_limit"],
+                    "methods": ", ".join(m["methods"]),
+                }
+                for m in models
+            ],
+            [
+                ("name", "モデル"),
+                ("input", "入力上限"),
+                ("output", "出力上限"),
+                ("methods", "対応メソッド"),
+            ],
+        )
+    )
+    print(f"（キャッシュ: {MODEL_LIST_PATH}、有効期間 {MODEL_LIST_TTL_SECONDS}秒）")
+
+    problems = validate_routes(api_key)
+    for kind, name, reason in problems:
+        print(f"[注意] {kind} のモデル {name}: {reason}")
 
-    print("-" * 20)
-    print("上記のモデル名が、あなたのAPIキーで現在利用可能なモデルです。")
 
-except Exception as e:
-    print("モデル一覧の取得中にエラーが発生しました。")
-    print("APIキーが有効か、またはGoogle CloudプロジェクトでGenerative Language APIが有効になっているか確認してください。")
-    print(e)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
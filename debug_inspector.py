@@ -0,0 +1,100 @@
+import json
+import os
+
+import streamlit as st
+
+# session_stateの中身を確認するためのデバッグ表示
+# 既定では何も描画せず、URLに ?debug=1 を付けるか、環境変数 LLMO_DEBUG=1 のときだけ表示する
+# 一覧には名前・型・サイズと先頭部分だけを出し、値の全体は選んだ1件だけを送る
+
+PREVIEW_CHARS = 80
+
+
+def enabled():
+    if os.environ.get("LLMO_DEBUG", "") not in ("", "0"):
+        return True
+    return st.query_params.get("debug", "") in ("1", "true")
+
+
+def _serialize(value):
+    try:
+        return json.dumps(value, ensure_ascii=False, default=repr)
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def _format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def _preview(serialized):
+    text = " ".join(serialized.split())
+    if len(text) > PREVIEW_CHARS:
+        return text[:PREVIEW_CHARS] + "…"
+    return text
+
+
+def keep(name, value):
+    # デバッグ表示が有効なときだけ、その回限りの値（APIレスポンスなど）を後から確認できるよう残す
+    if enabled():
+        st.session_state[f"debug_{name}"] = value
+
+
+def show(key="debug_inspector"):
+    if not enabled():
+        return
+
+    st.divider()
+    st.header("デバッグ情報")
+
+    selected_key = f"{key}_selected"
+    rows = []
+    sizes = {}
+    for name in sorted(str(k) for k in st.session_state.keys()):
+        if name in (selected_key, f"{key}_select"):
+            continue
+        value = st.session_state[name]
+        serialized = _serialize(value)
+        sizes[name] = len(serialized.encode("utf-8"))
+        rows.append(
+            {
+                "キー": name,
+                "型": type(value).__name__,
+                "サイズ": _format_size(sizes[name]),
+                "内容（先頭）": _preview(serialized),
+            }
+        )
+    st.caption(
+        f"`st.session_state`: {len(rows)}件、合計 {_format_size(sum(sizes.values()))}"
+    )
+    st.dataframe(rows, hide_index=True)
+
+    # キーの一覧は再実行のたびに変わりうるため、選択は別に覚えておいて選択肢が変わっても保つ
+    options = [None] + [row["キー"] for row in rows]
+    widget_key = f"{key}_select"
+
+    def remember():
+        st.session_state[selected_key] = st.session_state[widget_key]
+
+    selected = st.session_state.get(selected_key)
+    name = st.selectbox(
+        "全体を表示するキー",
+        options,
+        index=options.index(selected) if selected in options else 0,
+        format_func=lambda n: "（選択しない）" if n is None else n,
+        key=widget_key,
+        on_change=remember,
+    )
+    if name is None or name not in st.session_state:
+        return
+    value = st.session_state[name]
+    if isinstance(value, (dict, list)):
+        st.json(value)
+    elif isinstance(value, str):
+        st.code(value, language=None, wrap_lines=True)
+    else:
+        st.code(_serialize(value), language=None, wrap_lines=True)
@@ -1,28 +1,328 @@
+import datetime
+
 import streamlit as st
-import google.generativeai as genai
-import requests
-import json
+
+import article_store
+import debug_inspector
+import fact_check
+import fact_store
+import fast_grounding
+import gemini_client
+import grounding_jobs
+import incremental_grounding
+import llm
+import llmo_validator
+import patch_rewrite
+import preview
+import prompts
+import scheduler
+import session_owner
+
+
+def _open_article(article_id):
+    # セッションには記事IDと版番号（ハンドル）と作業中の本文だけを持たせる
+    revision, text = article_store.get_store().head(article_id)
+    st.session_state["article_id"] = article_id
+    st.session_state["article_revision"] = revision
+    st.session_state["article_text"] = text
+    st.session_state.pop("pending_rewrite", None)
+    # 別の記事に対するグラウンディングは、結果を待たずに取り消す
+    grounding_jobs.discard(st.session_state.pop("grounding_job_id", None))
+
+
+def _commit(text, origin, params=None, grounding=None):
+    # 本文を新しい版として保存し、作業中の本文をその版に合わせる
+    revision = article_store.get_store().commit(
+        st.session_state["article_id"], text, origin, params, grounding
+    )
+    st.session_state["article_revision"] = revision
+    st.session_state["article_text"] = text
+
+
+def _save_manual_edit():
+    # 手動編集の内容は、AIによる調整やグラウンディングの前に版として残しておく
+    _, head_text = article_store.get_store().head(st.session_state["article_id"])
+    if st.session_state["article_text"] != head_text:
+        _commit(st.session_state["article_text"], "manual")
+
+
+@st.fragment
+def _editor_and_preview():
+    # 編集エリアとプレビューだけを再実行の単位にし、入力のたびに両タブ全体を再実行しないようにする
+    # 画面を左右2つのカラムに分割
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("**編集エリア（Markdown記法）**")
+        edited_text = st.text_area(
+            "ここで自由に編集できます:",
+            value=st.session_state["article_text"],
+            height=600,
+            label_visibility="collapsed",
+        )
+        if edited_text != st.session_state["article_text"]:
+            st.session_state["article_text"] = edited_text
+
+        _, head_text = article_store.get_store().head(st.session_state["article_id"])
+        if edited_text != head_text:
+            st.caption("保存されていない編集があります。")
+            if st.button("編集内容を保存する", key="save_manual_edit"):
+                _commit(edited_text, "manual")
+                st.rerun()
+
+    with col2:
+        st.write("**リアルタイムプレビュー**")
+        # 長い記事では、ボタンを押したときだけプレビューを更新するのを既定にする
+        st.session_state.setdefault(
+            "preview_manual", len(edited_text) >= preview.MANUAL_PREVIEW_THRESHOLD
+        )
+        manual = st.checkbox("プレビューを手動で更新する", key="preview_manual")
+        collapsed = st.checkbox("見出しごとに折りたたむ", key="preview_collapsed")
+
+        preview_text = edited_text
+        if manual:
+            if (
+                st.button("プレビューを更新", key="preview_refresh")
+                or "preview_text" not in st.session_state
+            ):
+                st.session_state["preview_text"] = edited_text
+            preview_text = st.session_state["preview_text"]
+            if preview_text != edited_text:
+                st.caption("編集中の内容はまだプレビューに反映されていません。")
+
+        # 編集エリアのテキストを、見出しごとのセクションに分けてMarkdownとして表示
+        preview.render(preview_text, "edit_preview", collapsed)
+
+
+@st.fragment
+def _revision_history():
+    # 版の一覧・2つの版の差分・過去の版への復元
+    store = article_store.get_store()
+    article_id = st.session_state["article_id"]
+    revisions = store.revisions(article_id)
+    st.dataframe(
+        [
+            {
+                "版": r["number"],
+                "種類": article_store.ORIGIN_LABELS.get(r["origin"], r["origin"]),
+                "日時": datetime.datetime.fromtimestamp(r["created_at"]).strftime(
+                    "%m/%d %H:%M:%S"
+                ),
+                "文字数（バイト）": r["size"],
+                "保存サイズ（バイト）": r["stored_size"],
+                "根拠あり": "✓" if r["grounded"] else "",
+                "指示": r["params"].get("instruction", ""),
+            }
+            for r in reversed(revisions)
+        ],
+        hide_index=True,
+    )
+
+    numbers = [r["number"] for r in revisions]
+    if len(numbers) < 2:
+        return
+    before_col, after_col = st.columns(2)
+    with before_col:
+        before = st.selectbox(
+            "比較元の版", numbers, index=len(numbers) - 2, key="history_before"
+        )
+    with after_col:
+        after = st.selectbox(
+            "比較先の版", numbers, index=len(numbers) - 1, key="history_after"
+        )
+    diff = store.diff(article_id, before, after)
+    st.code(diff or "（変更はありません）", language="diff")
+
+    # 復元は新しい版として積むため、復元前の版にもいつでも戻せる
+    if before != numbers[-1] and st.button(f"版{before}の内容に戻す"):
+        _save_manual_edit()
+        store.revert(article_id, before)
+        _open_article(article_id)
+        st.rerun()
+
+
+def _submit_grounding(api_key, incremental, grounded_paragraphs):
+    job = grounding_jobs.submit(
+        api_key,
+        st.session_state["article_id"],
+        st.session_state["article_revision"],
+        st.session_state["article_text"],
+        incremental,
+        grounded_paragraphs,
+        fast=st.session_state.get("fast_grounding", False),
+    )
+    st.session_state["grounding_job_id"] = job.id
+
+
+def _apply_grounding(job):
+    # 段落ごとの根拠とファクトチェック表示用の索引は、版と一緒に一度だけ保存する
+    _commit(
+        job.text,
+        "grounding",
+        {
+            "model": job.model,
+            "mode": job.mode,
+            "incremental": job.mode == grounding_jobs.INCREMENTAL,
+            "facts": job.fact_count,
+            "base_revision": job.base_revision,
+        },
+        {
+            "paragraphs": job.paragraphs,
+            "fact_check_index": fact_check.build_index(job.response_json),
+        },
+    )
+    # APIレスポンス全体は、デバッグ表示が有効なときだけ残しておく
+    debug_inspector.keep("grounding_response", job.response_json)
+    grounding_jobs.discard(st.session_state.pop("grounding_job_id"))
+
+
+@st.fragment(run_every=1.0)
+def _grounding_job_status():
+    # 実行中のジョブの状態だけを定期的に更新する（編集エリアなど他の部分は再実行しない）
+    job = grounding_jobs.get(st.session_state.get("grounding_job_id"))
+    if job is None or not job.active:
+        # 結果の反映や失敗の表示は、アプリ全体の再実行で行う
+        st.rerun()
+    if job.status == grounding_jobs.QUEUED:
+        st.info(
+            f"グラウンディングの順番待ちをしています（{job.elapsed():.0f}秒経過）。待っている間も編集を続けられます。"
+        )
+    elif job.mode == grounding_jobs.FAST:
+        st.info(
+            f"保存済みの事実（{job.fact_count}件）を組み込んでいます（{job.elapsed():.0f}秒経過、{len(job.partial_text)}文字受信）。待っている間も編集を続けられます。"
+        )
+    else:
+        if job.fast and job.recall is not None:
+            st.caption(
+                f"保存済みの事実が見つかった段落が{job.recall:.0%}だったため、Google検索を使います。"
+            )
+        if job.mode == grounding_jobs.INCREMENTAL:
+            # 差分グラウンディングは段落のまとまりごとに結果が届くため、終わったまとまりの数を表示する
+            progress = f"変更された段落のまとまり {job.runs_done}/{job.runs_total or '-'} 件完了"
+        else:
+            progress = f"{len(job.partial_text)}文字受信"
+        st.info(
+            f"Google検索を参照して回答を生成中です（{job.elapsed():.0f}秒経過、{progress}）。待っている間も編集を続けられます。"
+        )
+    if st.button("グラウンディングを取り消す", key="cancel_grounding"):
+        job.cancel()
+        st.rerun()
+
+
+def _grounding_merge(job, api_key, incremental, grounded_paragraphs):
+    # 実行中に記事が編集・更新された場合は、差分を確認してから反映する
+    st.info(
+        f"グラウンディングの結果が届きました（版{job.base_revision}の本文に対する結果、{job.elapsed():.0f}秒）。"
+    )
+    st.warning(
+        "グラウンディングの実行中に記事が編集されています。反映すると、その後の編集は上書きされます（編集内容は版として残ります）。"
+    )
+    diff = patch_rewrite.unified_diff(st.session_state["article_text"], job.text)
+    st.code(diff or "（変更はありません）", language="diff")
+
+    apply_col, retry_col, discard_col = st.columns(3)
+    with apply_col:
+        if st.button("グラウンディング結果を反映する", type="primary"):
+            _save_manual_edit()
+            _apply_grounding(job)
+            st.rerun()
+    with retry_col:
+        if st.button("現在の本文でやり直す"):
+            grounding_jobs.discard(st.session_state.pop("grounding_job_id"))
+            _save_manual_edit()
+            _submit_grounding(api_key, incremental, grounded_paragraphs)
+            st.rerun()
+    with discard_col:
+        if st.button("グラウンディング結果を破棄する"):
+            grounding_jobs.discard(st.session_state.pop("grounding_job_id"))
+            st.rerun()
+
+
+def _grounding_job_failed(job):
+    if job.status == grounding_jobs.CANCELLED:
+        st.info("グラウンディングを取り消しました。")
+    else:
+        import requests
+
+        http_err = job.error
+        if isinstance(http_err, requests.exceptions.HTTPError):
+            st.error(f"HTTPエラーが発生しました: {http_err}")
+
+            st.error(f"レスポンス内容: {http_err.response.text}")
+        else:
+            st.error(f"予期せぬエラーが発生しました: {job.error}")
+    grounding_jobs.discard(st.session_state.pop("grounding_job_id"))
+
+
+def _generation_params():
+    # 記事生成のときのタイトルやキーワード（最初の版のパラメータ）
+    revisions = article_store.get_store().revisions(st.session_state["article_id"])
+    return revisions[0]["params"] if revisions else {}
+
+
+def _llmo_check(model):
+    params = _generation_params()
+    keywords = [k.strip() for k in params.get("keywords", "").split(",")]
+    checks = llmo_validator.validate(st.session_state["article_text"], keywords)
+    llmo_validator.render(checks, "edit_llmo_checks")
+    failed = llmo_validator.failing(checks)
+    if not failed:
+        return
+    # 満たしていない要件のあるセクションだけをモデルに直させ、記事全体は書き直さない
+    if st.button("満たしていないセクションだけをAIで修正する", key="llmo_repair"):
+        _save_manual_edit()
+        with st.spinner("AIがセクションを修正中です..."), scheduler.queue_status():
+            try:
+                # セクションはワーカースレッドで修正するため、モデルはここで解決しておく
+                new_text, locations = llmo_validator.repair(
+                    gemini_client.get_model(model.model_name),
+                    st.session_state["article_text"],
+                    checks,
+                    title=params.get("title", ""),
+                )
+                _commit(
+                    new_text,
+                    "repair",
+                    {
+                        "model": model.model_name,
+                        "rules": sorted({check["rule"] for check in failed}),
+                        "sections": locations,
+                    },
+                )
+                st.rerun()
+            except Exception as e:
+                st.error("セクションの修正中にエラーが発生しました。")
+                st.exception(e)
 
 
 def show():
-    if not st.session_state.article_text:
+    if "article_id" not in st.session_state:
         st.info(
             "まだ記事が生成されていません。まずは「記事生成」タブで記事を生成してください。"
         )
+        # このユーザーが保存した記事があれば、続きから編集できるようにする
+        saved = article_store.get_store().articles(session_owner.current())
+        if saved:
+            labels = {
+                article["id"]: f"{article['title']}（版{article['head']}）"
+                for article in saved
+            }
+            article_id = st.selectbox(
+                "保存済みの記事を開く",
+                list(labels),
+                format_func=labels.get,
+                key="open_article_id",
+            )
+            if st.button("この記事を開く"):
+                _open_article(article_id)
+                st.rerun()
         st.stop()
     try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        model = genai.GenerativeModel("models/gemini-2.5-flash-lite")
+        api_key = gemini_client.get_api_key()
+        # SDKの読み込みとモデル生成は、最初にAI調整ボタンが押されるまで遅らせる
+        model = gemini_client.LazyModel()
 
     except Exception as e:
-        st.error(
-            "APIキーの設定に失敗しました。`.streamlit/secrets.toml`ファイルを確認してください。"
-        )
-        st.stop()
-    try:
-        api_key = st.secrets["GEMINI_API_KEY"]
-
-    except FileNotFoundError:
         # ローカル環境などで .streamlit/secrets.toml がない場合のエラーハンドリング
         st.error(
             "APIキーが見つかりません。.streamlit/secrets.toml を設定してください。"
@@ -30,134 +330,68 @@ def show():
         st.stop()
 
     # --- Streamlit UI ---
-    grounding_prompt = f"""
-    # 命令
-    あなたは、非常に優秀なプロの編集者兼リサーチャーです。
-    以下の「元の文章」の主張の信頼性を高めるため、**Google検索ツールを自律的に使用し、発見した客観的な統計データや事例を引用**してください。
-    引用した場合は、必ず、検索で発見した実在する情報源を明記または示唆してください。例えば、「example.comによると、...」のような形で記述してください。 
-    URLを創作してはいけません。
-    なお、余計な文章（「承知しました」など）は一切含めないこと。
-
-    # 元の文章
-    ---
-    {st.session_state["article_text"]}
-    """
-
-    if st.button("信頼性のある情報を組み込む"):
-        with st.spinner("Google検索を参照して回答を生成中..."):
-            # モデルのエンドポイントURL
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent?key={api_key}"
-
-            # APIに送信するデータ（ペイロード）
-            payload = {
-                "contents": [{"parts": [{"text": grounding_prompt}]}],
-                "tools": [{"googleSearch": {}}],
-            }
-
-            headers = {"Content-Type": "application/json"}
-
-            try:
-                response = requests.post(url, headers=headers, data=json.dumps(payload))
-
-                response.raise_for_status()  # HTTPエラーがあれば例外を発生させる
-
-                response_json = response.json()
-
-                generated_text = response_json["candidates"][0]["content"]["parts"][0][
-                    "text"
-                ]
-
-                st.markdown(generated_text)
-                st.session_state["article_text"] = generated_text
-
-            except requests.exceptions.HTTPError as http_err:
-                st.error(f"HTTPエラーが発生しました: {http_err}")
-
-                st.error(f"レスポンス内容: {response.text}")
-
-            except Exception as e:
-                st.error(f"予期せぬエラーが発生しました: {e}")
-
-            # --- デバッグ情報 ---
-            st.header("デバッグ情報")
-            with st.expander("APIレスンスのJSON全体を表示"):
-                st.json(response_json)
-
-            # --- グラウンディング詳細 ---
-            grounding_meta = response_json.get("candidates", [{}])[0].get(
-                "groundingMetadata", {}
+    # 最後にグラウンディングした版の段落と比べ、変更された段落だけを再グラウンディングできるようにする
+    _, grounding = article_store.get_store().latest_grounding(
+        st.session_state["article_id"]
+    )
+    grounded_paragraphs = grounding["paragraphs"] if grounding else []
+    incremental = False
+    up_to_date = False
+    if grounded_paragraphs:
+        items, runs = incremental_grounding.plan(
+            st.session_state["article_text"], grounded_paragraphs
+        )
+        changed = sum(len(run) for run in runs)
+        st.caption(f"前回のグラウンディングから変更された段落: {changed}/{len(items)}")
+        # 変更がなければ、グラウンディングし直す段落はない
+        up_to_date = changed == 0
+        # すべての段落が変わっている場合は、通常どおり記事全体をグラウンディングする
+        if 0 < changed < len(items):
+            incremental = st.checkbox(
+                "変更された段落のみ再グラウンディングする",
+                value=True,
+                key="incremental_grounding",
             )
 
-            if grounding_meta:  # groundingMetadataが存在する場合のみ表示
-                with st.expander("グラウンディング詳細（検索クエリと参照ソース）"):
-                    # 検索クエリの表示
-                    st.subheader("🤖 AIが実行した検索クエリ")
-                    search_queries = grounding_meta.get("webSearchQueries", [])
-                    if search_queries:
-                        for query in search_queries:
-                            st.info(query)
-                    else:
-                        st.write("検索クエリはありませんでした。")
-
-                    st.markdown("---")
-
-                    # 使用したソースの一覧表示
-                    st.subheader("📚 参照したWebソース一覧")
-                    grounding_chunks = grounding_meta.get("groundingChunks", [])
-                    if grounding_chunks:
-                        for i, chunk in enumerate(grounding_chunks):
-                            title = chunk.get("web", {}).get("title", "タイトル不明")
-                            uri = chunk.get("web", {}).get("uri", "#")
-                            # Markdownを使い、タイトルをクリック可能なリンクにする
-                            st.markdown(f"{i + 1}. **{title}** - [リンク]({uri})")
-                    else:
-                        st.write("参照ソースはありませんでした。")
-
-            # --- ファクトチェック表示 ---
-            st.header("ファクトチェック表示")
-            st.caption("AIが生成した各文章とその根拠となったソース")
-
-            grounding_supports = grounding_meta.get("groundingSupports", [])
-            grounding_chunks = grounding_meta.get("groundingChunks", [])
-
-            if not grounding_supports:
-                st.warning(
-                    "根拠情報(groundingSupports)がレスポンスに含まれていませんでした。"
-                )
-            else:
-                # 取得した情報をループで表示
-                for gs in grounding_supports:
-                    # st.container(border=True) で各情報をカード化する
-                    with st.container(border=True):
-                        # 1. AIが生成した文章部分
-                        text_segment = gs.get("segment", {}).get(
-                            "text", "テキストが取得できませんでした。"
-                        )
-                        st.markdown(text_segment.strip())
-
-                        st.markdown("---")  # 水平線で区切る
-
-                        # 2. その文章の裏付けとなったソース
-                        st.caption("ソース")
-
-                        indices = gs.get("groundingChunkIndices", [])
-                        if not indices:
-                            st.write("この文章に対応するソースはありませんでした。")
-                        else:
-                            for gci in indices:
-                                if gci < len(grounding_chunks):
-                                    source_chunk = grounding_chunks[gci]
-                                    # ...
-                                else:
-                                    st.warning(f"インデックス {gci} は範囲外です")
-                                # grounding_chunksリストから該当するソース情報を取得
-                                # st.info(f"アクセスしようとしているインデックス `gci`: `{gci}`")
-                                title = source_chunk.get("web", {}).get(
-                                    "title", "タイトル不明"
-                                )
-                                uri = source_chunk.get("web", {}).get("uri", "#")
-                                # アイコンを付けて分かりやすく表示
-                                st.markdown(f"🔗 **{title}** - [ソースへ]({uri})")
+    # 過去のグラウンディングで保存した事実で足りる記事は、Google検索をせずに軽いモデルで組み込む
+    fact_count = fact_store.get_store().count()
+    if fact_count and st.checkbox(
+        "保存済みの事実で高速にグラウンディングする（足りない場合はGoogle検索を使う）",
+        value=True,
+        key="fast_grounding",
+    ):
+        _, recall = fast_grounding.retrieve(st.session_state["article_text"])
+        st.caption(
+            f"保存済みの事実: {fact_count}件　関係する事実が見つかった段落: {recall:.0%}"
+            f"（{fast_grounding.MIN_RECALL:.0%}以上でGoogle検索を省略）"
+        )
+
+    # グラウンディングはバックグラウンドのジョブとして実行し、その間も編集を続けられるようにする
+    job = grounding_jobs.get(st.session_state.get("grounding_job_id"))
+    if job is not None and job.active:
+        _grounding_job_status()
+    elif job is not None and job.status == grounding_jobs.DONE:
+        if (
+            job.base_text == st.session_state["article_text"]
+            and job.base_revision == st.session_state["article_revision"]
+        ):
+            # 実行中に記事が変わっていなければ、そのまま版として反映する
+            _apply_grounding(job)
+            st.rerun()
+        else:
+            _grounding_merge(job, api_key, incremental, grounded_paragraphs)
+    elif job is not None:
+        _grounding_job_failed(job)
+    elif st.button(
+        "信頼性のある情報を組み込む",
+        disabled=up_to_date,
+        help="前回のグラウンディングから変更された段落がありません。"
+        if up_to_date
+        else None,
+    ):
+        _save_manual_edit()
+        _submit_grounding(api_key, incremental, grounded_paragraphs)
+        st.rerun()
 
         # if st.button("信頼性のある情報を組み込む"):
         #     # ツール利用に適した高性能モデルを選択
@@ -194,25 +428,23 @@ def show():
         #             st.error("記事の調整中にエラーが発生しました。")
         #             st.exception(e)
 
+    # 直近のグラウンディング結果（ページ切り替えなどの再実行でも表示を保つ）
+    grounded_revision, grounding = article_store.get_store().latest_grounding(
+        st.session_state["article_id"]
+    )
+    if grounding is not None:
+        st.caption(f"版{grounded_revision}のグラウンディング結果")
+        fact_check.render(
+            grounding["fact_check_index"],
+            "edit_fact_check",
+            st.session_state["article_text"],
+        )
+
     if "article_text" in st.session_state:
-        # 画面を左右2つのカラムに分割
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.write("**編集エリア（Markdown記法）**")
-            edited_text = st.text_area(
-                "ここで自由に編集できます:",
-                value=st.session_state["article_text"],
-                height=600,
-                label_visibility="collapsed",
-            )
-            if edited_text != st.session_state["article_text"]:
-                st.session_state["article_text"] = edited_text
+        _editor_and_preview()
 
-        with col2:
-            st.write("**リアルタイムプレビュー**")
-            # 編集エリアのテキスト(edited_text)を、リアルタイムでMarkdownとして表示
-            st.markdown(edited_text)
+        with st.expander("LLMO要件のチェック"):
+            _llmo_check(model)
 
         st.write("---")
 
@@ -222,45 +454,118 @@ def show():
             "調整の指示を入力してください（例：もっとフレンドリーな口調にして、絵文字も使って）"
         )
 
+        rewrite_use_cache = not st.checkbox(
+            "キャッシュを使わずに調整する", key="rewrite_bypass_cache"
+        )
+
+        # 変更が必要な段落だけを修正させ、差分を確認してから反映する
+        patch_mode = st.checkbox(
+            "変更が必要な箇所だけを修正する（差分を確認してから反映）",
+            value=True,
+            key="patch_rewrite_enabled",
+        )
+
         if st.button("AIで調整する"):
             if not rewrite_instruction:
                 st.warning("調整の指示を入力してください。")
+            elif patch_mode:
+                _save_manual_edit()
+                with (
+                    st.spinner("AIが修正箇所を検討中です..."),
+                    scheduler.queue_status(),
+                ):
+                    try:
+                        result = patch_rewrite.rewrite(
+                            model,
+                            st.session_state["article_text"],
+                            rewrite_instruction,
+                            use_cache=rewrite_use_cache,
+                        )
+                        result["base"] = st.session_state["article_text"]
+                        result["instruction"] = rewrite_instruction
+                        st.session_state["pending_rewrite"] = result
+                    except Exception as e:
+                        st.error("記事の調整中にエラーが発生しました。")
+                        st.exception(e)
             else:
-                with st.spinner("AIが記事を調整中です..."):
-                    rewrite_prompt = f"""
-                    # 命令
-                    あなたは、非常に優秀なプロの編集者です。
-                    以下の「元の文章」を、「編集指示」に従って、より質の高い文章に修正・再構成してください。
-                    元の文章の良い点は活かしつつ、指示に忠実に従ってください。
-                    なお、余計な文章は一切含めないこと。
-
-                    # 元の文章
-                    ---
-                    {edited_text} 
-                    ---
-
-                    # 編集指示
-                    ---
-                    {rewrite_instruction}
-                    ---
-
-                    # 修正後の文章
-                    """
+                _save_manual_edit()
+                with st.spinner("AIが記事を調整中です..."), scheduler.queue_status():
+                    rewrite_prompt = prompts.build_rewrite_prompt(
+                        st.session_state["article_text"], rewrite_instruction
+                    )
 
                     try:
-                        response = model.generate_content(rewrite_prompt)
-                        st.session_state["article_text"] = response.text
-                        st.session_state["text_for_editing"] = response.text
+                        rewrite_placeholder = st.empty()
+                        rewritten_text = llm.stream_text(
+                            model,
+                            rewrite_prompt,
+                            rewrite_placeholder,
+                            use_cache=rewrite_use_cache,
+                            kind="rewrite",
+                        )
+                        _commit(
+                            rewritten_text,
+                            "rewrite",
+                            {
+                                "model": model.model_name,
+                                "instruction": rewrite_instruction,
+                                "mode": "full",
+                            },
+                        )
                         st.rerun()
                     except Exception as e:
                         st.error("記事の調整中にエラーが発生しました。")
                         st.exception(e)
 
+        # --- 修正案の確認 ---
+        pending = st.session_state.get("pending_rewrite")
+        if pending:
+            if pending["mode"] == "patch":
+                changed = "、".join(str(i) for i in pending["changed_paragraphs"])
+                st.info(
+                    f"段落 {changed} の修正案です。差分を確認して反映してください。"
+                )
+            else:
+                st.info(
+                    "修正箇所を特定できなかったため、全文を書き直した修正案です。差分を確認して反映してください。"
+                )
+            if pending["base"] != st.session_state["article_text"]:
+                st.warning(
+                    "修正案の作成後に記事が編集されています。反映すると、その後の編集は上書きされます。"
+                )
+            diff = patch_rewrite.unified_diff(
+                st.session_state["article_text"], pending["text"]
+            )
+            st.code(diff or "（変更はありません）", language="diff")
+
+            apply_col, discard_col = st.columns(2)
+            with apply_col:
+                if st.button("この修正を反映する", type="primary"):
+                    # 修正案の作成後の手動編集も、上書きする前に版として残す
+                    _save_manual_edit()
+                    _commit(
+                        pending["text"],
+                        "rewrite",
+                        {
+                            "model": model.model_name,
+                            "instruction": pending["instruction"],
+                            "mode": pending["mode"],
+                            "changed_paragraphs": pending["changed_paragraphs"],
+                        },
+                    )
+                    del st.session_state["pending_rewrite"]
+                    st.rerun()
+            with discard_col:
+                if st.button("修正案を破棄する"):
+                    del st.session_state["pending_rewrite"]
+                    st.rerun()
+
+        with st.expander("版の履歴"):
+            _revision_history()
+
         # コピー用コードブロック(冗長なのでコメントアウト中)
         # st.write("📋 下の枠からワンクリックでコピーできます：")
         # st.code(st.session_state["article_text"], language=None)
 
-    st.divider()
-    st.header("デバッグ情報")
-    st.write("現在の`st.session_state`の中身:")
-    st.json(st.session_state)
+    # ?debug=1 などで有効にしたときだけ、session_stateの一覧を表示する
+    debug_inspector.show("edit_debug")
@@ -0,0 +1,161 @@
+import math
+
+import streamlit as st
+
+# グラウンディング結果のファクトチェック表示
+# groundingSupports / groundingChunks から一度だけ索引を作ってsession_stateに持ち、
+# 描画は1ページ分をまとめたMarkdownで行う（根拠1件ごとに要素を作らない）
+
+PAGE_SIZE = 20
+
+
+def build_index(response_json):
+    candidate = response_json.get("candidates", [{}])[0]
+    meta = candidate.get("groundingMetadata", {})
+    raw_chunks = meta.get("groundingChunks", [])
+
+    chunks = [
+        {
+            "title": chunk.get("web", {}).get("title", "タイトル不明"),
+            "uri": chunk.get("web", {}).get("uri", "#"),
+            "segments": [],
+        }
+        for chunk in raw_chunks
+    ]
+
+    # 同じ文章に対する根拠は1つにまとめる
+    segments = []
+    segment_positions = {}
+    invalid_indices = 0
+    for support in meta.get("groundingSupports", []):
+        text = support.get("segment", {}).get("text", "").strip()
+        if not text:
+            continue
+        position = segment_positions.get(text)
+        if position is None:
+            position = len(segments)
+            segment_positions[text] = position
+            segments.append({"text": text, "chunks": []})
+        segment = segments[position]
+
+        for gci in support.get("groundingChunkIndices", []):
+            # 範囲外のインデックスは、直前のソースで代用せずに件数だけ数える
+            if not isinstance(gci, int) or not 0 <= gci < len(chunks):
+                invalid_indices += 1
+                continue
+            if gci not in segment["chunks"]:
+                segment["chunks"].append(gci)
+            if position not in chunks[gci]["segments"]:
+                chunks[gci]["segments"].append(position)
+
+    return {
+        "queries": meta.get("webSearchQueries", []),
+        "chunks": chunks,
+        "segments": segments,
+        "invalid_indices": invalid_indices,
+    }
+
+
+def _citation(index, chunk_index):
+    chunk = index["chunks"][chunk_index]
+    return f"[[{chunk_index + 1}]]({chunk['uri']})"
+
+
+def annotate(text, index):
+    # 記事本文の各根拠付き文章の直後に、ソース番号へのリンクを挿入する
+    insertions = []
+    search_from = 0
+    for segment in index["segments"]:
+        if not segment["chunks"]:
+            continue
+        position = text.find(segment["text"], search_from)
+        if position < 0:
+            position = text.find(segment["text"])
+        if position < 0:
+            continue
+        end = position + len(segment["text"])
+        markers = "".join(_citation(index, gci) for gci in segment["chunks"])
+        insertions.append((end, markers))
+        search_from = end
+
+    pieces = []
+    last = 0
+    for end, markers in sorted(insertions):
+        pieces.append(text[last:end])
+        pieces.append(markers)
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+def _quote(text):
+    return "\n".join(f"> {line}" if line else ">" for line in text.splitlines())
+
+
+def _segments_markdown(index, segments, start):
+    blocks = []
+    for number, segment in enumerate(segments, start=start + 1):
+        if segment["chunks"]:
+            sources = "\n".join(
+                f"- 🔗 [{gci + 1}] **{index['chunks'][gci]['title']}** - [ソースへ]({index['chunks'][gci]['uri']})"
+                for gci in segment["chunks"]
+            )
+        else:
+            sources = "- この文章に対応するソースはありませんでした。"
+        blocks.append(f"**{number}.**\n\n{_quote(segment['text'])}\n\n{sources}")
+    return "\n\n---\n\n".join(blocks)
+
+
+def render(index, key, article_text=None):
+    if index["queries"] or index["chunks"]:
+        with st.expander("グラウンディング詳細（検索クエリと参照ソース）"):
+            st.subheader("🤖 AIが実行した検索クエリ")
+            if index["queries"]:
+                st.markdown("\n".join(f"- {query}" for query in index["queries"]))
+            else:
+                st.write("検索クエリはありませんでした。")
+
+            st.subheader("📚 参照したWebソース一覧")
+            if index["chunks"]:
+                st.markdown(
+                    "\n".join(
+                        f"{i + 1}. **{chunk['title']}** - [リンク]({chunk['uri']})"
+                        f"（根拠 {len(chunk['segments'])}件）"
+                        for i, chunk in enumerate(index["chunks"])
+                    )
+                )
+            else:
+                st.write("参照ソースはありませんでした。")
+
+    if article_text is not None and index["segments"]:
+        with st.expander("引用番号付きの記事"):
+            st.markdown(annotate(article_text, index))
+
+    st.header("ファクトチェック表示")
+    st.caption("AIが生成した各文章とその根拠となったソース")
+
+    segments = index["segments"]
+    if not segments:
+        st.warning("根拠情報(groundingSupports)がレスポンスに含まれていませんでした。")
+        return
+    if index["invalid_indices"]:
+        st.warning(
+            f"範囲外のソース番号が{index['invalid_indices']}件あったため、表示から除外しました。"
+        )
+
+    pages = math.ceil(len(segments) / PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(
+            f"ページ（全{pages}ページ）",
+            min_value=1,
+            max_value=pages,
+            value=1,
+            step=1,
+            key=f"{key}_page",
+        )
+    start = (page - 1) * PAGE_SIZE
+    shown = segments[start : start + PAGE_SIZE]
+    st.caption(f"全{len(segments)}件中 {start + 1}〜{start + len(shown)}件")
+    with st.container(border=True):
+        st.markdown(_segments_markdown(index, shown, start))
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+import article_store
+
+# 過去のグラウンディング結果から集めた「出典付きの事実」のローカルストア
+# groundingSupportsの文と、その根拠になったgroundingChunksのタイトル・URLを1件の事実として保存し、
+# メモリ上のBM25の索引で、段落に関係する事実を検索する
+# 日本語は単語に分かち書きしないため、文字の2-gram（英数字は単語）を索引の語とする
+
+FACTS_DB_PATH = os.path.join(article_store.DATA_DIR, "facts.sqlite3")
+
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 検索結果として返す最低の一致度（事実の語のうち、検索した文章に含まれる割合。0〜1）
+MIN_MATCH = float(os.environ.get("LLMO_FACT_MIN_MATCH", "0.3"))
+# BM25の上位何件まで一致度を確かめるか
+MAX_CANDIDATES = 50
+# 出典として使うには短すぎる文は保存しない
+MIN_FACT_CHARS = 15
+
+_WORD = re.compile(r"[a-z0-9]+|[^\sa-z0-9]+")
+_PUNCTUATION = set("。、，．・「」『』（）()【】［］[]！？!?：:；;…ー-—\"'`*#|>")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    queries TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    terms = []
+    for word in _WORD.findall(text):
+        if word.isascii():
+            terms.append(word)
+            continue
+        chars = [c for c in word if c not in _PUNCTUATION]
+        if len(chars) == 1:
+            terms.append(chars[0])
+        terms.extend(a + b for a, b in zip(chars, chars[1:]))
+    return terms
+
+
+def _fact_hash(text):
+    return hashlib.sha256(unicodedata.normalize("NFKC", text).encode()).hexdigest()
+
+
+def facts_from_paragraphs(paragraph_states):
+    # incremental_grounding.build_paragraph_statesの形の結果から、(文, 出典の一覧) を取り出す
+    for state in paragraph_states:
+        for support in state["supports"]:
+            sources = []
+            for index in support["groundingChunkIndices"]:
+                web = state["chunks"][index].get("web", {})
+                source = {"title": web.get("title", ""), "uri": web.get("uri", "")}
+                if source["uri"] and source not in sources:
+                    sources.append(source)
+            if sources:
+                yield support["segment"]["text"], sources
+
+
+class FactStore:
+    def __init__(self, db_path=FACTS_DB_PATH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # 索引: 事実ごとのidと語の出現数・語数、語 -> (索引内の位置の一覧, 出現数の一覧)
+        # 検索ではNumPyの配列に変換したものを使い、追加された語の分だけ作り直す
+        self._ids = []
+        self._counts = []
+        self._lengths = []
+        self._postings = {}
+        self._arrays = {}
+        self._length_array = None
+        with self._lock:
+            for row in self._conn.execute("SELECT id, text FROM facts ORDER BY id"):
+                self._index(row[0], row[1])
+
+    def _index(self, fact_id, text):
+        counts = Counter(tokenize(text))
+        position = len(self._ids)
+        self._ids.append(fact_id)
+        self._counts.append(counts)
+        self._lengths.append(sum(counts.values()))
+        for term, count in counts.items():
+            positions, tfs = self._postings.setdefault(term, ([], []))
+            positions.append(position)
+            tfs.append(count)
+            self._arrays.pop(term, None)
+        self._length_array = None
+
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            positions, tfs = self._postings[term]
+            arrays = (np.array(positions), np.array(tfs, dtype=float))
+            self._arrays[term] = arrays
+        return arrays
+
+    def add_many(self, facts, queries=()):
+        # (文, 出典の一覧) をまとめて保存し、保存した件数を返す（保存済みの文は数えない）
+        added = 0
+        with self._lock:
+            for text, sources in facts:
+                text = text.strip()
+                if len(text) < MIN_FACT_CHARS or not sources:
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO facts"
+                    " (hash, text, sources, queries, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (
+                        _fact_hash(text),
+                        text,
+                        json.dumps(sources, ensure_ascii=False),
+                        json.dumps(list(queries), ensure_ascii=False),
+                        time.time(),
+                    ),
+                )
+                if cursor.rowcount:
+                    self._index(cursor.lastrowid, text)
+                    added += 1
+            self._conn.commit()
+        return added
+
+    def add(self, text, sources, queries=()):
+        return self.add_many([(text, sources)], queries) == 1
+
+    def add_grounding(self, paragraph_states, queries=()):
+        # グラウンディング結果の段落から、出典付きの文をまとめて保存する
+        return self.add_many(facts_from_paragraphs(paragraph_states), queries)
+
+    def count(self):
+        with self._lock:
+            return len(self._ids)
+
+    def search(self, query, limit=5, min_match=MIN_MATCH):
+        # BM25で順位を付け、事実の語のうちクエリに含まれる割合（idfで重み付け）が
+        # min_match以上のものを最大limit件返す
+        terms = Counter(tokenize(query))
+        with self._lock:
+            n = len(self._ids)
+            if not n or not terms:
+                return []
+            if self._length_array is None:
+                self._length_array = np.array(self._lengths, dtype=float)
+            norm = BM25_K1 * (
+                1 - BM25_B + BM25_B * self._length_array / self._length_array.mean()
+            )
+            idf = {}
+
+            def term_idf(term):
+                if term not in idf:
+                    df = len(self._postings[term][0]) if term in self._postings else 0
+                    idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                return idf[term]
+
+            scores = np.zeros(n)
+            for term, query_count in terms.items():
+                if term not in self._postings:
+                    continue
+                positions, tfs = self._posting_arrays(term)
+                scores[positions] += (
+                    term_idf(term)
+                    * query_count
+                    * tfs
+                    * (BM25_K1 + 1)
+                    / (tfs + norm[positions])
+                )
+
+            results = []
+            for position in np.argsort(-scores, kind="stable")[:MAX_CANDIDATES]:
+                if scores[position] <= 0:
+                    break
+                counts = self._counts[position]
+                total = sum(term_idf(term) for term in counts)
+                matched = sum(term_idf(term) for term in counts if term in terms)
+                if matched / total >= min_match:
+                    results.append(
+                        (self._ids[position], float(scores[position]), matched / total)
+                    )
+                    if len(results) == limit:
+                        break
+            rows = {
+                row[0]: row
+                for row in self._conn.execute(
+                    "SELECT id, text, sources FROM facts WHERE id IN"
+                    f" ({','.join('?' * len(results))})",
+                    [fact_id for fact_id, _, _ in results],
+                )
+            }
+        return [
+            {
+                "id": fact_id,
+                "text": rows[fact_id][1],
+                "sources": json.loads(rows[fact_id][2]),
+                "score": round(score, 3),
+                "match": round(match, 3),
+            }
+            for fact_id, score, match in results
+        ]
+
+    def import_articles(self, store):
+        # 記事ストアに保存済みのグラウンディング結果（各記事の最新のもの）から、事実を取り込む
+        added = 0
+        for article in store.articles(article_store.ALL_OWNERS, limit=-1):
+            _, grounding = store.latest_grounding(article["id"])
+            if grounding is not None:
+                added += self.add_grounding(
+                    grounding["paragraphs"], grounding["fact_check_index"]["queries"]
+                )
+        return added
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            is_new = not os.path.exists(FACTS_DB_PATH)
+            _store = FactStore()
+            # 初めて作るときは、これまでの記事のグラウンディング結果から索引を作っておく
+            if is_new:
+                _store.import_articles(article_store.get_store())
+        return _store
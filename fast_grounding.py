@@ -0,0 +1,119 @@
+import os
+import re
+
+import fact_store
+import grounding_client
+import incremental_grounding
+import paragraphs
+import prompts
+import router
+
+# 保存済みの事実（fact_store）だけを使う高速なグラウンディング
+# 段落ごとに関係する事実を検索し、見つかった段落の割合が十分なら、
+# Google検索をせずに軽いモデルで事実を組み込ませる（足りなければ呼び出し側で通常のグラウンディングを行う）
+
+# 関係する事実が見つかった段落がこの割合以上なら、Google検索を省略する
+MIN_RECALL = float(os.environ.get("LLMO_FAST_GROUNDING_RECALL", "0.6"))
+# 段落ごとに検索する事実の数と、プロンプトに含める事実の上限
+FACTS_PER_PARAGRAPH = 2
+MAX_FACTS = 20
+# 短い段落（リード文の断片など）は、事実が見つかったかの判定に含めない
+MIN_PARAGRAPH_CHARS = 20
+
+# 事実を使った文の末尾に付けさせる番号（[F1] や [F1][F3]、[F1, F3]）
+_MARKER = re.compile(r"\s*\[F(\d+(?:\s*[,、]\s*F?\d+)*)\]")
+_SENTENCE_END = "。！？\n"
+_CLOSING = "）」』)]"
+
+
+def _targets(text):
+    return [
+        paragraph
+        for paragraph in paragraphs.split_paragraphs(text)
+        if not paragraph.startswith(("#", "|"))
+        and len(paragraph) >= MIN_PARAGRAPH_CHARS
+    ]
+
+
+def retrieve(text, store=None):
+    # 段落ごとに検索した事実と、事実が見つかった段落の割合を返す
+    store = fact_store.get_store() if store is None else store
+    targets = _targets(text)
+    facts = {}
+    covered = 0
+    for paragraph in targets:
+        found = store.search(paragraph, FACTS_PER_PARAGRAPH)
+        if found:
+            covered += 1
+        for fact in found:
+            facts.setdefault(fact["id"], fact)
+    recall = covered / len(targets) if targets else 0.0
+    return list(facts.values())[:MAX_FACTS], recall
+
+
+def open_stream(api_key, text, facts):
+    payload = {
+        "contents": [
+            {"parts": [{"text": prompts.build_fast_grounding_prompt(text, facts)}]}
+        ]
+    }
+    return grounding_client.generate_content(
+        api_key,
+        payload,
+        model=router.primary("grounding_fast"),
+        stream=True,
+        kind="grounding_fast",
+    )
+
+
+def extract_citations(output_text, facts):
+    # [F1] などの番号を取り除き、番号の直前の文を根拠（groundingSupports）、
+    # 事実の出典を根拠元（groundingChunks）とするgroundingMetadataを組み立てる
+    text = ""
+    position = 0
+    chunks = []
+    supports = []
+    for match in _MARKER.finditer(output_text):
+        text += output_text[position : match.start()]
+        position = match.end()
+
+        body = text.rstrip()
+        core = body.rstrip(_CLOSING).rstrip(_SENTENCE_END)
+        start = max(core.rfind(c) for c in _SENTENCE_END) + 1
+        segment = body[start:].strip()
+
+        indices = []
+        for number in re.findall(r"\d+", match.group(1)):
+            if not 1 <= int(number) <= len(facts):
+                continue
+            for source in facts[int(number) - 1]["sources"]:
+                chunk = {"web": {"uri": source["uri"], "title": source["title"]}}
+                if chunk not in chunks:
+                    chunks.append(chunk)
+                if chunks.index(chunk) not in indices:
+                    indices.append(chunks.index(chunk))
+        if segment and indices:
+            supports.append(
+                {"segment": {"text": segment}, "groundingChunkIndices": indices}
+            )
+    text += output_text[position:]
+    return text, {"groundingChunks": chunks, "groundingSupports": supports}
+
+
+def build_result(response_json, facts):
+    # incremental_grounding.regroundと同じ (本文, 段落ごとの根拠, レスポンス) の形で返す
+    text, meta = extract_citations(grounding_client.extract_text(response_json), facts)
+    response_json = {
+        **response_json,
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "groundingMetadata": meta,
+            }
+        ],
+    }
+    return (
+        text,
+        incremental_grounding.build_paragraph_states(text, meta),
+        response_json,
+    )
@@ -0,0 +1,50 @@
+import streamlit as st
+
+import llm
+import router
+
+# 記事生成・リライトで使う既定のモデル（実際に使うモデルは router.ROUTES で種別ごとに決まる）
+DEFAULT_MODEL = f"models/{router.primary('article')}"
+
+
+def get_api_key():
+    # 見つからない場合は呼び出し側で扱えるよう、例外はそのまま送出する
+    return st.secrets["GEMINI_API_KEY"]
+
+
+@st.cache_resource(show_spinner=False)
+def _configured_sdk(api_key):
+    # google.generativeai は読み込みが重いため、最初のモデル呼び出しまでimportしない
+    import google.generativeai as genai
+
+    llm.configure_sdk(genai, api_key)
+    return genai
+
+
+@st.cache_resource(show_spinner=False)
+def get_model(model_name=DEFAULT_MODEL):
+    # 再実行のたびにconfigureやモデル生成をしないよう、プロセス全体で使い回す
+    genai = _configured_sdk(get_api_key())
+    return genai.GenerativeModel(model_name)
+
+
+class LazyModel:
+    # generate_contentが呼ばれるまでSDKの読み込みとモデル生成を遅らせる代理オブジェクト
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+
+    def generate_content(self, *args, **kwargs):
+        return get_model(self.model_name).generate_content(*args, **kwargs)
+
+
+@st.cache_resource(show_spinner=False)
+def route_problems(api_key):
+    # 設定されたモデル名を起動時に一度だけ確かめる（一覧はcheck_models.pyのディスクキャッシュを使う）
+    # st.cache_resourceは例外をキャッシュしないため、一覧を取得できない場合もここで空の結果にして、
+    # 再実行のたびに一覧の取得を待たないようにする
+    import check_models
+
+    try:
+        return check_models.validate_routes(api_key)
+    except Exception:
+        return []
@@ -1,12 +1,24 @@
 import streamlit as st
-import google.generativeai as genai
+
+import article_store
+import gemini_client
+import grounding_jobs
+import llm
+import llmo_validator
+import longform
+import prefetch
+import prompts
+import scheduler
+import session_owner
+import title_generation
 
 
 def show():
     # --- ページ設定とAPIキー設定 ---
     try:
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        model = genai.GenerativeModel("models/gemini-2.5-flash-lite")
+        gemini_client.get_api_key()
+        # SDKの読み込みとモデル生成は、最初に生成ボタンが押されるまで遅らせる
+        model = gemini_client.LazyModel()
 
     except Exception as e:
         st.error(
@@ -19,8 +31,12 @@ def show():
         st.session_state.keyword_count = 1
     if "title_list" not in st.session_state:
         st.session_state.title_list = []
+    if "title_details" not in st.session_state:
+        st.session_state.title_details = {}
     if "article_text" not in st.session_state:
         st.session_state.article_text = ""
+    if "article_prefetcher" not in st.session_state:
+        st.session_state.article_prefetcher = prefetch.ArticlePrefetcher()
 
     # キーワード入力欄を、現在の数だけ動的に生成
     keywords_list = []
@@ -49,143 +65,175 @@ def show():
     summary = st.text_area("書きたい記事の概要（任意）:", placeholder="（省略可）...")
     style = st.text_area("文章のスタイル（任意）:", placeholder="（省略可）...")
 
+    # 同じ条件でも作り直したい場合は、キャッシュを使わずにAPIへ問い合わせる
+    use_cache = not st.checkbox(
+        "キャッシュを使わずに生成する", key="generation_bypass_cache"
+    )
+
     # 入力されたキーワードをカンマ区切りの一つの文字列に変換
     keywords_str = ", ".join(keywords_list)
 
-    # タイトル生成ボタン
-    if st.button("1. タイトル案を10個生成する"):
+    # タイトル生成ボタン（生成済みの案がある場合は、残したまま追加で生成することもできる）
+    title_col, more_col = st.columns(2)
+    with title_col:
+        generate_titles = st.button(
+            f"1. タイトル案を{title_generation.TITLE_COUNT}個生成する"
+        )
+    with more_col:
+        more_titles = bool(st.session_state["title_list"]) and st.button(
+            f"＋ タイトル案をさらに{title_generation.TITLE_COUNT}個生成する"
+        )
+    if generate_titles or more_titles:
         if not keywords_str:
             st.warning("キーワードを入力してください。")
         else:
-            # --- 動的なプロンプト組み立て ---
-            prompt_for_titles = f"""
-            # 命令
-            あなたは、中堅企業向けにノーコード業務自動化ツールを提供するSaaS企業「CloudFlow Dynamics」の、非常に優秀なコンテンツマーケターです。
-
-            # ターゲット読者
-            - 中堅企業の経理、人事、営業部門のマネージャー層。
-            - プログラミング知識はないが、日々の手作業や部署間の非効率な連携に強い課題を感じている。
-            
-            # 記事の目的
-            ターゲット読者が抱えるであろう具体的な業務課題を提示し、解決策への期待感を抱かせることで、記事のクリックを促すこと。
-
-            # テーマ
-            {keywords_str}
-            """
-            if summary:
-                prompt_for_titles += f"""
-            # 参考概要
-            以下の概要・ストーリーには必ず従うこと。
-            ---
-            {summary}
-            """
-
-            prompt_for_titles += """
-            # 要件
-            - 上記のターゲット読者が「これは自分のための記事だ！」と直感的に感じるような、具体的で課題解決志向のタイトル案を10個生成してください。
-            - 専門的すぎず、しかし示唆に富んだ表現を心がけてください。
-            - 必ず番号付きリスト（1., 2., 3., ...）の形式で、タイトルのみを記述してください。
-            - 他の余計な文章は一切含めないでください。
-            """
-
-            with st.spinner("AIがタイトル案を考案中です..."):
-                try:
-                    response = model.generate_content(prompt_for_titles)
-                    titles = response.text.strip().split("\n")
-                    cleaned_titles = [
-                        title.split(". ", 1)[1] for title in titles if ". " in title
-                    ]
-                    st.session_state["title_list"] = cleaned_titles
-                    st.success(
-                        "タイトル案の生成が完了しました。下から1つ選んでください。"
-                    )
-                except Exception as e:
-                    st.error("タイトル生成中にエラーが発生しました。")
-                    st.exception(e)
+            _generate_titles(model, keywords_str, summary, use_cache, more_titles)
 
     # --- ステップ2：タイトル選択と記事生成 ---
     if "title_list" in st.session_state and st.session_state["title_list"]:
         st.subheader("ステップ2：タイトル選択と記事生成")
         selected_title = st.radio(
-            "生成されたタイトル案:", st.session_state["title_list"]
+            "生成されたタイトル案:",
+            st.session_state["title_list"],
+            captions=_title_captions(st.session_state["title_list"]),
         )
 
         # 文字数設定
         wordcount = st.slider(
             "文字数を設定してください", min_value=50, max_value=5000, value=400, step=10
         )
+
+        # 長い記事は、アウトラインを作ってからセクションごとに並行して生成する
+        use_longform = False
+        if wordcount >= longform.LONGFORM_THRESHOLD:
+            use_longform = st.checkbox(
+                "長文モード（アウトライン作成後にセクションを並列生成する）",
+                value=True,
+                key="longform_enabled",
+            )
+
+        # --- 記事の先読み生成 ---
+        # タイトルを選んでいる間に上位候補の記事を生成しておき、確定時にすぐ表示する
+        prefetcher = st.session_state["article_prefetcher"]
+        prefetch_enabled = not use_longform and st.checkbox(
+            "タイトル選択中に上位候補の記事を先読み生成する",
+            key="prefetch_enabled",
+        )
+        if prefetch_enabled:
+            prefetch_count = st.slider(
+                "先読みするタイトル数",
+                min_value=1,
+                max_value=prefetch.MAX_PREFETCH,
+                value=3,
+                key="prefetch_count",
+            )
+            prefetch_prompts = {
+                title: prompts.build_article_prompt(
+                    title, keywords_str, wordcount, summary, style
+                )
+                for title in st.session_state["title_list"][:prefetch_count]
+            }
+            # 入力が変わってプロンプトが変われば、古い先読みは取り消して投げ直す
+            prefetcher.sync(
+                gemini_client.get_model(model.model_name),
+                prefetch_prompts,
+                use_cache=use_cache,
+            )
+            done, total = prefetcher.progress()
+            st.caption(f"先読み生成: {done}/{total}件完了")
+        else:
+            prefetcher.cancel()
+
+        # 生成した記事がLLMO要件を満たしていなければ、該当するセクションだけを直させる
+        auto_repair = st.checkbox(
+            "LLMO要件を満たさないセクションを自動で修正する",
+            value=True,
+            key="llmo_auto_repair",
+        )
+
         if st.button("2. 選択したタイトルで記事を生成する"):
             # --- 動的なプロンプト組み立て ---
-            prompt_for_article = f"""
-            # あなた（AI）の役割
-            あなたは、中堅企業向けにノーコード業務自動化ツールを提供する急成長SaaS企業「CloudFlow Dynamics」の、非常に優秀なコンテンツマーケターです。
-
-            # 記事の最終ゴール
-            読者が記事を読み終えた時、自分たちの会社にはびこる非効率な手作業や業務プロセスへの課題意識が最大化され、具体的な解決策として当社の製品に強い興味を持ち、資料請求や無料トライアルを検討したくなる状態を作り出すことです。
-
-            # ターゲット読者
-            中堅企業の経理、人事、営業部門のマネージャー層。プログラミングの知識はないが、日々の手作業（Excel、メールのコピペなど）や部署間の非効率な連携に課題を感じています。
-
-            # トーン＆マナー
-            専門性を感じさせつつも、難解な言葉は避け、読者に深く共感し、共に課題を解決していくパートナーのような、信頼感と説得力のあるトーンで記述してください。
-            
-           
-            # LLMO最適化要件（重要）
-            以下の要素を必ず含めてください：
-            1. 冒頭で「〇〇とは」形式の明確な定義文
-            2. 各セクションの冒頭に要約文（1行）を配置
-            3. 具体的な手順を3〜5ステップで記載
-            4. 比較表（導入前/導入後、手動/自動化など）
-            なお、ハルシネーションを避けるため、事実に基づかない情報は一切含めないこと。
-            
-            # タイトル
-            {selected_title}
-            
-            # テーマ・元のキーワード
-            {keywords_str}
-            """
-            if summary:
-                prompt_for_article += f"""
-            # 参考概要
-            以下の概要・ストーリーには必ず従うこと。
-            ---
-            {summary}
-
-
-            """
-
-            if style:
-                prompt_for_article += f"""
-            # 指定文章スタイル
-            文章のスタイルは以下の通りにしてください。
-            ---
-            {style}
-            """
-
-            if summary:
-                prompt_for_article += f"""
-            # 参考概要
-            以下の概要も、記事の内容を膨らませる上で強く参考にし、必ず従うこと。
-            ---
-            {summary}
-            """
-
-            prompt_for_article += f"""
-            # 構造と要件
-            - 全体で{wordcount}字程度の、読み応えのある文章を生成してください。
-            - 必ず以下の構造に従ってください。
-            - 導入: ターゲット読者が日常的に体験しているであろう、具体的な「あるある」な課題や非効率な業務風景を描写し、深く共感を得る。
-            - 課題の深掘り: なぜその非効率が生まれるのか、その根本原因（例：情報のサイロ化、属人化など）を分かりやすく解説する。
-            - 解決の方向性: テクノロジーを活用して「業務の仕組み化・自動化」を目指すべきである、という大きな方針を示す。
-            - 結論（自社製品への誘導）: 記事のまとめとして、その「業務の仕組み化・自動化」を、プログラミング知識なしで実現できる具体的な解決策として、当社のノーコードツール『FlowSpark』を自然な形で紹介する。読者が次のアクション（資料請求、無料トライアル）を取りたくなるような、希望に満ちた締めくくりをしてください。
-            - 「手作業」「自動化」「ワークフロー」「DX」といったキーワードを適切に含めてください。
-            -  余計な文章（例：「承知しました」）などは一切含めないでください
-            """
-
-            with st.spinner("AIが記事を執筆中です..."):
+            prompt_for_article = prompts.build_article_prompt(
+                selected_title, keywords_str, wordcount, summary, style
+            )
+
+            with st.spinner("AIが記事を執筆中です..."), scheduler.queue_status():
                 try:
-                    response = model.generate_content(prompt_for_article)
-                    st.session_state["article_text"] = response.text
+                    # 届いた分から本文を表示し、完了後にsession_stateへ保存する
+                    article_placeholder = st.empty()
+                    article_text = None
+                    if use_longform:
+                        article_text = generate_longform(
+                            model,
+                            selected_title,
+                            keywords_str,
+                            wordcount,
+                            summary,
+                            style,
+                            use_cache,
+                            article_placeholder,
+                        )
+                    elif prefetcher.has(prompt_for_article):
+                        article_text = prefetcher.result(prompt_for_article)
+                    if article_text:
+                        article_placeholder.markdown(article_text)
+                    else:
+                        article_text = llm.stream_text(
+                            model,
+                            prompt_for_article,
+                            article_placeholder,
+                            use_cache=use_cache,
+                            kind="article",
+                        )
+                    # 記事をストアに保存し、セッションには記事IDと版番号と作業中の本文だけを持たせる
+                    article_id, revision = article_store.get_store().create(
+                        selected_title,
+                        article_text,
+                        "generation",
+                        {
+                            "model": model.model_name,
+                            "title": selected_title,
+                            "keywords": keywords_str,
+                            "wordcount": wordcount,
+                            "summary": summary,
+                            "style": style,
+                            "longform": use_longform,
+                        },
+                        owner=session_owner.current(),
+                    )
+                    checks = llmo_validator.validate(article_text, keywords_list)
+                    failed = llmo_validator.failing(checks)
+                    if auto_repair and failed:
+                        with st.spinner(
+                            "LLMO要件を満たさないセクションを修正中です..."
+                        ):
+                            article_text, locations = llmo_validator.repair(
+                                gemini_client.get_model(model.model_name),
+                                article_text,
+                                checks,
+                                title=selected_title,
+                                use_cache=use_cache,
+                            )
+                        revision = article_store.get_store().commit(
+                            article_id,
+                            article_text,
+                            "repair",
+                            {
+                                "model": model.model_name,
+                                "rules": sorted({check["rule"] for check in failed}),
+                                "sections": locations,
+                            },
+                        )
+                        article_placeholder.markdown(article_text)
+                        st.caption(f"修正したセクション: {'、'.join(locations)}")
+                    st.session_state["article_id"] = article_id
+                    st.session_state["article_revision"] = revision
+                    st.session_state["article_text"] = article_text
+                    # 前の記事に対する修正案やグラウンディングは引き継がない
+                    st.session_state.pop("pending_rewrite", None)
+                    grounding_jobs.discard(
+                        st.session_state.pop("grounding_job_id", None)
+                    )
 
                     st.header(
                         "✅生成が完了しました。「編集・調整」タブへ進んでください。"
@@ -194,6 +242,112 @@ def show():
                     st.error("記事の生成中にエラーが発生しました。")
                     st.exception(e)
 
+    # 生成した記事のLLMO要件のチェック結果（再実行でも表示を保つ）
+    if st.session_state.get("article_id") and st.session_state["article_text"]:
+        with st.expander("生成した記事のLLMOチェック"):
+            llmo_validator.render(
+                llmo_validator.validate(
+                    st.session_state["article_text"], keywords_list
+                ),
+                "generation_llmo_checks",
+            )
+
     #    data_context = ""
     # if st.button("信頼性のある情報を手動で設定する"):
     #    data_context = st.text_area("信頼性のある情報をここに追加")
+
+
+def _title_captions(titles):
+    # タイトル案ごとの想定読者の部署と業務課題
+    captions = []
+    for title in titles:
+        detail = st.session_state["title_details"].get(title, {})
+        parts = [detail.get("department"), detail.get("pain_point")]
+        captions.append("｜".join(part for part in parts if part))
+    return captions
+
+
+def _generate_titles(model, keywords_str, summary, use_cache, keep_existing):
+    existing = list(st.session_state["title_list"]) if keep_existing else []
+    titles = list(existing)
+    details = dict(st.session_state["title_details"]) if keep_existing else {}
+    listing = st.empty()
+
+    def add_title(item):
+        # 完成したタイトル案から順に一覧へ加える（途中で止まっても届いた分は残る）
+        if item["title"] in titles:
+            return
+        titles.append(item["title"])
+        details[item["title"]] = item
+        st.session_state["title_list"] = list(titles)
+        st.session_state["title_details"] = dict(details)
+        listing.radio(
+            "届いたタイトル案:",
+            titles,
+            captions=_title_captions(titles),
+            disabled=True,
+        )
+
+    # 他のセッションの呼び出しで混み合っているときは、順番待ちの位置を表示する
+    with st.spinner("AIがタイトル案を考案中です..."), scheduler.queue_status():
+        try:
+            new_titles = title_generation.generate(
+                model,
+                keywords_str,
+                summary,
+                exclude=existing,
+                use_cache=use_cache,
+                on_title=add_title,
+            )
+            for item in new_titles:
+                add_title(item)
+            listing.empty()
+            if new_titles:
+                st.success(
+                    f"タイトル案を{len(new_titles)}個生成しました。下から1つ選んでください。"
+                )
+            else:
+                st.warning(
+                    "新しいタイトル案を生成できませんでした。もう一度お試しください。"
+                )
+        except Exception as e:
+            listing.empty()
+            st.error("タイトル生成中にエラーが発生しました。")
+            st.exception(e)
+
+
+def generate_longform(
+    model, selected_title, keywords_str, wordcount, summary, style, use_cache, container
+):
+    # セクションはワーカースレッドで生成するため、モデルはここで解決しておく
+    model = gemini_client.get_model(model.model_name)
+
+    with container.container():
+        status = st.empty()
+        status.caption("アウトラインを作成中です...")
+        outline = longform.generate_outline(
+            model, selected_title, keywords_str, wordcount, summary, style, use_cache
+        )
+
+        # 完成したセクションから、記事の順番どおりの位置に表示していく
+        section_placeholders = [st.empty() for _ in outline["sections"]]
+        for placeholder, section in zip(section_placeholders, outline["sections"]):
+            placeholder.caption(f"「{section['heading']}」を執筆中です...")
+        status.caption(f"{len(outline['sections'])}セクションを並行して執筆中です...")
+
+        def show_section(index, text):
+            section_placeholders[index].markdown(text)
+
+        article_text = longform.generate_sections(
+            model,
+            selected_title,
+            keywords_str,
+            outline,
+            wordcount,
+            summary,
+            style,
+            use_cache,
+            on_section=show_section,
+        )
+        status.empty()
+    return article_text
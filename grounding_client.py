@@ -0,0 +1,210 @@
+import email.utils
+import gzip
+import json
+import os
+import random
+import threading
+import time
+
+import prompt_template
+import router
+import scheduler
+import telemetry
+
+# Gemini REST API（グラウンディング呼び出し）の共通クライアント
+# LLMO_GEMINI_ENDPOINT を設定すると、stub_server.py などのローカルサーバーへ向けられる
+ENDPOINT = os.environ.get(
+    "LLMO_GEMINI_ENDPOINT", "https://generativelanguage.googleapis.com"
+).rstrip("/")
+API_BASE = f"{ENDPOINT}/v1beta"
+# グラウンディングの既定のモデル（実際に使うモデルは router.ROUTES で種別ごとに決まる）
+GROUNDING_MODEL = router.primary("grounding")
+
+# 接続確立と、レスポンスのバイト間隔それぞれのタイムアウト（秒）
+CONNECT_TIMEOUT_SECONDS = 10
+READ_TIMEOUT_SECONDS = 180
+
+# 429/5xxと接続エラーに対するリトライ設定
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # TLS接続を使い回すため、プロセス全体で1つのセッションを共有する
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requestsは最初のグラウンディング呼び出しまで読み込まない
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def build_grounding_payload(prompt):
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "tools": [{"googleSearch": {}}],
+    }
+
+
+def _retry_after_seconds(response):
+    # Retry-After は秒数またはHTTP日付のどちらでも返りうる
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _backoff_seconds(attempt):
+    # フルジッター付きの指数バックオフ
+    return random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+
+
+def generate_content(
+    api_key,
+    payload,
+    model=GROUNDING_MODEL,
+    stream=False,
+    gzip_body=False,
+    timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS),
+    max_retries=MAX_RETRIES,
+    kind="grounding",
+):
+    # 全セッション共通のスケジューラで順番を待ち、種別ごとのモデルへ振り分けて送信する
+    # ストリーミングでは、本文を読み終えた側（llm.stream_rest_response）で枠を返す
+    tokens = _estimate_payload_tokens(payload)
+
+    def open_response(model_name):
+        return _generate_content(
+            api_key, payload, model_name, stream, gzip_body, timeout, max_retries, kind
+        )
+
+    if stream:
+        return router.open_stream(kind, model, open_response, tokens)
+
+    def attempt(model_name):
+        response = open_response(model_name)
+        return response, response.json().get("usageMetadata", {}).get(
+            "promptTokenCount"
+        )
+
+    return router.run(kind, model, attempt, tokens)
+
+
+def _estimate_payload_tokens(payload):
+    return sum(
+        prompt_template.estimate_tokens(part.get("text", ""))
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _generate_content(
+    api_key, payload, model, stream, gzip_body, timeout, max_retries, kind
+):
+    # ストリーミング時は本文を読み終えるまで計測を続けるため、記録は読み出し側に任せる
+    if stream:
+        call = telemetry.Call(kind, model, "bypass")
+        response = _post(api_key, payload, model, True, gzip_body, timeout, max_retries)
+        response.telemetry_call = call
+        response.served_model = model
+        call.retry_count = response.retry_count
+        return response
+
+    with telemetry.track(kind, model, "bypass") as call:
+        response = _post(
+            api_key, payload, model, False, gzip_body, timeout, max_retries, call
+        )
+        call.set_rest_usage(response.json())
+    # フォールバックした場合も、実際に応答したモデルを呼び出し元で記録できるようにする
+    response.served_model = model
+    return response
+
+
+def _post(api_key, payload, model, stream, gzip_body, timeout, max_retries, call=None):
+    if stream:
+        url = f"{API_BASE}/models/{model}:streamGenerateContent?alt=sse"
+    else:
+        url = f"{API_BASE}/models/{model}:generateContent"
+
+    headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+    body = json.dumps(payload).encode("utf-8")
+    if gzip_body:
+        headers["Content-Encoding"] = "gzip"
+        body = gzip.compress(body)
+
+    import requests
+
+    session = get_session()
+    attempt = 0
+    while True:
+        try:
+            response = session.post(
+                url, headers=headers, data=body, timeout=timeout, stream=stream
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= max_retries:
+                raise
+            time.sleep(_backoff_seconds(attempt))
+            attempt += 1
+            if call is not None:
+                call.retry_count = attempt
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            wait = _retry_after_seconds(response)
+            if response.status_code == 429:
+                # 同じレーンの他の呼び出しも、しばらく送信を止める
+                scheduler.throttle(model, wait)
+            if wait is None:
+                wait = _backoff_seconds(attempt)
+            response.close()
+            time.sleep(min(wait, BACKOFF_MAX_SECONDS))
+            attempt += 1
+            if call is not None:
+                call.retry_count = attempt
+            continue
+
+        response.raise_for_status()  # HTTPエラーがあれば例外を発生させる
+        # 呼び出し側で計測できるよう、リトライ回数をレスポンスに残しておく
+        response.retry_count = attempt
+        return response
+
+
+def iter_sse_json(response):
+    # streamGenerateContent?alt=sse のレスポンスを、"data:"行ごとのJSONとして取り出す
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield json.loads(line[len("data:") :].strip())
+
+
+def extract_text(response_json):
+    parts = response_json["candidates"][0]["content"]["parts"]
+    return "".join(part.get("text", "") for part in parts)
@@ -0,0 +1,244 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import fact_store
+import fast_grounding
+import grounding_client
+import incremental_grounding
+import llm
+import prompts
+import scheduler
+
+# グラウンディングをスクリプトのスレッドから切り離して実行するジョブ
+# ジョブはサーバー全体で共有する表に持ち、セッションにはジョブIDだけを保存する
+# 実行中も編集を続けられるよう、結果は版として保存せずにジョブに残し、画面側で反映する
+
+# サーバー全体で同時に実行するジョブの上限（超えた分は順番待ちになる）
+MAX_CONCURRENT_JOBS = int(os.environ.get("LLMO_GROUNDING_JOBS", "4"))
+# 終了後に結果が取りに来られなかったジョブを残しておく秒数
+FINISHED_RETENTION_SECONDS = 60 * 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+# 実際に行ったグラウンディングの方法
+FAST = "fast"
+INCREMENTAL = "incremental"
+FULL = "full"
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="grounding-job"
+)
+
+
+class GroundingJob:
+    def __init__(
+        self,
+        article_id,
+        base_revision,
+        base_text,
+        incremental,
+        grounded_paragraphs,
+        fast=False,
+    ):
+        self.id = uuid.uuid4().hex
+        self.article_id = article_id
+        self.base_revision = base_revision
+        self.base_text = base_text
+        self.incremental = incremental
+        self.grounded_paragraphs = grounded_paragraphs
+        self.fast = fast
+        self.mode = None
+        # 実際に応答したモデル（フォールバックした場合はフォールバック先）
+        self.model = None
+        # 高速モードで、保存済みの事実が見つかった段落の割合と使った事実の数
+        self.recall = None
+        self.fact_count = 0
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # ストリーミング中に届いた本文（進み具合の表示用）
+        self.partial_text = ""
+        # 差分グラウンディングで、グラウンディングし終えた段落のまとまりの数と全体の数
+        self.runs_done = 0
+        self.runs_total = 0
+        self.text = None
+        self.paragraphs = None
+        self.response_json = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    def cancel(self):
+        # 未着手のものはそのまま取り消し、実行中のものは順番待ちと読み出しを打ち切る
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+
+    def _run(self, api_key):
+        if self._cancel.is_set():
+            self._finish(CANCELLED)
+            return
+        self.status = RUNNING
+        self.started_at = time.time()
+        try:
+            with scheduler.cancel_on(self._cancel):
+                if not (self.fast and self._ground_fast(api_key)):
+                    self._ground_with_search(api_key)
+        except Exception as e:
+            if self._cancel.is_set():
+                self._finish(CANCELLED)
+            else:
+                self.error = e
+                self._finish(ERROR)
+            return
+        if self.mode != FAST:
+            self._remember_facts()
+        # 取り消しが結果の到着と行き違った場合も、結果は使わない
+        self._finish(CANCELLED if self._cancel.is_set() else DONE)
+
+    def _ground_fast(self, api_key):
+        # 保存済みの事実が足りなければFalseを返し、Google検索でのグラウンディングに切り替える
+        facts, self.recall = fast_grounding.retrieve(self.base_text)
+        if not facts or self.recall < fast_grounding.MIN_RECALL:
+            return False
+        self.mode = FAST
+        self.fact_count = len(facts)
+        response = fast_grounding.open_stream(api_key, self.base_text, facts)
+        self.model = response.served_model
+        response_json = llm.stream_rest_response(response, _Progress(self))
+        self.text, self.paragraphs, self.response_json = fast_grounding.build_result(
+            response_json, facts
+        )
+        return True
+
+    def _ground_with_search(self, api_key):
+        if self.incremental:
+            self.mode = INCREMENTAL
+            self.text, self.paragraphs, self.response_json = (
+                incremental_grounding.reground(
+                    api_key, self.base_text, self.grounded_paragraphs, self._on_run
+                )
+            )
+        else:
+            self.mode = FULL
+            self._ground_all(api_key)
+
+    def _on_run(self, done, total, model):
+        self.runs_done, self.runs_total = done, total
+        # まとまりごとに別のモデルが応答した場合は、すべて記録する
+        models = self.model.split(", ") if self.model else []
+        if model not in models:
+            self.model = ", ".join(models + [model])
+
+    def _remember_facts(self):
+        # Google検索で得た出典付きの文を、次回以降の高速モードのために保存する
+        meta = self.response_json["candidates"][0].get("groundingMetadata", {})
+        try:
+            fact_store.get_store().add_grounding(
+                self.paragraphs, meta.get("webSearchQueries", [])
+            )
+        except sqlite3.Error:
+            # 保存できなくてもグラウンディングの結果は使えるようにする
+            pass
+
+    def _ground_all(self, api_key):
+        payload = grounding_client.build_grounding_payload(
+            prompts.build_grounding_prompt(self.base_text)
+        )
+        response = grounding_client.generate_content(api_key, payload, stream=True)
+        self.model = response.served_model
+        response_json = llm.stream_rest_response(response, _Progress(self))
+        self.text = response_json["candidates"][0]["content"]["parts"][0]["text"]
+        self.paragraphs = incremental_grounding.build_paragraph_states(
+            self.text, response_json["candidates"][0].get("groundingMetadata", {})
+        )
+        self.response_json = response_json
+
+
+class _Progress:
+    # llm.stream_rest_responseの描画先の代わりに、届いた本文をジョブに残す
+    def __init__(self, job):
+        self.job = job
+
+    def markdown(self, text):
+        if self.job._cancel.is_set():
+            raise scheduler.RequestCancelled("グラウンディングを取り消しました。")
+        self.job.partial_text = text.removesuffix(llm.STREAM_CURSOR)
+
+
+def _prune():
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if not job.active and now - job.finished_at > FINISHED_RETENTION_SECONDS:
+            del _jobs[job_id]
+
+
+def submit(
+    api_key,
+    article_id,
+    base_revision,
+    base_text,
+    incremental,
+    grounded_paragraphs,
+    fast=False,
+):
+    job = GroundingJob(
+        article_id, base_revision, base_text, incremental, grounded_paragraphs, fast
+    )
+    with _lock:
+        _prune()
+        _jobs[job.id] = job
+    # 順番待ちと取り消しは、投げたセッションの呼び出しとして扱う
+    job._future = scheduler.submit(_executor, job._run, api_key)
+    return job
+
+
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def cancel(job_id):
+    job = get(job_id)
+    if job is not None:
+        job.cancel()
+
+
+def discard(job_id):
+    # 結果を反映・破棄したジョブを表から外す（実行中なら取り消す）
+    with _lock:
+        job = _jobs.pop(job_id, None)
+    if job is not None and job.active:
+        job.cancel()
+
+
+def stats():
+    with _lock:
+        jobs = list(_jobs.values())
+    return {
+        "running": sum(1 for job in jobs if job.status == RUNNING),
+        "queued": sum(1 for job in jobs if job.status == QUEUED),
+        "limit": MAX_CONCURRENT_JOBS,
+    }
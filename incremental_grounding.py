@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import grounding_client
+import paragraphs
+import prompts
+import scheduler
+
+# 変更された段落のまとまりを、同時にいくつまでグラウンディングするか
+MAX_PARALLEL_RUNS = 3
+
+
+def _segment_pieces(text, spans, segment_text):
+    # 根拠の区間を、重なる段落ごとの (段落番号, その段落に含まれる部分) に分ける
+    for index, (start, end) in enumerate(spans):
+        if segment_text in text[start:end]:
+            return [(index, segment_text)]
+
+    position = text.find(segment_text)
+    if position >= 0:
+        segment_end = position + len(segment_text)
+        pieces = []
+        for index, (start, end) in enumerate(spans):
+            piece = text[max(start, position) : min(end, segment_end)].strip()
+            if piece:
+                pieces.append((index, piece))
+        return pieces
+
+    # 区間の空白が本文と一致しない場合は、書き出しの行を含む段落に付ける
+    first_line = segment_text.splitlines()[0].strip()
+    for index, (start, end) in enumerate(spans):
+        if first_line in text[start:end]:
+            return [(index, first_line)]
+    return []
+
+
+def build_paragraph_states(text, grounding_meta):
+    # グラウンディング結果を段落単位に分け、各段落が使った根拠とソースだけを持たせる
+    # 複数の段落にまたがる根拠は、重なる段落ごとに分けて持たせる
+    chunks = grounding_meta.get("groundingChunks", [])
+    supports = grounding_meta.get("groundingSupports", [])
+
+    spans = paragraphs.paragraph_spans(text)
+    states = [
+        {
+            "hash": paragraphs.paragraph_hash(text[start:end]),
+            "text": text[start:end],
+            "supports": [],
+            "chunks": [],
+        }
+        for start, end in spans
+    ]
+
+    for support in supports:
+        segment_text = support.get("segment", {}).get("text", "").strip()
+        if not segment_text:
+            continue
+
+        for index, piece in _segment_pieces(text, spans, segment_text):
+            state = states[index]
+            # 段落内のソース一覧に対するインデックスへ振り直す
+            local_indices = []
+            for gci in support.get("groundingChunkIndices", []):
+                if gci >= len(chunks):
+                    continue
+                chunk = chunks[gci]
+                if chunk not in state["chunks"]:
+                    state["chunks"].append(chunk)
+                local_indices.append(state["chunks"].index(chunk))
+
+            state["supports"].append(
+                {
+                    "segment": {"text": piece},
+                    "groundingChunkIndices": local_indices,
+                }
+            )
+    return states
+
+
+def merge_paragraph_states(states, search_queries=()):
+    # 段落ごとの根拠を、記事全体のgroundingMetadataの形にまとめ直す
+    chunks = []
+    supports = []
+    for state in states:
+        for support in state["supports"]:
+            indices = []
+            for local_index in support["groundingChunkIndices"]:
+                chunk = state["chunks"][local_index]
+                if chunk not in chunks:
+                    chunks.append(chunk)
+                indices.append(chunks.index(chunk))
+            supports.append(
+                {"segment": support["segment"], "groundingChunkIndices": indices}
+            )
+
+    meta = {"groundingChunks": chunks, "groundingSupports": supports}
+    if search_queries:
+        meta["webSearchQueries"] = list(dict.fromkeys(search_queries))
+    return meta
+
+
+def plan(text, previous_states):
+    # 現在の段落を、前回グラウンディング済みのもの（再利用）と変更されたものに分ける
+    # 各段落には、元の文章での位置（span）も持たせる
+    known = {state["hash"]: state for state in previous_states}
+    items = []
+    for start, end in paragraphs.paragraph_spans(text):
+        paragraph = text[start:end]
+        state = known.get(paragraphs.paragraph_hash(paragraph))
+        items.append({"text": paragraph, "state": state, "span": (start, end)})
+
+    # 連続する変更段落は、文脈を保つために1回の呼び出しにまとめる
+    runs = []
+    for index, item in enumerate(items):
+        if item["state"] is not None:
+            continue
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return items, runs
+
+
+def _ground_run(api_key, items, run):
+    before = items[run[0] - 1]["text"] if run[0] > 0 else ""
+    after = items[run[-1] + 1]["text"] if run[-1] + 1 < len(items) else ""
+    target = paragraphs.join_paragraphs(items[index]["text"] for index in run)
+
+    payload = grounding_client.build_grounding_payload(
+        prompts.build_partial_grounding_prompt(target, before, after)
+    )
+    response = grounding_client.generate_content(
+        api_key, payload, kind="grounding_incremental"
+    )
+    response_json = response.json()
+    candidate = response_json["candidates"][0]
+    return (
+        grounding_client.extract_text(response_json),
+        candidate.get("groundingMetadata", {}),
+        response.served_model,
+    )
+
+
+def reground(api_key, text, previous_states, on_run=None):
+    # 変更された段落だけをグラウンディングし、未変更の段落と既存の引用はそのまま残す
+    # on_run(完了数, まとまりの数, 応答したモデル) は、まとまりが1つ終わるたびに呼ばれる
+    items, runs = plan(text, previous_states)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_RUNS, len(runs) or 1)) as ex:
+        futures = [
+            scheduler.submit(ex, _ground_run, api_key, items, run) for run in runs
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            _, _, model = future.result()
+            if on_run is not None:
+                on_run(done, len(runs), model)
+        results = [future.result() for future in futures]
+
+    replacements = {run[0]: result for run, result in zip(runs, results)}
+    skipped = {index for run in runs for index in run[1:]}
+
+    states = []
+    search_queries = []
+    for index, item in enumerate(items):
+        if index in skipped:
+            continue
+        if index in replacements:
+            grounded_text, meta, _ = replacements[index]
+            states.extend(build_paragraph_states(grounded_text, meta))
+            search_queries.extend(meta.get("webSearchQueries", []))
+        else:
+            states.append(item["state"])
+
+    # 再グラウンディングした段落のまとまりの範囲だけを差し替え、他の段落の空白や空行はそのまま残す
+    # （後ろのまとまりから差し替え、前の位置がずれないようにする）
+    new_text = text
+    for run, (grounded_text, _, _) in sorted(
+        zip(runs, results), key=lambda pair: pair[0][0], reverse=True
+    ):
+        start = items[run[0]]["span"][0]
+        end = items[run[-1]]["span"][1]
+        new_text = new_text[:start] + grounded_text.strip() + new_text[end:]
+    response_json = {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": new_text}], "role": "model"},
+                "groundingMetadata": merge_paragraph_states(states, search_queries),
+            }
+        ]
+    }
+    return new_text, states, response_json
@@ -0,0 +1,174 @@
+import os
+
+import grounding_client
+import prompt_template
+import response_cache
+import router
+import scheduler
+import telemetry
+
+# 生成途中であることを示すカーソル
+STREAM_CURSOR = "▌"
+
+
+def configure_sdk(genai, api_key):
+    # 接続先が差し替えられている場合は、SDKもRESTトランスポートで同じサーバーへ向ける
+    if "LLMO_GEMINI_ENDPOINT" in os.environ:
+        genai.configure(
+            api_key=api_key,
+            transport="rest",
+            client_options={"api_endpoint": grounding_client.ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=api_key)
+
+
+def _generate_content(model, prompt, generation_config, stream=False):
+    # 各プロンプトは固定の前置きから始まるため、同じ前置きはGemini側の暗黙のキャッシュに載る
+    return model.generate_content(
+        prompt, generation_config=generation_config, stream=stream
+    )
+
+
+def generate_text(model, prompt, generation_config=None, use_cache=True, kind="other"):
+    # 同じモデル・プロンプト・設定の組み合わせはキャッシュから返す
+    cache = response_cache.get_cache()
+    key = response_cache.make_key(model.model_name, prompt, generation_config)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            telemetry.record_cache_hit(kind, model.model_name)
+            return cached
+
+    cache_status = "miss" if use_cache else "bypass"
+
+    def attempt(model_name):
+        routed = router.model_for(model, model_name)
+        with telemetry.track(kind, routed.model_name, cache_status) as call:
+            response = _generate_content(routed, prompt, generation_config)
+            text = response.text
+            call.set_sdk_usage(response)
+        return (text, routed.model_name), call.input_tokens
+
+    # 全セッション共通のスケジューラで順番を待ち、種別ごとのモデルへ振り分けて送信する
+    # 遅い呼び出しにはヘッジを投げ、失敗したモデルからは次のモデルへフォールバックする
+    text, served = router.run(
+        kind, model.model_name, attempt, prompt_template.estimate_tokens(prompt)
+    )
+    # フォールバック先のモデルの応答は、要求したモデルのキーでは保存しない
+    if not router.is_fallback(kind, model.model_name, served):
+        cache.set(key, text)
+    return text
+
+
+def stream_text(
+    model, prompt, placeholder, generation_config=None, use_cache=True, kind="other"
+):
+    cache = response_cache.get_cache()
+    key = response_cache.make_key(model.model_name, prompt, generation_config)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            telemetry.record_cache_hit(kind, model.model_name)
+            placeholder.markdown(cached)
+            return cached
+
+    cache_status = "miss" if use_cache else "bypass"
+    shown = []
+
+    def attempt(model_name):
+        routed = router.model_for(model, model_name)
+        with telemetry.track(kind, routed.model_name, cache_status) as call:
+            # SDKのストリーミング生成を使い、届いたチャンクから順にプレースホルダーへ描画する
+            response = _generate_content(routed, prompt, generation_config, stream=True)
+
+            text = ""
+            for chunk in response:
+                try:
+                    piece = chunk.text
+                except ValueError:
+                    # 安全性フィルタなどでテキストを含まないチャンクは読み飛ばす
+                    continue
+                call.first_token()
+                text += piece
+                shown.append(piece)
+                placeholder.markdown(text + STREAM_CURSOR)
+
+            call.set_sdk_usage(response)
+        return (text, routed.model_name), call.input_tokens
+
+    # ストリーミングは画面に描画しながら読むため、ヘッジせずにこのスレッドで実行する
+    # 何も表示していない段階で失敗した場合だけ、次のモデルへフォールバックする
+    text, served = router.run(
+        kind,
+        model.model_name,
+        attempt,
+        prompt_template.estimate_tokens(prompt),
+        hedge=False,
+        can_fallback=lambda: not shown,
+    )
+
+    placeholder.markdown(text)
+    # 途中で例外になった場合はここに到達しないため、完了した生成だけが保存される
+    if not router.is_fallback(kind, model.model_name, served):
+        cache.set(key, text)
+    return text
+
+
+def stream_rest_response(response, placeholder):
+    # SSEで届いたチャンクを描画しつつ、generateContentと同じ形のJSONに組み立て直す
+    # 計測はgrounding_client.generate_contentで開始したものを、読み終えた時点で閉じる
+    call = response.telemetry_call
+    text = ""
+    grounding_meta = {}
+    finish_reason = None
+    usage_metadata = {}
+
+    try:
+        for chunk in grounding_client.iter_sse_json(response):
+            candidate = chunk.get("candidates", [{}])[0]
+            for part in candidate.get("content", {}).get("parts", []):
+                if "text" in part:
+                    call.first_token()
+                    text += part["text"]
+            # groundingMetadataは通常最後のチャンクに入るが、分割されても取りこぼさないようにマージする
+            grounding_meta.update(candidate.get("groundingMetadata", {}))
+            finish_reason = candidate.get("finishReason", finish_reason)
+            usage_metadata = chunk.get("usageMetadata", usage_metadata)
+            placeholder.markdown(text + STREAM_CURSOR)
+    except scheduler.RequestCancelled:
+        # 取り消しはモデルの失敗ではないため、エラー率には数えずに接続を閉じる
+        call.status = "cancelled"
+        response.close()
+        raise
+    except Exception as e:
+        call.status = "error"
+        call.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        call.set_rest_usage({"usageMetadata": usage_metadata})
+        entry = call.to_record()
+        telemetry.record(entry)
+        if entry["status"] != "cancelled":
+            router.record(
+                entry["kind"],
+                entry["model"],
+                entry["duration_seconds"],
+                entry["status"] == "ok",
+            )
+        # generate_contentで確保したスケジューラの枠を、読み終えた時点で返す
+        response.scheduler_ticket.report(call.input_tokens)
+        scheduler.release(response.scheduler_ticket)
+
+    placeholder.markdown(text)
+
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}}
+    if grounding_meta:
+        candidate["groundingMetadata"] = grounding_meta
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+
+    response_json = {"candidates": [candidate]}
+    if usage_metadata:
+        response_json["usageMetadata"] = usage_metadata
+    return response_json
@@ -0,0 +1,330 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import llm
+import prompts
+import scheduler
+
+# 記事のMarkdownが、記事プロンプトのLLMO最適化要件を満たしているかのチェックと、
+# 満たしていないセクションだけをモデルに直させる修正
+# チェックは正規表現による手元の判定だけで行い、APIは呼ばない
+
+# 記事プロンプトで必ず含めるよう指示しているキーワードと、結論で紹介する製品名
+REQUIRED_KEYWORDS = ["手作業", "自動化", "ワークフロー", "DX"]
+PRODUCT_NAME = "FlowSpark"
+STEPS_MIN = 3
+STEPS_MAX = 5
+# セクション冒頭の要約文として認める最大の文字数
+SUMMARY_MAX_CHARS = 100
+# 修正するセクションを、同時にいくつまでモデルに送るか
+MAX_PARALLEL_REPAIRS = 4
+
+# 「##」の見出しでセクションを分ける（「###」以下の小見出しはセクションの中に含める）
+_SECTION_HEADING = re.compile(r"^##\s+(.+?)\s*#*\s*$", re.M)
+_DEFINITION = re.compile(r"[^。！？\n]{1,60}とは[、，,]?[^。？?\n]*[。]")
+_LIST_ITEM = re.compile(r"^\s*\d+[.．)）]\s+\S")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?\s*$")
+_BLOCK_START = ("-", "*", "+", "|", ">", "#", "```")
+
+
+def split_sections(text):
+    # 最初の「##」より前（リード文）を先頭のセクションとし、見出しごとに区切る
+    sections = []
+    starts = [m.start() for m in _SECTION_HEADING.finditer(text)]
+    bounds = [0] + starts + [len(text)]
+    for start, end in zip(bounds, bounds[1:]):
+        body = text[start:end].strip()
+        if not body and start == 0:
+            continue
+        match = _SECTION_HEADING.match(body)
+        sections.append({"heading": match.group(1) if match else None, "text": body})
+    return sections
+
+
+def join_sections(sections):
+    return "\n\n".join(section["text"] for section in sections if section["text"])
+
+
+def _location(sections, index):
+    if index is None:
+        return "記事全体"
+    heading = sections[index]["heading"]
+    return f"「{heading}」" if heading else "冒頭（最初の見出しより前）"
+
+
+def _first_block(section):
+    # 見出しの直後にある最初の段落
+    lines = section["text"].splitlines()
+    if section["heading"] is not None:
+        lines = lines[1:]
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line.strip())
+        elif block:
+            break
+    return block
+
+
+def _step_lists(section):
+    # 番号付きリスト（連続した「1. 」形式の行）ごとの項目数
+    counts = []
+    current = 0
+    for line in section["text"].splitlines():
+        if _LIST_ITEM.match(line):
+            current += 1
+        elif line.strip() and not line.startswith((" ", "\t")):
+            if current:
+                counts.append(current)
+            current = 0
+    if current:
+        counts.append(current)
+    return counts
+
+
+def _tables(section):
+    # 区切り行の直前が見出し行、直後がデータ行になっているMarkdownの表ごとのデータ行数
+    lines = section["text"].splitlines()
+    rows = []
+    for i, line in enumerate(lines):
+        if i and _TABLE_SEPARATOR.match(line) and "|" in lines[i - 1]:
+            count = 0
+            for row in lines[i + 1 :]:
+                if "|" not in row or not row.strip():
+                    break
+                count += 1
+            rows.append(count)
+    return rows
+
+
+def _pick(sections, words, default):
+    # 見出しに words のどれかを含むセクション（なければ default の位置）を選ぶ
+    for index, section in enumerate(sections):
+        if section["heading"] and any(word in section["heading"] for word in words):
+            return index
+    return max(0, min(default, len(sections) - 1))
+
+
+def _check(rule, label, ok, sections, index, detail, instruction):
+    return {
+        "rule": rule,
+        "label": label,
+        "ok": ok,
+        "section": index,
+        "location": _location(sections, index),
+        "detail": detail,
+        # 満たしていない場合に、そのセクションを直させるための指示
+        "instruction": None if ok else instruction,
+    }
+
+
+def validate(text, keywords=()):
+    sections = split_sections(text)
+    if not sections:
+        return []
+    checks = []
+    body_sections = [i for i, s in enumerate(sections) if s["heading"] is not None]
+
+    # 1. 冒頭の「〇〇とは」形式の定義文（最初の見出しより前か、最初のセクションの冒頭）
+    lead = sections[0]
+    lead_text = "\n".join(
+        lead["text"].splitlines()[1:] if lead["heading"] is not None else [lead["text"]]
+    )
+    definition = _DEFINITION.search(lead_text[:400])
+    checks.append(
+        _check(
+            "definition",
+            "「〇〇とは」形式の定義文",
+            definition is not None,
+            sections,
+            0,
+            definition.group(0).strip() if definition else "冒頭に定義文がありません。",
+            "記事の冒頭（見出しの前）に、記事のテーマについて「〇〇とは、…です。」形式の明確な定義文を1文で置いてください。",
+        )
+    )
+
+    # 2. 各セクションの冒頭の1行の要約文
+    for index in body_sections:
+        block = _first_block(sections[index])
+        ok = (
+            len(block) == 1
+            and not block[0].startswith(_BLOCK_START)
+            and not _LIST_ITEM.match(block[0])
+            and len(block[0]) <= SUMMARY_MAX_CHARS
+        )
+        if ok:
+            detail = block[0]
+        elif not block:
+            detail = "見出しの後に本文がありません。"
+        elif len(block) > 1 or len(block[0]) > SUMMARY_MAX_CHARS:
+            detail = "見出し直後の段落が1行の要約になっていません。"
+        else:
+            detail = "見出しの直後が要約文ではなく、リストや表などになっています。"
+        checks.append(
+            _check(
+                "summary",
+                "セクション冒頭の要約文",
+                ok,
+                sections,
+                index,
+                detail,
+                f"見出し行の直後に、このセクションの要点を{SUMMARY_MAX_CHARS}字以内の1行で要約した文を置いてください。",
+            )
+        )
+
+    # 3. 3〜5ステップの具体的な手順
+    lists = [(i, count) for i, s in enumerate(sections) for count in _step_lists(s)]
+    steps = [(i, count) for i, count in lists if STEPS_MIN <= count <= STEPS_MAX]
+    if steps:
+        index, count = steps[0]
+        detail = f"{count}ステップの手順があります。"
+    elif lists:
+        index, count = lists[0]
+        detail = f"番号付きリストが{count}項目です（{STEPS_MIN}〜{STEPS_MAX}ステップが必要です）。"
+    else:
+        index = _pick(sections, ("解決", "方法", "手順", "ステップ"), len(sections) - 2)
+        detail = "番号付きリストの手順がありません。"
+    checks.append(
+        _check(
+            "steps",
+            f"{STEPS_MIN}〜{STEPS_MAX}ステップの具体的な手順",
+            bool(steps),
+            sections,
+            index,
+            detail,
+            f"このセクションに、具体的な手順を{STEPS_MIN}〜{STEPS_MAX}ステップの番号付きリスト（1. 2. 3. …）で記載してください（既存の番号付きリストがあれば、その項目数を整えてください）。",
+        )
+    )
+
+    # 4. 比較表
+    tables = [(i, rows) for i, s in enumerate(sections) for rows in _tables(s)]
+    comparison = [(i, rows) for i, rows in tables if rows >= 2]
+    if comparison:
+        index, rows = comparison[0]
+        detail = f"{rows}行の表があります。"
+    else:
+        index = _pick(sections, ("課題", "比較", "違い"), 1)
+        detail = "2行以上のMarkdownの表がありません。"
+    checks.append(
+        _check(
+            "table",
+            "比較表",
+            bool(comparison),
+            sections,
+            index,
+            detail,
+            "このセクションに、比較表（導入前/導入後、手動/自動化など）をMarkdownの表で記載してください。",
+        )
+    )
+
+    # 5. 必須キーワードと、テーマとして指定されたキーワード
+    longest = max(range(len(sections)), key=lambda i: len(sections[i]["text"]))
+    for rule, label, words in (
+        ("keywords", "必須キーワード", REQUIRED_KEYWORDS),
+        ("theme_keywords", "テーマのキーワード", [k for k in keywords if k]),
+    ):
+        if not words:
+            continue
+        missing = [word for word in words if word not in text]
+        checks.append(
+            _check(
+                rule,
+                label,
+                not missing,
+                sections,
+                None if not missing else longest,
+                f"不足: {'、'.join(missing)}" if missing else "すべて含まれています。",
+                f"次のキーワードを、文脈に合う形で自然に含めてください: {'、'.join(missing)}",
+            )
+        )
+
+    # 6. 結論での製品紹介
+    last = body_sections[-1] if body_sections else len(sections) - 1
+    mentioned = PRODUCT_NAME in sections[last]["text"]
+    checks.append(
+        _check(
+            "product",
+            f"結論での『{PRODUCT_NAME}』の紹介",
+            mentioned,
+            sections,
+            last,
+            "紹介されています。"
+            if mentioned
+            else "最後のセクションで紹介されていません。",
+            f"このセクションの締めくくりで、「業務の仕組み化・自動化」をプログラミング知識なしで実現できる解決策として、当社のノーコードツール『{PRODUCT_NAME}』を自然な形で紹介してください。",
+        )
+    )
+    return checks
+
+
+def failing(checks):
+    return [check for check in checks if not check["ok"]]
+
+
+def _repair_section(model, title, section, instructions, use_cache):
+    prompt = prompts.build_section_repair_prompt(title, section["text"], instructions)
+    text = llm.generate_text(model, prompt, use_cache=use_cache, kind="article_repair")
+    text = text.strip()
+    # 見出しを落として返してきた場合は、元の見出し行を付け直す
+    heading_line = section["text"].splitlines()[0]
+    if section["heading"] is not None and not _SECTION_HEADING.search(text):
+        text = f"{heading_line}\n{text}"
+    return text
+
+
+def repair(model, text, checks, title="", use_cache=True):
+    # 満たしていない要件をセクションごとにまとめ、そのセクションだけを直させて元の位置に戻す
+    # 戻り値は (修正後の本文, 修正したセクションの見出しなど場所の一覧)
+    sections = split_sections(text)
+    instructions = {}
+    for check in failing(checks):
+        if check["instruction"] is not None and check["section"] is not None:
+            instructions.setdefault(check["section"], []).append(check["instruction"])
+    if not instructions:
+        return text, []
+
+    indices = sorted(instructions)
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_PARALLEL_REPAIRS, len(indices))
+    ) as executor:
+        futures = [
+            scheduler.submit(
+                executor,
+                _repair_section,
+                model,
+                title,
+                sections[index],
+                instructions[index],
+                use_cache,
+            )
+            for index in indices
+        ]
+        repaired = [future.result() for future in futures]
+
+    for index, section_text in zip(indices, repaired):
+        sections[index] = {**sections[index], "text": section_text}
+    return join_sections(sections), [_location(sections, index) for index in indices]
+
+
+def render(checks, key):
+    # チェック結果を1つの表で表示する
+    if not checks:
+        st.caption("チェックする本文がありません。")
+        return
+    passed = sum(1 for check in checks if check["ok"])
+    st.caption(f"LLMO要件: {passed}/{len(checks)}項目を満たしています。")
+    st.dataframe(
+        [
+            {
+                "要件": check["label"],
+                "結果": "✓" if check["ok"] else "✗",
+                "場所": check["location"],
+                "詳細": check["detail"],
+            }
+            for check in checks
+        ],
+        hide_index=True,
+        key=key,
+    )
@@ -0,0 +1,522 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+import stub_server
+
+# 複数のセッションが同時にアプリを使ったときの、再実行の処理量・所要時間・サーバーのメモリを測るCLI
+#
+#   python loadtest.py --sessions 8 --rounds 2
+#   python loadtest.py --sessions 16 -o after.json --baseline before.json
+#
+# main.py を streamlit run で別プロセスとして起動し、ブラウザの代わりにWebSocketで接続した
+# セッションから、タイトル生成→記事生成→AI調整→グラウンディング→手動編集をウィジェット操作として送る
+# （AppTestはスクリプトの実行ごとにプロセス全体の状態を差し替えるため、同時に複数は動かせない）
+# モデルはstub_server.pyをこのプロセスで起動し、アプリの接続先をそこに向ける
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(ROOT, "main.py")
+REPORT_PATH = os.path.join(ROOT, "benchmarks", "results", "loadtest.json")
+API_KEY = "stub-api-key"
+
+STEPS = ["open", "titles", "article", "rewrite", "grounding", "edit"]
+# グラウンディング中の状態表示（st.fragmentのrun_every）と同じ間隔で、フラグメントを再実行する
+POLL_INTERVAL_SECONDS = 1.0
+GROUNDING_TIMEOUT_SECONDS = 120
+# サーバーのRSSを記録する間隔
+SAMPLE_INTERVAL_SECONDS = 0.1
+SERVER_START_TIMEOUT_SECONDS = 60
+
+
+class LoadTestError(RuntimeError):
+    pass
+
+
+def rss_bytes(pid):
+    # プロセスの現在のRSS（/procのない環境ではNone）
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, endpoint, session_ttl):
+    # APIキーはsecrets.tomlから読むため、作業ディレクトリに置いてから起動する
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        f.write(f'GEMINI_API_KEY = "{API_KEY}"\n')
+    port = _free_port()
+    env = {
+        **os.environ,
+        "LLMO_GEMINI_ENDPOINT": endpoint,
+        "LLMO_DATA_DIR": os.path.join(workdir, "data"),
+        "LLMO_CACHE_DIR": os.path.join(workdir, "cache"),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            APP_PATH,
+            "--server.headless=true",
+            f"--server.port={port}",
+            f"--server.disconnectedSessionTTL={session_ttl}",
+            "--browser.gatherUsageStats=false",
+        ],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(workdir, "server.log"), "w"),
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise LoadTestError("Streamlitのサーバーが起動できませんでした。")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health")
+            return process, f"ws://127.0.0.1:{port}/_stcore/stream"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise LoadTestError("Streamlitのサーバーの起動を待ちきれませんでした。")
+
+
+class Session:
+    # ブラウザのタブ1つ分。ウィジェットの操作を再実行の要求として送り、描画された要素を覚えておく
+    def __init__(self, index, url, timeout):
+        self.index = index
+        self.url = url
+        self.timeout = timeout
+        self.reruns = 0
+        self.fragment_reruns = 0
+        self.steps = {step: [] for step in STEPS}
+        self.scenarios = []
+        self.errors = []
+        # 要素の位置（delta_path） -> (要素の種類, 要素, フラグメントID)
+        self._elements = {}
+        self._conn = None
+
+    async def connect(self):
+        self._conn = await websocket_connect(self.url, subprotocols=["streamlit"])
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _rerun(self, widget=None, fragment_id=""):
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.query_string = ""
+        if widget is not None:
+            state.widget_states.widgets.append(widget)
+        if fragment_id:
+            state.fragment_id = fragment_id
+            state.is_auto_rerun = True
+            self.fragment_reruns += 1
+        else:
+            self.reruns += 1
+        await self._conn.write_message(msg.SerializeToString(), binary=True)
+        await asyncio.wait_for(self._read_run(), self.timeout)
+
+    async def _read_run(self):
+        # スクリプトの実行が終わるまで読む（st.rerun()で続けて実行される場合は、その終わりまで）
+        while True:
+            data = await self._conn.read_message()
+            if data is None:
+                raise LoadTestError("サーバーとの接続が切れました。")
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session" and not msg.new_session.fragment_ids_this_run:
+                self._elements = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                self._elements[tuple(msg.metadata.delta_path)] = (
+                    element.WhichOneof("type"),
+                    element,
+                    msg.delta.fragment_id,
+                )
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        for element_type, element, _ in self._elements.values():
+            if element_type == "exception":
+                raise LoadTestError(element.exception.message)
+
+    def _find(self, element_type, label=None, key=None):
+        for found_type, element, fragment_id in self._elements.values():
+            if found_type != element_type:
+                continue
+            widget = getattr(element, element_type)
+            if label is not None and not widget.label.startswith(label):
+                continue
+            if key is not None and not widget.id.endswith(f"-{key}"):
+                continue
+            return widget, fragment_id
+        return None, None
+
+    def _widget(self, element_type, label=None, key=None):
+        widget, _ = self._find(element_type, label, key)
+        if widget is None:
+            raise LoadTestError(f"要素が見つかりません: {label or key}")
+        return widget
+
+    async def _click(self, label=None, key=None):
+        state = WidgetState(id=self._widget("button", label, key).id)
+        state.trigger_value = True
+        await self._rerun(state)
+
+    async def _set(self, element_type, value, label=None, key=None):
+        state = WidgetState(id=self._widget(element_type, label, key).id)
+        if isinstance(value, bool):
+            state.bool_value = value
+        else:
+            state.string_value = value
+        await self._rerun(state)
+
+    async def _open(self, round_index):
+        await self._rerun()
+        # 同じ本文に対する呼び出しが応答キャッシュに当たらないよう、キャッシュを使わない設定にする
+        await self._set("checkbox", True, key="generation_bypass_cache")
+
+    async def _titles(self, round_index):
+        await self._set(
+            "text_input", f"DX推進 {self.index}-{round_index}", key="keyword_0"
+        )
+        await self._click("1. タイトル案を")
+        self._widget("radio", "生成されたタイトル案")
+
+    async def _article(self, round_index):
+        await self._click("2. 選択したタイトルで記事を生成する")
+        self._widget("button", "AIで調整する")
+
+    async def _rewrite(self, round_index):
+        if round_index == 0:
+            await self._set("checkbox", True, key="rewrite_bypass_cache")
+        await self._set("text_input", "もっとやさしい表現にしてください", "調整の指示")
+        await self._click("AIで調整する")
+        if self._find("button", "この修正を反映する")[0] is not None:
+            await self._click("この修正を反映する")
+
+    async def _grounding(self, round_index):
+        await self._click("信頼性のある情報を組み込む")
+        deadline = time.monotonic() + GROUNDING_TIMEOUT_SECONDS
+        while True:
+            cancel, fragment_id = self._find("button", key="cancel_grounding")
+            if cancel is None:
+                break
+            if time.monotonic() > deadline:
+                raise LoadTestError("グラウンディングが終わりませんでした。")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            await self._rerun(fragment_id=fragment_id)
+        # 実行中に本文が変わっていた場合は、結果を反映するボタンが出る
+        if self._find("button", "グラウンディング結果を反映する")[0] is not None:
+            await self._click("グラウンディング結果を反映する")
+
+    async def _edit(self, round_index):
+        editor = self._widget("text_area", "ここで自由に編集できます")
+        await self._set(
+            "text_area",
+            editor.default + "\n\n手動で追記した段落です。",
+            "ここで自由に編集できます",
+        )
+        await self._click(key="save_manual_edit")
+
+    async def run_scenario(self, round_index):
+        started = time.perf_counter()
+        # 2回目以降は、開いたままのタブで続けて操作する
+        for step in STEPS if round_index == 0 else STEPS[1:]:
+            step_started = time.perf_counter()
+            try:
+                await getattr(self, f"_{step}")(round_index)
+            except Exception as e:
+                self.errors.append(f"{step}: {type(e).__name__}: {e}")
+                return False
+            self.steps[step].append(time.perf_counter() - step_started)
+        self.scenarios.append(time.perf_counter() - started)
+        return True
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(round(q * (len(values) - 1))))], 4)
+
+
+def _latency(values):
+    return {
+        "count": len(values),
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+        "max": _percentile(values, 1.0),
+    }
+
+
+def _mb(value):
+    return None if value is None else round(value / 1024 / 1024, 1)
+
+
+async def _sample_peak(pid, peak, stop):
+    while not stop.is_set():
+        rss = rss_bytes(pid)
+        if rss is not None:
+            peak[0] = max(peak[0] or 0, rss)
+        await asyncio.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+async def run(url, pid, sessions, rounds, timeout, session_ttl):
+    async def play(session):
+        await session.connect()
+        for round_index in range(rounds):
+            if not await session.run_scenario(round_index):
+                break
+
+    # 最初の1セッションでモジュールの読み込みやキャッシュの作成を済ませ、
+    # そのセッションが破棄された後のRSSを基準にする
+    warmup = Session(-1, url, timeout)
+    await play(warmup)
+    warmup.close()
+    if warmup.errors:
+        raise LoadTestError(f"最初のセッションが失敗しました: {warmup.errors[0]}")
+    await asyncio.sleep(session_ttl + 1)
+    baseline = rss_bytes(pid)
+
+    workers = [Session(index, url, timeout) for index in range(sessions)]
+    peak = [baseline]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_peak(pid, peak, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(play(session) for session in workers))
+    duration = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    # すべてのセッションが接続したままのRSSと、切断して破棄された後も戻らなかったRSS
+    live = rss_bytes(pid)
+    for session in workers:
+        session.close()
+    await asyncio.sleep(session_ttl + 1)
+    after = rss_bytes(pid)
+
+    reruns = sum(session.reruns for session in workers)
+    fragment_reruns = sum(session.fragment_reruns for session in workers)
+    errors = [error for session in workers for error in session.errors]
+    growth = None if live is None or baseline is None else live - baseline
+    retained = None if after is None or baseline is None else after - baseline
+    return {
+        "duration_seconds": round(duration, 3),
+        "reruns": reruns,
+        "fragment_reruns": fragment_reruns,
+        "reruns_per_second": round((reruns + fragment_reruns) / duration, 2),
+        "scenarios": {
+            **_latency([value for session in workers for value in session.scenarios]),
+            "expected": sessions * rounds,
+            "errors": len(errors),
+        },
+        "steps": {
+            step: _latency(
+                [value for session in workers for value in session.steps[step]]
+            )
+            for step in STEPS
+        },
+        "memory_mb": {
+            "baseline": _mb(baseline),
+            "peak": _mb(peak[0]),
+            "live": _mb(live),
+            "after": _mb(after),
+            "per_session": _mb(growth / sessions) if growth is not None else None,
+            "retained": _mb(retained),
+        },
+        "errors": errors[:20],
+    }
+
+
+# 回帰として扱う指標（値が大きいほど悪いもの）
+_TRACKED = [
+    ("scenarios.p95", "シナリオ p95（秒）"),
+    ("memory_mb.per_session", "セッションあたりのRSS増加（MB）"),
+    ("memory_mb.retained", "切断後に残ったRSS（MB）"),
+]
+
+
+def _lookup(report, path):
+    value = report
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for path, label in _TRACKED:
+        current, base = _lookup(report, path), _lookup(baseline, path)
+        if current is not None and base and current > base * tolerance:
+            found.append((label, base, current))
+    # 1秒あたりの再実行回数は、値が小さいほど悪い
+    current = _lookup(report, "reruns_per_second")
+    base = _lookup(baseline, "reruns_per_second")
+    if current is not None and base and current < base / tolerance:
+        found.append(("再実行/秒", base, current))
+    return found
+
+
+def format_report(report, baseline=None):
+    config = report["config"]
+    scenarios = report["scenarios"]
+    memory = report["memory_mb"]
+    lines = [
+        f"セッション数: {config['sessions']}　1セッションあたりの回数: {config['rounds']}",
+        f"所要時間: {report['duration_seconds']}秒　再実行: {report['reruns']}回"
+        f"（フラグメントのみ {report['fragment_reruns']}回）"
+        f"　{report['reruns_per_second']}回/秒",
+        f"シナリオ: {scenarios['count']}/{scenarios['expected']}件完了"
+        f"　p50 {scenarios['p50']}秒　p95 {scenarios['p95']}秒",
+        "",
+        f"{'手順':10} {'回数':>6} {'p50(秒)':>9} {'p95(秒)':>9} {'最大(秒)':>9}",
+    ]
+    for step, summary in report["steps"].items():
+        lines.append(
+            f"{step:10} {summary['count']:>6} {summary['p50']!s:>9}"
+            f" {summary['p95']!s:>9} {summary['max']!s:>9}"
+        )
+    lines += [
+        "",
+        f"サーバーのRSS（MB）: 基準 {memory['baseline']}　最大 {memory['peak']}"
+        f"　接続中 {memory['live']}　切断後 {memory['after']}",
+        f"セッションあたりの増加: {memory['per_session']}MB"
+        f"　切断後に残った増加: {memory['retained']}MB",
+    ]
+    if baseline is not None:
+        lines += ["", f"{'比較':24} {'baseline':>10} {'今回':>10}"]
+        for path, label in [("reruns_per_second", "再実行/秒")] + _TRACKED:
+            lines.append(
+                f"{label:24} {_lookup(baseline, path)!s:>10} {_lookup(report, path)!s:>10}"
+            )
+    for error in report["errors"]:
+        lines.append(f"エラー: {error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="複数セッションでアプリを操作し、処理量とサーバーのメモリを測る"
+    )
+    parser.add_argument(
+        "-n", "--sessions", type=int, default=8, help="同時に操作するセッション数"
+    )
+    parser.add_argument(
+        "-r", "--rounds", type=int, default=1, help="各セッションで操作を繰り返す回数"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="代替サーバーの最初の応答までの秒数"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=2000.0, help="代替サーバーの出力速度"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120.0, help="1回の再実行を待つ最大の秒数"
+    )
+    parser.add_argument(
+        "--session-ttl",
+        type=int,
+        default=2,
+        help="切断したセッションをサーバーが破棄するまでの秒数",
+    )
+    parser.add_argument(
+        "-o", "--output", default=REPORT_PATH, help="結果のJSONの保存先"
+    )
+    parser.add_argument("--baseline", help="比較する以前の結果のJSON")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="baselineに対して何倍までを許容するか",
+    )
+    args = parser.parse_args(argv)
+
+    # 記事・キャッシュの保存先は毎回空のディレクトリにする
+    workdir = tempfile.mkdtemp(prefix="llmo-loadtest-")
+    stub = stub_server.start(
+        config=stub_server.StubConfig(
+            latency=args.latency, tokens_per_second=args.tokens_per_second
+        )
+    )
+    process, url = start_server(workdir, stub_server.endpoint(stub), args.session_ttl)
+    try:
+        result = asyncio.run(
+            run(
+                url,
+                process.pid,
+                args.sessions,
+                args.rounds,
+                args.timeout,
+                args.session_ttl,
+            )
+        )
+    finally:
+        process.terminate()
+        process.wait()
+        stub.shutdown()
+
+    report = {
+        "config": {
+            "sessions": args.sessions,
+            "rounds": args.rounds,
+            "stub": {
+                "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+            },
+        },
+        **result,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"\n結果を {args.output} に保存しました。")
+
+    if report["scenarios"]["errors"]:
+        return 1
+    if baseline is not None:
+        found = regressions(report, baseline, args.tolerance)
+        for label, base, current in found:
+            print(f"REGRESSION {label}: {current} (baseline {base}, x{args.tolerance})")
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
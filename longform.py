@@ -0,0 +1,135 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm
+import prompts
+import scheduler
+
+# この文字数以上の記事は、アウトライン→セクション並列生成で作る
+LONGFORM_THRESHOLD = 2000
+
+SECTION_ROLES = ["導入", "課題の深掘り", "解決の方向性", "結論"]
+# アウトラインに分量の指定がない場合の配分
+DEFAULT_SHARES = {"導入": 0.2, "課題の深掘り": 0.3, "解決の方向性": 0.3, "結論": 0.2}
+
+OUTLINE_CONFIG = {"response_mime_type": "application/json"}
+
+
+def default_outline():
+    return {
+        "definition": "",
+        "sections": [
+            {
+                "role": role,
+                "heading": role,
+                "summary": "",
+                "points": [],
+                "include_steps": role == "解決の方向性",
+                "include_table": role == "課題の深掘り",
+                "share": DEFAULT_SHARES[role],
+            }
+            for role in SECTION_ROLES
+        ],
+    }
+
+
+def normalize_outline(outline):
+    # 必須の4セクションが揃っていない場合は、欠けた役割を既定値で補って順番を固定する
+    fallback = default_outline()
+    by_role = {}
+    for section in outline.get("sections", []):
+        role = section.get("role")
+        if role in SECTION_ROLES and role not in by_role:
+            by_role[role] = section
+
+    sections = []
+    for default in fallback["sections"]:
+        section = dict(default)
+        section.update(by_role.get(default["role"], {}))
+        section["heading"] = section.get("heading") or default["heading"]
+        sections.append(section)
+
+    # 手順と比較表は記事全体でそれぞれ1つは必要
+    if not any(s.get("include_steps") for s in sections):
+        sections[2]["include_steps"] = True
+    if not any(s.get("include_table") for s in sections):
+        sections[1]["include_table"] = True
+
+    return {"definition": outline.get("definition") or "", "sections": sections}
+
+
+def section_budgets(outline, wordcount):
+    shares = []
+    for section in outline["sections"]:
+        try:
+            share = float(section.get("share") or 0)
+        except (TypeError, ValueError):
+            share = 0
+        shares.append(share if share > 0 else DEFAULT_SHARES[section["role"]])
+    total = sum(shares)
+    return [max(50, round(wordcount * share / total / 10) * 10) for share in shares]
+
+
+def generate_outline(
+    model, selected_title, keywords_str, wordcount, summary="", style="", use_cache=True
+):
+    prompt_for_outline = prompts.build_outline_prompt(
+        selected_title, keywords_str, wordcount, summary, style
+    )
+    outline_text = llm.generate_text(
+        model,
+        prompt_for_outline,
+        generation_config=OUTLINE_CONFIG,
+        use_cache=use_cache,
+        kind="article_outline",
+    )
+    try:
+        outline = json.loads(outline_text)
+    except json.JSONDecodeError:
+        outline = {}
+    return normalize_outline(outline)
+
+
+def generate_sections(
+    model,
+    selected_title,
+    keywords_str,
+    outline,
+    wordcount,
+    summary="",
+    style="",
+    use_cache=True,
+    on_section=None,
+):
+    # セクションを並行して生成し、完成した順にon_section(index, text)で知らせる
+    budgets = section_budgets(outline, wordcount)
+    section_prompts = [
+        prompts.build_section_prompt(
+            selected_title, keywords_str, outline, section, budget, summary, style
+        )
+        for section, budget in zip(outline["sections"], budgets)
+    ]
+
+    texts = [None] * len(section_prompts)
+    with ThreadPoolExecutor(
+        max_workers=len(section_prompts), thread_name_prefix="longform-section"
+    ) as executor:
+        futures = {
+            scheduler.submit(
+                executor,
+                llm.generate_text,
+                model,
+                prompt,
+                use_cache=use_cache,
+                kind="article_section",
+            ): index
+            for index, prompt in enumerate(section_prompts)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            texts[index] = future.result().strip()
+            if on_section is not None:
+                on_section(index, texts[index])
+
+    # 記事の順番どおりに結合する
+    return "\n\n".join(texts)
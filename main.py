@@ -2,7 +2,9 @@ import streamlit as st
 
 # 他のファイルから、中身を描画するshow関数をインポート
 import edit
+import gemini_client
 import generation
+import performance
 
 st.set_page_config(page_title="LLMOコンテンツ生成アシスタント", layout="wide")
 st.title("LLMOコンテンツ生成アシスタント")
@@ -13,6 +15,18 @@ tab1, tab2 = st.tabs(["記事生成", "編集・調整"])
 if "article_text" not in st.session_state:
     st.session_state.article_text = ""
 
+# モデル呼び出しの計測結果をサイドバーに表示する
+# （編集タブはst.stop()で途中終了することがあるため、タブより先に描画する）
+with st.sidebar:
+    # 設定されたモデル名が使えるかを確かめる（確かめられない場合はアプリの動作を止めない）
+    try:
+        route_problems = gemini_client.route_problems(gemini_client.get_api_key())
+    except Exception:
+        route_problems = []
+    for kind, model_name, reason in route_problems:
+        st.warning(f"{kind} のモデル {model_name}: {reason}")
+    performance.show()
+
 # 各タブの中で、インポートした関数を呼び出す
 with tab1:
     generation.show()
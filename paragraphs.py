@@ -0,0 +1,33 @@
+import hashlib
+import re
+
+# 記事本文を空行区切りの段落として扱うための共通処理
+_PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
+
+
+def split_paragraphs(text):
+    return [p.strip() for p in _PARAGRAPH_SEPARATOR.split(text) if p.strip()]
+
+
+def paragraph_spans(text):
+    # split_paragraphsと同じ段落の、元の文章での (開始位置, 終了位置) の一覧
+    spans = []
+    start = 0
+    for separator in [*_PARAGRAPH_SEPARATOR.finditer(text), None]:
+        end = separator.start() if separator else len(text)
+        chunk = text[start:end]
+        if chunk.strip():
+            lead = len(chunk) - len(chunk.lstrip())
+            trail = len(chunk) - len(chunk.rstrip())
+            spans.append((start + lead, end - trail))
+        if separator:
+            start = separator.end()
+    return spans
+
+
+def join_paragraphs(paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def paragraph_hash(paragraph):
+    return hashlib.sha1(paragraph.strip().encode("utf-8")).hexdigest()
@@ -0,0 +1,108 @@
+import difflib
+import json
+
+import llm
+import paragraphs
+import prompts
+
+PATCH_CONFIG = {"response_mime_type": "application/json"}
+
+
+class PatchError(ValueError):
+    # 修正案のアンカーが元の文章と一致しない場合など、差分として適用できないとき
+    pass
+
+
+def number_paragraphs(items):
+    return "\n\n".join(f"[{i + 1}]\n{p}" for i, p in enumerate(items))
+
+
+def _normalize(text):
+    return "".join(text.split())
+
+
+def apply_edits(text, edits):
+    # 置き換える段落の範囲だけを元の文章に差し込み、他の段落の空白や空行はそのまま残す
+    spans = paragraphs.paragraph_spans(text)
+    items = [text[start:end] for start, end in spans]
+    replacements = {}
+
+    for edit in edits:
+        anchor = _normalize(edit.get("anchor", ""))
+        if not anchor:
+            raise PatchError("アンカーが空の修正案があります。")
+
+        # 段落番号とアンカーの両方が合っていればそれを使い、番号がずれていればアンカーだけで探す
+        index = edit.get("paragraph")
+        if not (
+            isinstance(index, int)
+            and 1 <= index <= len(items)
+            and _normalize(items[index - 1]).startswith(anchor)
+        ):
+            matches = [
+                i + 1 for i, p in enumerate(items) if _normalize(p).startswith(anchor)
+            ]
+            if len(matches) != 1:
+                raise PatchError(f"アンカーに一致する段落が見つかりません: {anchor}")
+            index = matches[0]
+
+        if index in replacements:
+            raise PatchError(f"段落{index}に対する修正案が重複しています。")
+        replacements[index] = edit.get("replacement", "").strip()
+
+    # 後ろの段落から差し込み、前の段落の位置がずれないようにする
+    kept = [i for i in range(1, len(spans) + 1) if replacements.get(i, True)]
+    last_kept = kept[-1] if kept else 0
+    result = text
+    for index in sorted(replacements, reverse=True):
+        start, end = spans[index - 1]
+        if not replacements[index]:
+            # 削除する段落は、後ろの区切り（以降に残る段落がなければ前の区切り）ごと取り除く
+            if index < last_kept:
+                end = spans[index][0]
+            elif index > 1:
+                start = spans[index - 2][1]
+        result = result[:start] + replacements[index] + result[end:]
+    return result, sorted(replacements)
+
+
+def rewrite(model, text, rewrite_instruction, use_cache=True):
+    # 変更が必要な段落だけを修正案として受け取り、手元で適用する
+    # 修正案が解釈・適用できない場合は、従来どおり全文を書き直してもらう
+    items = paragraphs.split_paragraphs(text)
+    patch_prompt = prompts.build_patch_rewrite_prompt(
+        number_paragraphs(items), rewrite_instruction
+    )
+    try:
+        patch_text = llm.generate_text(
+            model,
+            patch_prompt,
+            generation_config=PATCH_CONFIG,
+            use_cache=use_cache,
+            kind="rewrite_patch",
+        )
+        edits = json.loads(patch_text).get("edits", [])
+        if not isinstance(edits, list) or not edits:
+            raise PatchError("修正案が空でした。")
+        new_text, changed = apply_edits(text, edits)
+        return {"text": new_text, "mode": "patch", "changed_paragraphs": changed}
+    except (PatchError, json.JSONDecodeError, AttributeError, TypeError):
+        pass
+
+    rewrite_prompt = prompts.build_rewrite_prompt(text, rewrite_instruction)
+    new_text = llm.generate_text(
+        model, rewrite_prompt, use_cache=use_cache, kind="rewrite"
+    )
+    return {"text": new_text, "mode": "full", "changed_paragraphs": []}
+
+
+def unified_diff(before, after):
+    return "\n".join(
+        difflib.unified_diff(
+            before.splitlines(),
+            after.splitlines(),
+            fromfile="現在の記事",
+            tofile="修正案",
+            lineterm="",
+        )
+    )
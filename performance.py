@@ -0,0 +1,64 @@
+import os
+
+import streamlit as st
+
+import grounding_jobs
+import response_cache
+import router
+import scheduler
+import telemetry
+
+
+def show():
+    # 環境変数 LLMO_METRICS_PORT があれば、Prometheus形式の /metrics を公開する
+    # 待ち受けるアドレスは LLMO_METRICS_HOST（既定 127.0.0.1）
+    metrics_port = os.environ.get("LLMO_METRICS_PORT")
+    if metrics_port:
+        telemetry.start_metrics_server(
+            metrics_port, os.environ.get("LLMO_METRICS_HOST", "127.0.0.1")
+        )
+
+    with st.expander("パフォーマンス", expanded=False):
+        rows = telemetry.summarize()
+        if not rows:
+            st.caption("まだモデル呼び出しの記録がありません。")
+        else:
+            st.dataframe(rows, hide_index=True)
+
+        stats = response_cache.get_cache().stats()
+        st.caption(
+            f"応答キャッシュ: ヒット率 {stats['hit_rate']:.0%}"
+            f"（メモリ {stats['memory_hits']} / ディスク {stats['disk_hits']} / ミス {stats['misses']}）"
+        )
+        # 種別ごとのモデルの振り分け（ヘッジ・フォールバック）の結果
+        routes = router.summarize()
+        if routes:
+            st.dataframe(routes, hide_index=True)
+
+        # 全セッション共通のスケジューラの、モデルごとの混雑状況
+        lanes = scheduler.stats()
+        if lanes:
+            st.dataframe(
+                [
+                    {
+                        "モデル": lane["model"],
+                        "実行中": lane["in_flight"],
+                        "待ち": lane["waiting"],
+                        "待ちセッション": lane["sessions_waiting"],
+                        "平均待ち時間（秒）": round(lane["avg_wait_seconds"], 2),
+                        "取り消し": lane["cancelled"],
+                        "429": lane["throttled"],
+                    }
+                    for lane in lanes
+                ],
+                hide_index=True,
+            )
+        jobs = grounding_jobs.stats()
+        if jobs["running"] or jobs["queued"]:
+            st.caption(
+                f"グラウンディングのジョブ: 実行中 {jobs['running']}件 / 順番待ち {jobs['queued']}件"
+                f"（同時実行の上限 {jobs['limit']}件）"
+            )
+        st.caption(
+            f"呼び出しログ: `{telemetry.LOG_PATH}`　振り分けログ: `{router.LOG_PATH}`"
+        )
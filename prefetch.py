@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+import scheduler
+
+# 先読みする記事数の上限
+MAX_PREFETCH = 5
+
+
+class ArticlePrefetcher:
+    # タイトル選択中に、上位候補の記事をバックグラウンドで生成しておく
+    # セッションごとにsession_stateへ保持し、入力が変わったら作り直す
+    def __init__(self):
+        self._executor = None
+        self._futures = {}
+        self._cancel = None
+
+    def sync(self, model, prompts_by_title, use_cache=True):
+        # 同じプロンプトの組であれば何もしない（再実行のたびに投げ直さない）
+        prompts = set(prompts_by_title.values())
+        if prompts == set(self._futures):
+            return
+
+        self.cancel()
+        if not prompts:
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(prompts), thread_name_prefix="article-prefetch"
+        )
+        # スケジューラではこのセッションの列に並べ、取り消したときは順番待ちからも外す
+        self._cancel = threading.Event()
+        with scheduler.cancel_on(self._cancel):
+            for prompt in prompts:
+                self._futures[prompt] = scheduler.submit(
+                    self._executor,
+                    llm.generate_text,
+                    model,
+                    prompt,
+                    use_cache=use_cache,
+                    kind="article_prefetch",
+                )
+        # 実行中のものを待たずに、全件が終わった時点でスレッドを解放させる
+        self._executor.shutdown(wait=False)
+
+    def cancel(self):
+        # 未着手のものは取り消し、実行中のものは結果を捨てる
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._cancel is not None:
+            self._cancel.set()
+        self._executor = None
+        self._cancel = None
+        self._futures = {}
+
+    def has(self, prompt):
+        future = self._futures.get(prompt)
+        return future is not None and not future.cancelled()
+
+    def result(self, prompt):
+        # 完了していればすぐに、実行中なら終わるまで待って返す
+        # 失敗していた場合はNoneを返し、呼び出し側で通常の生成にフォールバックさせる
+        future = self._futures.get(prompt)
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def progress(self):
+        done = sum(1 for future in self._futures.values() if future.done())
+        return done, len(self._futures)
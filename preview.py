@@ -0,0 +1,58 @@
+import hashlib
+import re
+
+import streamlit as st
+
+# 編集タブのMarkdownプレビュー
+# 記事を見出しごとのセクションに分け、内容のハッシュをキーにしたコンテナに入れて描画する
+# 各セクションはスクリプトの実行ごとに作り直して送られる（Streamlitでは描画しなかった要素は消えるため、
+# 変更のないセクションを送らずに済ませることはできない）。キーは、上のセクションが増減しても
+# 各セクションと画面上の要素の対応がずれないようにし、折りたたみの開閉状態を保つためのもの
+
+# この文字数以上の記事では、プレビューを既定で手動更新にする
+MANUAL_PREVIEW_THRESHOLD = 5000
+
+# 「#」〜「###」の見出し行の直前でセクションを区切る
+_HEADING = re.compile(r"^#{1,3}\s", re.M)
+
+
+def split_sections(text):
+    starts = [m.start() for m in _HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(text)]
+    sections = (text[start:end].strip() for start, end in zip(bounds, bounds[1:]))
+    return [section for section in sections if section]
+
+
+def section_hash(section):
+    return hashlib.sha1(section.encode("utf-8")).hexdigest()[:16]
+
+
+def section_title(section):
+    first_line = section.splitlines()[0]
+    if _HEADING.match(first_line):
+        return first_line.lstrip("#").strip()
+    return "（見出しなし）"
+
+
+def render(text, key, collapsed=False):
+    sections = split_sections(text)
+    hashes = [section_hash(section) for section in sections]
+
+    # 折りたたみ表示では、前回から変更のあったセクションだけを開いておく
+    previous = set(st.session_state.get(f"{key}_hashes", []))
+    st.session_state[f"{key}_hashes"] = hashes
+
+    occurrences = {}
+    for section, digest in zip(sections, hashes):
+        # 同じ内容のセクションが複数あってもキーが重ならないよう、出現回数を付ける
+        count = occurrences.get(digest, 0)
+        occurrences[digest] = count + 1
+        with st.container(key=f"{key}_{digest}_{count}"):
+            if collapsed:
+                expanded = bool(previous) and digest not in previous
+                with st.expander(section_title(section), expanded=expanded):
+                    st.markdown(section)
+            else:
+                st.markdown(section)
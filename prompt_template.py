@@ -0,0 +1,100 @@
+import os
+import textwrap
+
+# プロンプトを見出し付きのセクションから組み立て、重複やインデントの空白を送らないようにする
+
+# 1回の呼び出しで送る入力トークンの上限（推定値）
+# 超える場合は、概要や文章スタイルなどの省略可能なセクションから切り詰める
+INPUT_TOKEN_BUDGET = int(os.environ.get("LLMO_PROMPT_TOKEN_BUDGET", "8000"))
+
+# 省略可能なセクションを切り詰めるときに残す最低文字数
+MIN_OPTIONAL_CHARS = 200
+TRIM_MARKER = "…（以下省略）"
+
+
+def estimate_tokens(text):
+    # 日本語はおおよそ1文字1トークン、英数字や記号は4文字で1トークンとして数える
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class PromptTemplate:
+    # add() で「# 見出し」「説明文」「---で区切った本文」からなるセクションを積み、build() で1つの文字列にする
+    # 説明文は三重引用符のインデントを取り除き、本文（記事やユーザー入力）はそのまま送る
+    # prefix には呼び出しごとに変わらない前置きを渡す（暗黙のキャッシュで使い回せるよう常に先頭に置く）
+    def __init__(self, prefix="", budget=None):
+        self.prefix = prefix
+        self.budget = INPUT_TOKEN_BUDGET if budget is None else budget
+        self.trimmed = []
+        self._sections = []
+
+    def add(self, header, text="", content=None, optional=False, delimit=False):
+        section = {
+            "header": header,
+            "text": textwrap.dedent(text).strip(),
+            "content": None if content is None else content.strip(),
+            "optional": optional,
+            "delimit": delimit,
+        }
+        # 同じセクションや、すでに含めた本文を繰り返す省略可能なセクションは送らない
+        for existing in self._sections:
+            if (existing["header"], existing["text"], existing["content"]) == (
+                section["header"],
+                section["text"],
+                section["content"],
+            ):
+                return self
+            if (
+                optional
+                and section["content"]
+                and (section["content"] == existing["content"])
+            ):
+                return self
+        self._sections.append(section)
+        return self
+
+    def _render_section(self, section, content):
+        lines = [f"# {section['header']}"]
+        if section["text"]:
+            lines.append(section["text"])
+        if content is not None:
+            if section["delimit"]:
+                lines += ["---", content, "---"]
+            else:
+                lines.append(content)
+        return "\n".join(lines)
+
+    def _render(self, contents):
+        rendered = [
+            self._render_section(section, content)
+            for section, content in zip(self._sections, contents)
+        ]
+        if self.prefix:
+            rendered.insert(0, self.prefix)
+        return "\n\n".join(rendered)
+
+    def build(self):
+        contents = [section["content"] for section in self._sections]
+        prompt = self._render(contents)
+        self.trimmed = []
+
+        # 予算を超えていれば、長い省略可能セクションから順に末尾を切り詰める
+        optional = sorted(
+            (i for i, s in enumerate(self._sections) if s["optional"] and s["content"]),
+            key=lambda i: len(contents[i]),
+            reverse=True,
+        )
+        for i in optional:
+            over = estimate_tokens(prompt) - self.budget
+            if over <= 0:
+                break
+            content = self._sections[i]["content"]
+            length = len(content)
+            while over > 0 and length > MIN_OPTIONAL_CHARS:
+                length = max(MIN_OPTIONAL_CHARS, length - max(over, 1))
+                contents[i] = content[:length] + TRIM_MARKER
+                prompt = self._render(contents)
+                over = estimate_tokens(prompt) - self.budget
+            if contents[i] != content:
+                self.trimmed.append(self._sections[i]["header"])
+        return prompt
@@ -0,0 +1,441 @@
+# タイトル・記事・グラウンディングで使うプロンプトの組み立て
+from prompt_template import PromptTemplate
+
+# 複数のプロンプトで共通して使うセクション
+PERSONA = "あなたは、中堅企業向けにノーコード業務自動化ツールを提供する急成長SaaS企業「CloudFlow Dynamics」の、非常に優秀なコンテンツマーケターです。"
+
+TARGET_READERS = "中堅企業の経理、人事、営業部門のマネージャー層。プログラミングの知識はないが、日々の手作業（Excel、メールのコピペなど）や部署間の非効率な連携に課題を感じています。"
+
+TONE = "専門性を感じさせつつも、難解な言葉は避け、読者に深く共感し、共に課題を解決していくパートナーのような、信頼感と説得力のあるトーンで記述してください。"
+
+NO_HALLUCINATION = (
+    "なお、ハルシネーションを避けるため、事実に基づかない情報は一切含めないこと。"
+)
+
+NO_EXTRA_TEXT = "余計な文章（例：「承知しました」）などは一切含めないでください。"
+
+CITATION_RULES = "引用した場合は、必ず、検索で発見した実在する情報源を明記または示唆してください。例えば、「example.comによると、...」のような形で記述してください。URLを創作してはいけません。"
+
+
+def _static_prefix(*sections):
+    # 呼び出しごとに変わらないセクションだけで前置きを作る
+    # 各プロンプトはこの前置きから始まるため、Geminiの暗黙のキャッシュで先頭部分が再利用される
+    template = PromptTemplate()
+    for header, text in sections:
+        template.add(header, text)
+    return template.build()
+
+
+TITLE_PREFIX = _static_prefix(
+    ("あなた（AI）の役割", PERSONA),
+    ("ターゲット読者", TARGET_READERS),
+    (
+        "記事の目的",
+        "ターゲット読者が抱えるであろう具体的な業務課題を提示し、解決策への期待感を抱かせることで、記事のクリックを促すこと。",
+    ),
+    (
+        "要件",
+        """
+        - 後述のテーマについて、上記のターゲット読者が「これは自分のための記事だ！」と直感的に感じるような、具体的で課題解決志向のタイトル案を、「生成する数」に指定された数だけ生成してください。
+        - 専門的すぎず、しかし示唆に富んだ表現を心がけてください。
+        - 各タイトル案には、そのタイトルが主に想定する読者の部署と、訴求する業務課題を添えてください。
+        """,
+    ),
+    (
+        "出力形式",
+        """
+        次の形式のJSONのみを出力してください。
+        {
+          "titles": [
+            {
+              "title": "タイトル案（番号や記号を付けない）",
+              "department": "想定する読者の部署（例：経理部、人事部）",
+              "pain_point": "訴求する業務課題（30字程度）"
+            }
+          ]
+        }
+        """,
+    ),
+)
+
+ARTICLE_PREFIX = _static_prefix(
+    ("あなた（AI）の役割", PERSONA),
+    (
+        "記事の最終ゴール",
+        "読者が記事を読み終えた時、自分たちの会社にはびこる非効率な手作業や業務プロセスへの課題意識が最大化され、具体的な解決策として当社の製品に強い興味を持ち、資料請求や無料トライアルを検討したくなる状態を作り出すことです。",
+    ),
+    ("ターゲット読者", TARGET_READERS),
+    ("トーン＆マナー", TONE),
+    (
+        "LLMO最適化要件（重要）",
+        f"""
+        以下の要素を必ず含めてください：
+        1. 冒頭で「〇〇とは」形式の明確な定義文
+        2. 各セクションの冒頭に要約文（1行）を配置
+        3. 具体的な手順を3〜5ステップで記載
+        4. 比較表（導入前/導入後、手動/自動化など）
+        {NO_HALLUCINATION}
+        """,
+    ),
+    (
+        "構造と要件",
+        f"""
+        - 後述の「分量」に沿った、読み応えのある文章を生成してください。
+        - 必ず以下の構造に従ってください。
+        - 導入: ターゲット読者が日常的に体験しているであろう、具体的な「あるある」な課題や非効率な業務風景を描写し、深く共感を得る。
+        - 課題の深掘り: なぜその非効率が生まれるのか、その根本原因（例：情報のサイロ化、属人化など）を分かりやすく解説する。
+        - 解決の方向性: テクノロジーを活用して「業務の仕組み化・自動化」を目指すべきである、という大きな方針を示す。
+        - 結論（自社製品への誘導）: 記事のまとめとして、その「業務の仕組み化・自動化」を、プログラミング知識なしで実現できる具体的な解決策として、当社のノーコードツール『FlowSpark』を自然な形で紹介する。読者が次のアクション（資料請求、無料トライアル）を取りたくなるような、希望に満ちた締めくくりをしてください。
+        - 「手作業」「自動化」「ワークフロー」「DX」といったキーワードを適切に含めてください。
+        - {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+OUTLINE_PREFIX = _static_prefix(
+    ("あなた（AI）の役割", PERSONA),
+    (
+        "命令",
+        """
+        後述のタイトルと分量で記事を書くための、構成案（アウトライン）をJSONで作成してください。
+        各セクションは別々の担当者が並行して執筆するため、セクション間で内容が重複しないよう、各セクションで書くべき論点を具体的に割り振ってください。
+        """,
+    ),
+    (
+        "構造と要件",
+        """
+        - セクションは必ず「導入」「課題の深掘り」「解決の方向性」「結論」の4つをこの順に並べること。
+        - 結論では、当社のノーコードツール『FlowSpark』を解決策として自然に紹介すること。
+        - 記事全体で「〇〇とは」形式の定義文、3〜5ステップの具体的な手順、比較表（導入前/導入後、手動/自動化など）を1つずつ含めること。
+        - 手順と比較表をどのセクションに置くかを決め、該当するセクションの include_steps / include_table を true にすること。
+        """,
+    ),
+    (
+        "出力形式",
+        """
+        次の形式のJSONのみを出力してください。
+        {
+          "definition": "〇〇とは、…（冒頭に置く定義文）",
+          "sections": [
+            {
+              "role": "導入",
+              "heading": "見出し",
+              "summary": "セクション冒頭に置く1行の要約文",
+              "points": ["このセクションで書く論点", "..."],
+              "include_steps": false,
+              "include_table": false,
+              "share": 0.2
+            }
+          ]
+        }
+        share は記事全体に対するそのセクションの分量の割合で、合計が1になるようにしてください。
+        """,
+    ),
+)
+
+SECTION_PREFIX = _static_prefix(
+    ("あなた（AI）の役割", PERSONA),
+    ("ターゲット読者", TARGET_READERS),
+    ("トーン＆マナー", TONE),
+    (
+        "命令",
+        f"""
+        後述の記事のうち、「担当セクション」の1セクションだけを執筆してください。
+        他のセクションは別の担当者が書くため、担当外の内容には踏み込まないでください。
+        {NO_HALLUCINATION}
+        """,
+    ),
+    (
+        "共通の要件",
+        f"""
+        - 「手作業」「自動化」「ワークフロー」「DX」といったキーワードを、自然な範囲で適切に含めてください。
+        - {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+GROUNDING_PREFIX = _static_prefix(
+    (
+        "命令",
+        f"""
+        あなたは、非常に優秀なプロの編集者兼リサーチャーです。
+        以下の「元の文章」の主張の信頼性を高めるため、**Google検索ツールを自律的に使用し、発見した客観的な統計データや事例を引用**してください。
+        {CITATION_RULES}
+        {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+PARTIAL_GROUNDING_PREFIX = _static_prefix(
+    (
+        "命令",
+        f"""
+        あなたは、非常に優秀なプロの編集者兼リサーチャーです。
+        以下の「対象の段落」の主張の信頼性を高めるため、**Google検索ツールを自律的に使用し、発見した客観的な統計データや事例を引用**してください。
+        {CITATION_RULES}
+        「直前の文脈」「直後の文脈」は記事の流れを把握するための参考情報です。出力には含めず、対象の段落の修正版のみを出力してください。
+        {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+FAST_GROUNDING_PREFIX = _static_prefix(
+    (
+        "命令",
+        f"""
+        あなたは、非常に優秀なプロの編集者です。
+        以下の「元の文章」の主張の信頼性を高めるため、「参照できる事実」から内容に合うものを選び、文章に組み込んでください。
+        - 「参照できる事実」にない統計データや事例を新たに加えてはいけません。
+        - 事実を引用するときは、「（出典のタイトル）によると、...」のように出典を示してください。URLを書いてはいけません。
+        - 事実を組み込んだ文の末尾（句点の後）には、使った事実の番号を [F1] のように付けてください。複数使った場合は [F1][F3] のように並べてください。
+        - 見出しや構成は変えず、合う事実がない段落はそのまま残してください。
+        {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+SECTION_REPAIR_PREFIX = _static_prefix(
+    ("あなた（AI）の役割", PERSONA),
+    ("トーン＆マナー", TONE),
+    (
+        "命令",
+        f"""
+        以下の「修正するセクション」は記事の一部です。「修正の指示」を満たすために必要な箇所だけを修正し、セクション全体を出力してください。
+        - 指示に関係のない文章は、一字一句そのまま残してください。
+        - 見出し行がある場合は、そのまま残してください。
+        - 他のセクションの内容は書かないでください。
+        {NO_HALLUCINATION}
+        {NO_EXTRA_TEXT}
+        """,
+    ),
+)
+
+REWRITE_PREFIX = _static_prefix(
+    (
+        "命令",
+        """
+        あなたは、非常に優秀なプロの編集者です。
+        以下の「元の文章」を、「編集指示」に従って、より質の高い文章に修正・再構成してください。
+        元の文章の良い点は活かしつつ、指示に忠実に従ってください。
+        なお、余計な文章は一切含めないこと。
+        """,
+    ),
+)
+
+PATCH_REWRITE_PREFIX = _static_prefix(
+    (
+        "命令",
+        """
+        あなたは、非常に優秀なプロの編集者です。
+        以下の「元の文章」を「編集指示」に従って修正します。ただし、文章全体を書き直すのではなく、指示を満たすために変更が必要な段落だけを選び、その段落の置き換え内容だけを出力してください。
+        変更の必要がない段落は出力に含めないでください。
+        """,
+    ),
+    (
+        "出力形式",
+        """
+        次の形式のJSONのみを出力してください。
+        {
+          "edits": [
+            {
+              "paragraph": 変更する段落の番号,
+              "anchor": "変更する段落の冒頭20文字程度を、元の文章から一字一句そのまま写したもの",
+              "replacement": "その段落を置き換える新しい文章（Markdown。複数段落にする場合は空行で区切る。段落を削除する場合は空文字）"
+            }
+          ]
+        }
+        """,
+    ),
+)
+
+STATIC_PREFIXES = [
+    TITLE_PREFIX,
+    ARTICLE_PREFIX,
+    OUTLINE_PREFIX,
+    SECTION_PREFIX,
+    GROUNDING_PREFIX,
+    PARTIAL_GROUNDING_PREFIX,
+    FAST_GROUNDING_PREFIX,
+    SECTION_REPAIR_PREFIX,
+    REWRITE_PREFIX,
+    PATCH_REWRITE_PREFIX,
+]
+
+
+def split_static_prefix(prompt):
+    # プロンプトを (固定の前置き, 残り) に分ける。前置きがなければ (None, prompt)
+    for prefix in sorted(STATIC_PREFIXES, key=len, reverse=True):
+        if prompt.startswith(prefix + "\n\n"):
+            return prefix, prompt[len(prefix) + 2 :]
+    return None, prompt
+
+
+def _add_summary(template, summary):
+    if summary:
+        template.add(
+            "参考概要",
+            "以下の概要・ストーリーには必ず従い、記事の内容を膨らませる上でも強く参考にすること。",
+            summary,
+            optional=True,
+            delimit=True,
+        )
+
+
+def _add_style(template, style):
+    if style:
+        template.add(
+            "指定文章スタイル",
+            "文章のスタイルは以下の通りにしてください。",
+            style,
+            optional=True,
+            delimit=True,
+        )
+
+
+def build_title_prompt(keywords_str, summary="", count=10, exclude=()):
+    template = PromptTemplate(TITLE_PREFIX)
+    template.add("テーマ", content=keywords_str)
+    _add_summary(template, summary)
+    template.add("生成する数", f"{count}個")
+    if exclude:
+        template.add(
+            "生成済みのタイトル",
+            "以下のタイトル案とは重複しない、切り口の異なる案を生成すること。",
+            "\n".join(f"- {title}" for title in exclude),
+            delimit=True,
+        )
+    return template.build()
+
+
+def build_article_prompt(selected_title, keywords_str, wordcount, summary="", style=""):
+    template = PromptTemplate(ARTICLE_PREFIX)
+    template.add("タイトル", content=selected_title)
+    template.add("テーマ・元のキーワード", content=keywords_str)
+    _add_style(template, style)
+    _add_summary(template, summary)
+    template.add("分量", f"全体で{wordcount}字程度")
+    return template.build()
+
+
+def build_outline_prompt(selected_title, keywords_str, wordcount, summary="", style=""):
+    template = PromptTemplate(OUTLINE_PREFIX)
+    template.add("タイトル", content=selected_title)
+    template.add("テーマ・元のキーワード", content=keywords_str)
+    template.add("分量", f"全体で{wordcount}字程度")
+    _add_summary(template, summary)
+    _add_style(template, style)
+    return template.build()
+
+
+def build_section_prompt(
+    selected_title, keywords_str, outline, section, budget, summary="", style=""
+):
+    template = PromptTemplate(SECTION_PREFIX)
+    template.add("記事のタイトル", content=selected_title)
+    template.add(
+        "記事全体の構成",
+        "\n".join(
+            f"{i + 1}. {s['heading']}（{s['role']}）"
+            for i, s in enumerate(outline["sections"])
+        ),
+    )
+    points = "\n".join(f"  - {point}" for point in section.get("points", []))
+    template.add(
+        "担当セクション",
+        "\n".join(
+            [
+                f"- 見出し: {section['heading']}（{section['role']}）",
+                f"- 分量: {budget}字程度",
+                f"- 冒頭の要約文: {section['summary'] or '（このセクションの要点を1行で書いてください）'}",
+                "- 書くべき論点:",
+                points,
+            ]
+        ),
+    )
+    template.add("テーマ・元のキーワード", content=keywords_str)
+    _add_summary(template, summary)
+    _add_style(template, style)
+
+    requirements = [
+        f"- 「## {section['heading']}」という見出し行から始め、その直後の行に冒頭の要約文を1行で置いてください。"
+    ]
+    if section is outline["sections"][0]:
+        if outline["definition"]:
+            requirements.append(
+                f"- 見出しの前に、次の定義文（「〇〇とは」形式）をそのまま1段落目として置いてください: {outline['definition']}"
+            )
+        else:
+            requirements.append(
+                "- 見出しの前に、記事のテーマについて「〇〇とは」形式の明確な定義文を1段落目として置いてください。"
+            )
+    if section.get("include_steps"):
+        requirements.append(
+            "- 具体的な手順を3〜5ステップの番号付きリストで記載してください。"
+        )
+    if section.get("include_table"):
+        requirements.append(
+            "- 比較表（導入前/導入後、手動/自動化など）をMarkdownの表で記載してください。"
+        )
+    if section["role"] == "結論":
+        requirements.append(
+            "- 「業務の仕組み化・自動化」をプログラミング知識なしで実現できる具体的な解決策として、当社のノーコードツール『FlowSpark』を自然な形で紹介し、資料請求や無料トライアルを取りたくなる希望に満ちた締めくくりにしてください。"
+        )
+    template.add("このセクションの要件", "\n".join(requirements))
+    return template.build()
+
+
+def build_grounding_prompt(article_text):
+    template = PromptTemplate(GROUNDING_PREFIX)
+    template.add("元の文章", content=article_text, delimit=True)
+    return template.build()
+
+
+def build_partial_grounding_prompt(target_text, before_text="", after_text=""):
+    template = PromptTemplate(PARTIAL_GROUNDING_PREFIX)
+    if before_text:
+        template.add("直前の文脈", content=before_text, delimit=True)
+    template.add("対象の段落", content=target_text, delimit=True)
+    if after_text:
+        template.add("直後の文脈", content=after_text, delimit=True)
+    return template.build()
+
+
+def build_fast_grounding_prompt(article_text, facts):
+    # facts は fact_store.FactStore.search() の結果（先頭から [F1], [F2], ... と番号を振る）
+    template = PromptTemplate(FAST_GROUNDING_PREFIX)
+    template.add(
+        "参照できる事実",
+        content="\n".join(
+            f"[F{number}] {fact['text']}（出典: {' / '.join(source['title'] for source in fact['sources'])}）"
+            for number, fact in enumerate(facts, 1)
+        ),
+        delimit=True,
+    )
+    template.add("元の文章", content=article_text, delimit=True)
+    return template.build()
+
+
+def build_section_repair_prompt(selected_title, section_text, instructions):
+    template = PromptTemplate(SECTION_REPAIR_PREFIX)
+    if selected_title:
+        template.add("記事のタイトル", content=selected_title)
+    template.add("修正の指示", content="\n".join(f"- {text}" for text in instructions))
+    template.add("修正するセクション", content=section_text, delimit=True)
+    return template.build()
+
+
+def build_rewrite_prompt(edited_text, rewrite_instruction):
+    template = PromptTemplate(REWRITE_PREFIX)
+    template.add("元の文章", content=edited_text, delimit=True)
+    template.add("編集指示", content=rewrite_instruction, delimit=True)
+    template.add("修正後の文章")
+    return template.build()
+
+
+def build_patch_rewrite_prompt(numbered_paragraphs, rewrite_instruction):
+    template = PromptTemplate(PATCH_REWRITE_PREFIX)
+    template.add(
+        "元の文章（段落ごとに番号付き）", content=numbered_paragraphs, delimit=True
+    )
+    template.add("編集指示", content=rewrite_instruction, delimit=True)
+    return template.build()
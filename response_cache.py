@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# キャッシュの保存先（環境変数で上書き可能）
+CACHE_DIR = os.environ.get("LLMO_CACHE_DIR", ".cache")
+CACHE_DB_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+
+# プロセス内LRUに保持する件数
+MEMORY_MAX_ENTRIES = 128
+# ディスク側の有効期限（秒）と合計サイズの上限（バイト）
+DISK_TTL_SECONDS = 7 * 24 * 60 * 60
+DISK_MAX_BYTES = 50 * 1024 * 1024
+
+
+def normalize_prompt(prompt):
+    # 改行コードと前後の空白だけをそろえる
+    # 行頭の空白はユーザーのMarkdown（リストやコードブロックの字下げ）の一部なので、そのまま残す
+    return prompt.replace("\r\n", "\n").strip()
+
+
+def make_key(model_name, prompt, config=None):
+    # モデル名・正規化済みプロンプト・生成設定の組をキーにする
+    material = json.dumps(
+        {
+            "model": model_name,
+            "prompt": normalize_prompt(prompt),
+            "config": config or {},
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        db_path=CACHE_DB_PATH,
+        memory_max_entries=MEMORY_MAX_ENTRIES,
+        ttl_seconds=DISK_TTL_SECONDS,
+        max_bytes=DISK_MAX_BYTES,
+    ):
+        self.db_path = db_path
+        self.memory_max_entries = memory_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streamlitのスクリプトスレッドは実行ごとに変わるため、ロックで直列化して共有する
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            now = time.time()
+            if key in self._memory:
+                value, created_at = self._memory[key]
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                # ディスク側と同じ有効期限で、メモリ側の古いエントリも使わない
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self._counters["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._remember(key, row[0], row[1])
+            self._counters["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, value):
+        if not value:
+            return
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+            self._remember(key, value, now)
+            self._counters["writes"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            stats["disk_entries"] = count
+            stats["disk_bytes"] = total
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        # 期限切れを削除したうえで、上限を超えていれば最終アクセスが古いものから削除する
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    # 全セッションで共有するプロセス単位のキャッシュ
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
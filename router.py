@@ -0,0 +1,366 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging.handlers import RotatingFileHandler
+
+import scheduler
+import telemetry
+
+# 呼び出し種別（kind）ごとのモデルの振り分け
+# 種別ごとに使うモデルを優先順に並べ、直近の所要時間とエラー率をもとに
+# ・エラー率が許容値を超えたモデルは後回しにして、次のモデルへフォールバックする
+# ・ストリーミングでない呼び出しは、所要時間がその種別のp95を超えたら同じ呼び出しをもう1つ投げ、
+#   先に終わったほうの結果を使う（ヘッジ）
+# 振り分けの結果は routing.jsonl とメモリ上の直近履歴に残す
+
+_FAST_MODELS = ["gemini-2.5-flash-lite", "gemini-2.5-flash"]
+_GROUNDING_MODELS = ["gemini-2.5-pro", "gemini-2.5-flash"]
+ROUTES = {
+    "titles": _FAST_MODELS,
+    "article": _FAST_MODELS,
+    "article_outline": _FAST_MODELS,
+    "article_section": _FAST_MODELS,
+    "article_prefetch": _FAST_MODELS,
+    "rewrite": _FAST_MODELS,
+    "rewrite_patch": _FAST_MODELS,
+    "article_repair": _FAST_MODELS,
+    "grounding": _GROUNDING_MODELS,
+    "grounding_incremental": _GROUNDING_MODELS,
+    # 保存済みの事実を組み込むだけの呼び出し（検索しない）
+    "grounding_fast": _FAST_MODELS,
+}
+# 環境変数で上書きできる（例: {"grounding": ["gemini-2.5-flash"]}）
+ROUTES.update(json.loads(os.environ.get("LLMO_ROUTES", "{}")))
+
+# 所要時間とエラー率を集計する期間（秒）と、判断に使う最小件数
+WINDOW_SECONDS = 300
+MIN_SAMPLES = 10
+# この割合を超えてエラーになっているモデルは後回しにする
+ERROR_BUDGET = 0.25
+
+# ヘッジを投げるまでの待ち時間は、その種別・モデルの所要時間のこの分位点（下限あり）
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SECONDS = 1.0
+# 待っている人がいない呼び出しはヘッジしない
+NO_HEDGE_KINDS = {"article_prefetch"}
+
+LOG_PATH = os.path.join(telemetry.TELEMETRY_DIR, "routing.jsonl")
+RECENT_LIMIT = 1000
+
+# 種別・モデルごとの (時刻, 所要時間, 成功したか)
+_samples = {}
+_recent = deque(maxlen=RECENT_LIMIT)
+_models = {}
+_lock = threading.Lock()
+_logger = None
+# ヘッジのために呼び出しを並行させるスレッド
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="router")
+
+
+def _short(model):
+    return model.split("/")[-1]
+
+
+def primary(kind):
+    return ROUTES[kind][0]
+
+
+def is_fallback(kind, requested, model):
+    # 種別の第一候補（振り分けがなければ要求したモデル）以外のモデルが応答したか
+    return _short(model) != (ROUTES.get(kind) or [_short(requested)])[0]
+
+
+def override(model, kinds=None):
+    # 指定した種別（省略時はグラウンディング以外のすべて）を、1つのモデルだけに固定する
+    for kind in kinds or [k for k in ROUTES if not k.startswith("grounding")]:
+        ROUTES[kind] = [_short(model)]
+
+
+def model_for(model, name):
+    # 呼び出し元のモデルと同じ種類のオブジェクトで、別のモデルを使い回す
+    if _short(model.model_name) == _short(name):
+        return model
+    key = (type(model), _short(name))
+    with _lock:
+        if key not in _models:
+            _models[key] = type(model)(f"models/{_short(name)}")
+        return _models[key]
+
+
+def record(kind, model, duration, ok):
+    now = time.time()
+    with _lock:
+        samples = _samples.setdefault((kind, _short(model)), deque())
+        samples.append((now, duration, ok))
+        while samples and samples[0][0] < now - WINDOW_SECONDS:
+            samples.popleft()
+
+
+def _window(kind, model):
+    now = time.time()
+    with _lock:
+        return [
+            s
+            for s in _samples.get((kind, _short(model)), ())
+            if s[0] >= now - WINDOW_SECONDS
+        ]
+
+
+def error_rate(kind, model):
+    samples = _window(kind, model)
+    if len(samples) < MIN_SAMPLES:
+        return 0.0
+    return sum(1 for s in samples if not s[2]) / len(samples)
+
+
+def latency_quantile(kind, model, q):
+    durations = sorted(s[1] for s in _window(kind, model) if s[2])
+    if len(durations) < MIN_SAMPLES:
+        return None
+    return durations[min(len(durations) - 1, int(round(q * (len(durations) - 1))))]
+
+
+def hedge_delay(kind, model):
+    if kind in NO_HEDGE_KINDS:
+        return None
+    quantile = latency_quantile(kind, model, HEDGE_QUANTILE)
+    if quantile is None:
+        return None
+    return max(HEDGE_MIN_SECONDS, quantile)
+
+
+def candidates(kind, requested):
+    # 優先順のモデル一覧から、エラー率が許容値以内のものを先に並べる
+    models = ROUTES.get(kind) or [_short(requested)]
+    healthy = [m for m in models if error_rate(kind, m) <= ERROR_BUDGET]
+    return healthy + [m for m in models if m not in healthy]
+
+
+def _new_decision(kind, requested):
+    return {
+        "ts": time.time(),
+        "kind": kind,
+        "requested": _short(requested),
+        "candidates": candidates(kind, requested),
+        "errors": [],
+    }
+
+
+def run(kind, requested, attempt, tokens, hedge=True, can_fallback=None):
+    # attempt(model) は (結果, 実際の入力トークン数) を返す1回分の呼び出し
+    # 送信の順番待ちはスケジューラで行い、許可されてからの所要時間を記録する
+    # hedge=False の場合は、attemptを呼び出し元のスレッドでそのまま実行する（画面に描画する場合など）
+    decision = _new_decision(kind, requested)
+    started = time.perf_counter()
+    error = None
+    for index, model in enumerate(decision["candidates"]):
+        try:
+            result, winner = _hedged(kind, model, attempt, tokens, hedge, decision)
+        except scheduler.RequestCancelled:
+            raise
+        except Exception as e:
+            error = e
+            decision["errors"].append(
+                {"model": model, "error": f"{type(e).__name__}: {e}"}
+            )
+            # 途中まで表示済みのストリーミングなどは、別のモデルでやり直さない
+            if can_fallback is not None and not can_fallback():
+                break
+            continue
+        decision.update(model=model, fallback=index > 0, winner=winner)
+        _finish(decision, started, "ok")
+        return result
+    decision.update(model=None, fallback=len(decision["errors"]) > 1, winner=None)
+    _finish(decision, started, "error")
+    raise error
+
+
+def open_stream(kind, requested, open_response, tokens):
+    # ストリーミングのREST呼び出し用。応答が返り始めたレスポンスを返す
+    # スケジューラの枠は response.scheduler_ticket に付けて、読み終えた側で返す
+    decision = _new_decision(kind, requested)
+    started = time.perf_counter()
+    error = None
+    for index, model in enumerate(decision["candidates"]):
+        ticket = scheduler.acquire(model, tokens, kind)
+        opened = time.perf_counter()
+        try:
+            response = open_response(model)
+        except Exception as e:
+            scheduler.release(ticket)
+            if isinstance(e, scheduler.RequestCancelled):
+                raise
+            if scheduler.is_rate_limited(e):
+                scheduler.throttle(model)
+            record(kind, model, time.perf_counter() - opened, False)
+            error = e
+            decision["errors"].append(
+                {"model": model, "error": f"{type(e).__name__}: {e}"}
+            )
+            continue
+        response.scheduler_ticket = ticket
+        decision.update(model=model, fallback=index > 0, winner="primary")
+        _finish(decision, started, "ok")
+        return response
+    decision.update(model=None, fallback=len(decision["errors"]) > 1, winner=None)
+    _finish(decision, started, "error")
+    raise error
+
+
+def _hedged(kind, model, attempt, tokens, hedge, decision):
+    # 最初の呼び出しの順番待ちは呼び出し元のスレッドで行い、待ち順を画面に表示できるようにする
+    ticket = scheduler.acquire(model, tokens, kind)
+    delay = hedge_delay(kind, model) if hedge else None
+    decision["hedge_delay"] = delay
+    decision["hedged"] = False
+    if delay is None:
+        return _call(kind, model, attempt, tokens, ticket), "primary"
+
+    # 呼び出しごとに取り消し用のイベントと枠を持たせ、先に終わったほうが決まったら他方を打ち切る
+    attempts = {}
+
+    def start(name, granted=None):
+        state = {"cancel": threading.Event(), "ticket": granted}
+        future = scheduler.submit(
+            _executor, _cancellable_call, state, kind, model, attempt, tokens
+        )
+        attempts[future] = (name, state)
+
+    start("primary", ticket)
+    done, _ = wait(attempts, timeout=delay)
+    # 送信待ちが出ているときは、ヘッジでさらに混雑させない
+    if not done and not scheduler.is_congested(model):
+        decision["hedged"] = True
+        start("hedge")
+
+    error = None
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            for other in pending:
+                _abandon(other, attempts[other][1])
+            return result, attempts[future][0]
+    raise error
+
+
+def _abandon(future, state):
+    # 負けた呼び出しは、順番待ちなら取り消し、送信済みなら枠を先に返して結果を捨てる
+    # （送信済みのHTTP呼び出しは途中で止められないため、応答が届いた時点で閉じる）
+    state["cancel"].set()
+    future.cancel()
+    if state["ticket"] is not None:
+        scheduler.release(state["ticket"])
+
+
+def _cancellable_call(state, kind, model, attempt, tokens):
+    with scheduler.cancel_on(state["cancel"]):
+        if state["ticket"] is None:
+            state["ticket"] = scheduler.acquire(model, tokens, kind)
+        return _call(kind, model, attempt, tokens, state["ticket"])
+
+
+def _close(result):
+    close = getattr(result, "close", None)
+    if callable(close):
+        close()
+
+
+def _call(kind, model, attempt, tokens, ticket=None):
+    if ticket is None:
+        ticket = scheduler.acquire(model, tokens, kind)
+    started = time.perf_counter()
+    try:
+        scheduler.check_cancelled()
+        result, input_tokens = attempt(model)
+        # 取り消された呼び出しの結果は使わず、モデルの所要時間・エラー率にも数えない
+        if scheduler.cancelled():
+            _close(result)
+            scheduler.check_cancelled()
+    except scheduler.RequestCancelled:
+        raise
+    except Exception as e:
+        if scheduler.cancelled():
+            raise scheduler.RequestCancelled("呼び出しを取り消しました。") from e
+        if scheduler.is_rate_limited(e):
+            scheduler.throttle(model)
+        record(kind, model, time.perf_counter() - started, False)
+        raise
+    finally:
+        scheduler.release(ticket)
+    ticket.report(input_tokens)
+    record(kind, model, time.perf_counter() - started, True)
+    return result
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(telemetry.TELEMETRY_DIR, exist_ok=True)
+        logger = logging.getLogger("llmo.routing")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            LOG_PATH,
+            maxBytes=telemetry.LOG_MAX_BYTES,
+            backupCount=telemetry.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _finish(decision, started, status):
+    decision["status"] = status
+    decision["duration_seconds"] = round(time.perf_counter() - started, 4)
+    with _lock:
+        _recent.append(decision)
+    try:
+        _get_logger().info(json.dumps(decision, ensure_ascii=False))
+    except OSError:
+        # ログが書けなくてもアプリの動作は止めない
+        pass
+
+
+def recent_decisions():
+    with _lock:
+        return list(_recent)
+
+
+def summarize(decisions=None):
+    # 種別ごとの振り分け結果（パフォーマンスパネル用）
+    decisions = recent_decisions() if decisions is None else decisions
+    groups = {}
+    for decision in decisions:
+        groups.setdefault(decision["kind"], []).append(decision)
+
+    rows = []
+    for kind, items in sorted(groups.items()):
+        model = primary(kind) if kind in ROUTES else items[-1]["requested"]
+        p95 = latency_quantile(kind, model, HEDGE_QUANTILE)
+        rows.append(
+            {
+                "種別": kind,
+                "モデル": model,
+                "p95(秒)": None if p95 is None else round(p95, 3),
+                "エラー率": round(error_rate(kind, model), 3),
+                "ヘッジ": sum(1 for d in items if d.get("hedged")),
+                "ヘッジ採用": sum(1 for d in items if d.get("winner") == "hedge"),
+                "フォールバック": sum(
+                    1 for d in items if d.get("fallback") and d["status"] == "ok"
+                ),
+                "失敗": sum(1 for d in items if d["status"] == "error"),
+            }
+        )
+    return rows
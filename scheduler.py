@@ -0,0 +1,383 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# 全セッションで共有するモデル呼び出しのスケジューラ
+# 同じAPIキーを使う全セッションの呼び出しを、モデルごとのレーンで順番待ちさせる
+# 各レーンは1分あたりのリクエスト数・トークン数のトークンバケットと同時実行数の上限を持ち、
+# 待っている呼び出しはセッションごとの列から順番に（ラウンドロビンで）実行する
+
+# モデルごとのレーン設定: (1分あたりのリクエスト数, 1分あたりの入力トークン数, 同時実行数)
+LANES = {
+    "gemini-2.5-flash-lite": (4000, 4_000_000, 16),
+    "gemini-2.5-flash": (1000, 1_000_000, 8),
+    "gemini-2.5-pro": (150, 2_000_000, 4),
+}
+DEFAULT_LANE = (60, 250_000, 4)
+# 環境変数で上書きできる（例: {"gemini-2.5-pro": [5, 250000, 2]}）
+LANES.update(
+    {
+        model: tuple(limits)
+        for model, limits in json.loads(
+            os.environ.get("LLMO_RATE_LIMITS", "{}")
+        ).items()
+    }
+)
+
+# 429が返ったとき、Retry-Afterがなければこの秒数だけレーン全体の送信を止める
+THROTTLE_SECONDS = 10.0
+# 待機中に、順番の表示更新とセッションの生存確認を行う間隔（秒）
+POLL_SECONDS = 0.5
+
+BACKGROUND_SESSION = "background"
+
+_session_var = contextvars.ContextVar("scheduler_session", default=None)
+_on_wait_var = contextvars.ContextVar("scheduler_on_wait", default=None)
+# 呼び出しを取り消すイベントの組（どれかがセットされたら取り消す）
+_cancel_var = contextvars.ContextVar("scheduler_cancel", default=())
+
+
+class RequestCancelled(RuntimeError):
+    pass
+
+
+def _model_key(model):
+    return model.split("/")[-1]
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, amount):
+        # amount を取り出せるようになるまでの秒数（容量を超える量は容量まで丸める）
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class Ticket:
+    def __init__(self, lane, session_id, tokens, kind):
+        self.lane = lane
+        self.session_id = session_id
+        self.tokens = tokens
+        self.kind = kind
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.wait_seconds = 0.0
+
+    def report(self, actual_tokens):
+        # 見積もりと実際の入力トークン数の差を、トークンバケットで精算する
+        if actual_tokens:
+            self.lane.settle(actual_tokens - self.tokens)
+            self.tokens = actual_tokens
+
+
+class Lane:
+    def __init__(self, model, requests_per_minute, tokens_per_minute, concurrency):
+        self.model = model
+        self.concurrency = concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.input_tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.throttled_until = 0.0
+        # セッションID -> 待っているTicketの列。先頭のセッションから順に1件ずつ取り出す
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+        self._counters = {"granted": 0, "cancelled": 0, "throttled": 0}
+        self._wait_total = 0.0
+
+    def acquire(self, session_id, tokens, kind, on_wait=None, is_alive=None):
+        ticket = Ticket(self, session_id, tokens, kind)
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            last_position = None
+            try:
+                while True:
+                    delay = self._dispatch()
+                    if ticket.granted:
+                        break
+                    position = self._position(ticket)
+                    if on_wait is not None and position != last_position:
+                        # 画面の更新はロックを離してから行う（再実行の例外もここで届く）
+                        self._cond.release()
+                        try:
+                            on_wait(position, self.model)
+                        finally:
+                            self._cond.acquire()
+                        last_position = position
+                        continue
+                    if is_alive is not None and not is_alive(session_id):
+                        raise RequestCancelled(
+                            f"セッション {session_id} の呼び出しを取り消しました。"
+                        )
+                    self._cond.wait(min(POLL_SECONDS, delay or POLL_SECONDS))
+            except BaseException:
+                if not ticket.granted:
+                    self._remove(ticket)
+                    self._counters["cancelled"] += 1
+                    self._cond.notify_all()
+                else:
+                    self._release(ticket)
+                raise
+        if on_wait is not None and last_position is not None:
+            on_wait(None, self.model)
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            self._release(ticket)
+
+    def settle(self, difference):
+        with self._cond:
+            self.input_tokens.tokens -= difference
+
+    def throttle(self, seconds):
+        with self._cond:
+            self.throttled_until = max(self.throttled_until, time.monotonic() + seconds)
+            self._counters["throttled"] += 1
+
+    def stats(self):
+        with self._cond:
+            waiting = sum(len(queue) for queue in self._queues.values())
+            granted = self._counters["granted"]
+            return {
+                "model": self.model,
+                "in_flight": self.in_flight,
+                "waiting": waiting,
+                "sessions_waiting": len(self._queues),
+                "avg_wait_seconds": self._wait_total / granted if granted else 0.0,
+                **self._counters,
+            }
+
+    def _release(self, ticket):
+        # ヘッジで負けた呼び出しの枠は先に返すため、同じTicketを2回返しても1回分だけ減らす
+        if ticket.released:
+            return
+        ticket.released = True
+        self.in_flight -= 1
+        self._cond.notify_all()
+
+    def _remove(self, ticket):
+        queue = self._queues.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.session_id]
+
+    def _dispatch(self):
+        # 送信できる限り、セッションを順番に回って先頭のTicketを許可する
+        # 許可できないときは、次に送信できるまでのおおよその秒数を返す
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.input_tokens.refill(now)
+        while self._queues:
+            if now < self.throttled_until:
+                return self.throttled_until - now
+            if self.in_flight >= self.concurrency:
+                return None
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            delay = max(
+                self.requests.wait_seconds(1),
+                self.input_tokens.wait_seconds(ticket.tokens),
+            )
+            if delay > 0:
+                return delay
+
+            queue.popleft()
+            # 許可したセッションは列の最後に回し、他のセッションを先に進める
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            self.requests.tokens -= 1
+            self.input_tokens.tokens -= min(ticket.tokens, self.input_tokens.capacity)
+            self.in_flight += 1
+            ticket.granted = True
+            ticket.wait_seconds = now - ticket.enqueued_at
+            self._wait_total += ticket.wait_seconds
+            self._counters["granted"] += 1
+            self._cond.notify_all()
+        return None
+
+    def _position(self, ticket):
+        # ラウンドロビンで何番目に許可されるか（1始まり）
+        queue = self._queues[ticket.session_id]
+        depth = queue.index(ticket)
+        position = 0
+        for session_id, other in self._queues.items():
+            if session_id == ticket.session_id:
+                position += depth + 1
+                break
+            position += min(len(other), depth + 1)
+        for session_id, other in reversed(self._queues.items()):
+            if session_id == ticket.session_id:
+                break
+            position += min(len(other), depth)
+        return position
+
+
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+
+def get_lane(model):
+    key = _model_key(model)
+    with _lanes_lock:
+        lane = _lanes.get(key)
+        if lane is None:
+            lane = Lane(key, *LANES.get(key, DEFAULT_LANE))
+            _lanes[key] = lane
+        return lane
+
+
+def current_session():
+    # スケジューラ用に設定されたセッションか、Streamlitのスクリプトスレッドのセッション
+    session_id = _session_var.get()
+    if session_id is not None:
+        return session_id
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return BACKGROUND_SESSION
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else BACKGROUND_SESSION
+
+
+def _is_alive(session_id):
+    if session_id == BACKGROUND_SESSION:
+        return True
+    from streamlit import runtime
+
+    if not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(session_id)
+
+
+def cancelled():
+    # この呼び出しの取り消しが要求されているか
+    return any(event.is_set() for event in _cancel_var.get())
+
+
+def check_cancelled():
+    if cancelled():
+        raise RequestCancelled("呼び出しを取り消しました。")
+
+
+def acquire(model, tokens, kind="other"):
+    # 送信してよくなるまで待ち、許可されたTicketを返す。終わったらrelease()を呼ぶこと
+    cancel_events = _cancel_var.get()
+
+    def is_alive(session_id):
+        if any(event.is_set() for event in cancel_events):
+            return False
+        return _is_alive(session_id)
+
+    return get_lane(model).acquire(
+        current_session(),
+        tokens,
+        kind,
+        on_wait=_on_wait_var.get(),
+        is_alive=is_alive,
+    )
+
+
+def release(ticket):
+    ticket.lane.release(ticket)
+
+
+@contextlib.contextmanager
+def slot(model, tokens, kind="other"):
+    ticket = acquire(model, tokens, kind)
+    try:
+        yield ticket
+    except Exception as e:
+        if is_rate_limited(e):
+            throttle(model)
+        raise
+    finally:
+        release(ticket)
+
+
+def is_congested(model):
+    # 送信待ちの呼び出しがあるか
+    return get_lane(model).stats()["waiting"] > 0
+
+
+def throttle(model, seconds=None):
+    # 429を受けたレーンは、しばらく全セッションからの送信を止める
+    get_lane(model).throttle(THROTTLE_SECONDS if seconds is None else seconds)
+
+
+def is_rate_limited(error):
+    # SDK（google.api_core）とrequestsの両方の例外から、429かを判定する
+    status = getattr(error, "code", None)
+    response = getattr(error, "response", None)
+    if response is not None:
+        status = getattr(response, "status_code", status)
+    return status == 429
+
+
+def submit(executor, fn, *args, **kwargs):
+    # ワーカースレッドでの呼び出しも、呼び出し元と同じセッションの列に並べる
+    # （画面への順番表示はスクリプトスレッドでしかできないため、引き継がない）
+    session_id = current_session()
+    cancel_events = _cancel_var.get()
+
+    def run():
+        _session_var.set(session_id)
+        _cancel_var.set(cancel_events)
+        return fn(*args, **kwargs)
+
+    return executor.submit(contextvars.Context().run, run)
+
+
+@contextlib.contextmanager
+def cancel_on(event):
+    # この中から投げた呼び出しは、eventがセットされると順番待ちの途中で取り消される
+    # 外側のcancel_onのイベントも引き続き有効
+    token = _cancel_var.set(_cancel_var.get() + (event,))
+    try:
+        yield
+    finally:
+        _cancel_var.reset(token)
+
+
+@contextlib.contextmanager
+def queue_status():
+    # この中のモデル呼び出しが順番待ちになったら、その順番を画面に表示する
+    import streamlit as st
+
+    placeholder = st.empty()
+
+    def show(position, model):
+        if position is None:
+            placeholder.empty()
+        else:
+            placeholder.caption(
+                f"API呼び出しが混み合っているため順番待ちしています（{model}: {position}番目）"
+            )
+
+    token = _on_wait_var.set(show)
+    try:
+        yield
+    finally:
+        _on_wait_var.reset(token)
+        placeholder.empty()
+
+
+def stats():
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+    return [lane.stats() for lane in lanes]
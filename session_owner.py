@@ -0,0 +1,32 @@
+import re
+import secrets
+
+import streamlit as st
+
+# 保存した記事の所有者
+# ログイン（st.login）を設定している場合はログイン中のユーザー、設定していない場合は
+# ブラウザごとに発行したID（URLの ?owner= に保持し、再読み込みしても同じ記事を開けるようにする）を使う
+# IDを含むURLを共有すると、共有された側からも同じ記事を開ける
+
+QUERY_PARAM = "owner"
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{22,64}$")
+
+
+def current():
+    try:
+        if st.user.is_logged_in:
+            return f"user:{st.user.get('email') or st.user.get('sub')}"
+    except Exception:
+        # 認証を設定していない環境では、ブラウザごとのIDを使う
+        pass
+
+    owner_id = st.session_state.get("owner_id")
+    if owner_id is None:
+        requested = st.query_params.get(QUERY_PARAM, "")
+        owner_id = (
+            requested if _VALID_ID.match(requested) else secrets.token_urlsafe(16)
+        )
+        st.session_state["owner_id"] = owner_id
+    if st.query_params.get(QUERY_PARAM) != owner_id:
+        st.query_params[QUERY_PARAM] = owner_id
+    return f"browser:{owner_id}"
@@ -0,0 +1,463 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Gemini APIの代わりにローカルで応答する検証用サーバー
+#
+#   python stub_server.py --port 8765 --latency 0.3 --tokens-per-second 200
+#   LLMO_GEMINI_ENDPOINT=http://127.0.0.1:8765 streamlit run main.py
+#
+# generateContent / streamGenerateContent（SSEとJSON配列の両方）と、googleSearchツール指定時の
+# groundingMetadataを返す。応答までの待ち時間・出力速度・エラー注入を設定できる。
+
+STUB_MODELS = [
+    "models/gemini-2.5-flash-lite",
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro",
+]
+
+# 1チャンクあたりの文字数（ストリーミング時）
+CHUNK_CHARS = 40
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency=0.0,
+        tokens_per_second=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=None,
+        tail_rate=0.0,
+        tail_latency=0.0,
+        failing_models=(),
+    ):
+        # latency: 最初のトークンまでの秒数 / tokens_per_second: 0なら待たずに全量を返す
+        # tail_rate / tail_latency: この割合の呼び出しだけ、最初の応答をさらに遅らせる
+        # failing_models: 常にエラーを返すモデル（フォールバックの確認用）
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.failing_models = set(failing_models)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    # 日本語が中心なので、おおよそ2文字で1トークンとして数える
+    return max(1, len(text) // 2)
+
+
+def _prompt_text(body):
+    texts = []
+    system = body.get("systemInstruction") or body.get("system_instruction") or {}
+    for part in system.get("parts", []):
+        texts.append(part.get("text", ""))
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            texts.append(part.get("text", ""))
+    return "\n".join(texts)
+
+
+def _section_after(prompt, header):
+    # 「# 元の文章\n---\n本文」のような見出し付きブロックの本文を取り出す
+    match = re.search(
+        rf"#\s*{re.escape(header)}\s*\n\s*-{{3}}\s*\n(.*?)(?:\n\s*-{{3}}\s*\n|\n\s*#\s|\Z)",
+        prompt,
+        re.S,
+    )
+    if not match:
+        return ""
+    lines = [line.strip() for line in match.group(1).strip().splitlines()]
+    return "\n".join(lines).strip()
+
+
+def _wordcount(prompt, default=400):
+    match = re.search(r"(\d+)字程度", prompt)
+    return int(match.group(1)) if match else default
+
+
+def _article(wordcount):
+    blocks = [
+        "業務自動化とは、手作業で行っていた定型業務をツールに任せ、人が判断の仕事に集中できるようにする取り組みです。",
+        "## 導入\n毎月の締め作業が、Excelとメールのコピペで埋まっていませんか。",
+        "## 課題の深掘り\n非効率の根本原因は、情報のサイロ化と業務の属人化です。",
+        "| 項目 | 手作業 | 自動化 |\n| --- | --- | --- |\n| 処理時間 | 3日 | 半日 |\n| ミス | 多い | 少ない |",
+        "## 解決の方向性\nワークフローを仕組み化し、DXを小さく始めることが近道です。",
+        "1. 現状の業務を洗い出す\n2. 自動化する範囲を決める\n3. ノーコードツールで試す\n4. 効果を測定して広げる",
+        "## 結論\nFlowSparkなら、プログラミング知識なしで業務の自動化を始められます。",
+    ]
+    text = "\n\n".join(blocks)
+    filler = "現場の手作業を減らし、自動化されたワークフローで本来の仕事に時間を使いましょう。"
+    while len(text) < wordcount:
+        text += "\n\n" + filler
+    return text
+
+
+def _json_response(prompt):
+    if "# 生成する数" in prompt:
+        count = int(re.search(r"#\s*生成する数\s*\n(\d+)個", prompt).group(1))
+        # 生成済みのタイトルが渡された場合は、その続きの番号で作る
+        offset = len(re.findall(r"^- .+その\d+$", prompt, re.M))
+        departments = ["経理部", "人事部", "営業部", "総務部"]
+        return json.dumps(
+            {
+                "titles": [
+                    {
+                        "title": f"手作業から解放される業務自動化のはじめ方 その{i}",
+                        "department": departments[i % len(departments)],
+                        "pain_point": "毎月の定型業務に時間を取られている",
+                    }
+                    for i in range(offset + 1, offset + count + 1)
+                ]
+            },
+            ensure_ascii=False,
+        )
+    if "アウトライン" in prompt:
+        roles = ["導入", "課題の深掘り", "解決の方向性", "結論"]
+        return json.dumps(
+            {
+                "definition": "業務自動化とは、定型業務をツールに任せる取り組みです。",
+                "sections": [
+                    {
+                        "role": role,
+                        "heading": role,
+                        "summary": f"{role}の要約です。",
+                        "points": [f"{role}の論点"],
+                        "include_steps": role == "解決の方向性",
+                        "include_table": role == "課題の深掘り",
+                        "share": 0.25,
+                    }
+                    for role in roles
+                ],
+            },
+            ensure_ascii=False,
+        )
+    if "段落ごとに番号付き" in prompt:
+        match = re.search(r"\[1\]\n(.+)", prompt)
+        anchor = match.group(1).strip()[:20] if match else ""
+        return json.dumps(
+            {
+                "edits": [
+                    {
+                        "paragraph": 1,
+                        "anchor": anchor,
+                        "replacement": anchor + "（指示に従って調整しました）",
+                    }
+                ]
+            },
+            ensure_ascii=False,
+        )
+    return "{}"
+
+
+def _grounded(prompt):
+    source = _section_after(prompt, "対象の段落") or _section_after(prompt, "元の文章")
+    if not source:
+        source = "生成AIの業務活用は、多くの企業で検討が進んでいます。"
+    chunks = [
+        {"web": {"uri": "https://example.com/report", "title": "example.com"}},
+        {"web": {"uri": "https://example.org/survey", "title": "example.org"}},
+    ]
+    supports = []
+    paragraphs = [p for p in source.split("\n\n") if p.strip()]
+    out = []
+    for i, paragraph in enumerate(paragraphs):
+        cited = paragraph
+        if not paragraph.startswith(("#", "|")):
+            cited = (
+                paragraph + "（example.comによると、同様の傾向が報告されています。）"
+            )
+            supports.append(
+                {
+                    "segment": {"text": cited},
+                    "groundingChunkIndices": [i % len(chunks)],
+                }
+            )
+        out.append(cited)
+    meta = {
+        "webSearchQueries": ["業務自動化 統計", "ノーコード 導入効果"],
+        "groundingChunks": chunks,
+        "groundingSupports": supports,
+    }
+    return "\n\n".join(out), meta
+
+
+def _fast_grounded(prompt):
+    # 保存済みの事実を組み込む呼び出し: 見出し以外の段落に、事実の番号付きの一文を足す
+    source = _section_after(prompt, "元の文章")
+    facts = re.findall(r"\[F(\d+)\]", _section_after(prompt, "参照できる事実"))
+    out = []
+    for i, paragraph in enumerate(p for p in source.split("\n\n") if p.strip()):
+        if facts and not paragraph.startswith(("#", "|")):
+            paragraph += f"（example.comによると、同様の傾向が報告されています。）[F{facts[i % len(facts)]}]"
+        out.append(paragraph)
+    return "\n\n".join(out)
+
+
+def _repaired(prompt):
+    # セクションの修正: 指示の内容に応じて、定型の文や表をセクションに足す
+    section = _section_after(prompt, "修正するセクション").removesuffix("---").strip()
+    match = re.search(r"#\s*修正の指示\s*\n(.*?)(?:\n\s*#\s|\Z)", prompt, re.S)
+    instructions = match.group(1) if match else ""
+    lines = section.splitlines()
+    heading = lines[:1] if lines and lines[0].startswith("## ") else []
+    body = "\n".join(lines[len(heading) :]).strip()
+    if "要約した文" in instructions:
+        body = "このセクションの要点をまとめます。\n\n" + body
+    if "定義文" in instructions:
+        body = "業務自動化とは、定型業務をツールに任せる取り組みです。\n\n" + body
+    if "番号付きリスト" in instructions:
+        body += "\n\n1. 業務を洗い出す\n2. 範囲を決める\n3. ツールで試す"
+    if "比較表" in instructions:
+        body += "\n\n| 項目 | 手作業 | 自動化 |\n| --- | --- | --- |\n| 処理時間 | 3日 | 半日 |\n| ミス | 多い | 少ない |"
+    for words in re.findall(r"含めてください: (.+)", instructions):
+        body += f"\n\n{words.strip()}を意識して進めましょう。"
+    if "FlowSpark" in instructions:
+        body += "\n\nFlowSparkなら、プログラミング知識なしで始められます。"
+    return "\n".join(heading + [body])
+
+
+def build_response(body):
+    # リクエストの内容から、それらしい応答テキストとgroundingMetadataを作る
+    prompt = _prompt_text(body)
+    config = body.get("generationConfig") or body.get("generation_config") or {}
+    mime_type = config.get("responseMimeType") or config.get("response_mime_type")
+    tools = body.get("tools") or []
+    grounding = any("googleSearch" in tool or "google_search" in tool for tool in tools)
+
+    meta = None
+    if grounding:
+        text, meta = _grounded(prompt)
+    elif mime_type == "application/json":
+        text = _json_response(prompt)
+    elif "# 参照できる事実" in prompt:
+        text = _fast_grounded(prompt)
+    elif "# 修正するセクション" in prompt:
+        text = _repaired(prompt)
+    elif "修正後の文章" in prompt:
+        text = _section_after(prompt, "元の文章") + "\n\n（指示に従って調整しました）"
+    else:
+        text = _article(_wordcount(prompt))
+    return text, meta, estimate_tokens(prompt)
+
+
+def _chunk_json(text, meta=None, finish=False, prompt_tokens=0, output_tokens=0):
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+        if meta:
+            candidate["groundingMetadata"] = meta
+    chunk = {"candidates": [candidate]}
+    if finish:
+        chunk["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+    return chunk
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        if self.headers.get("Content-Encoding") == "gzip":
+            import gzip
+
+            raw = gzip.decompress(raw)
+        return json.loads(raw or b"{}")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.rstrip("/").endswith("/models"):
+            models = [
+                {
+                    "name": name,
+                    "displayName": name.split("/")[-1],
+                    "supportedGenerationMethods": [
+                        "generateContent",
+                        "countTokens",
+                        "createCachedContent",
+                    ],
+                    "inputTokenLimit": 1048576,
+                    "outputTokenLimit": 65536,
+                }
+                for name in STUB_MODELS
+            ]
+            self._send_json(200, {"models": models})
+            return
+        self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        match = re.search(r"/models/([^/:]+):(\w+)$", parsed.path)
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+            return
+        model, method = match.groups()
+        body = self._read_body()
+        config = self.config
+
+        with config.lock:
+            config.requests += 1
+            fail = config.random.random() < config.error_rate
+            slow = config.random.random() < config.tail_rate
+        fail = fail or model in config.failing_models
+        if fail:
+            self.send_response(config.error_status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", "0")
+            payload = json.dumps(
+                {"error": {"code": config.error_status, "message": "injected error"}}
+            ).encode()
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        text, meta, prompt_tokens = build_response(body)
+        output_tokens = estimate_tokens(text)
+        if config.latency:
+            time.sleep(config.latency)
+        if slow:
+            time.sleep(config.tail_latency)
+
+        if method == "generateContent":
+            if config.tokens_per_second:
+                time.sleep(output_tokens / config.tokens_per_second)
+            self._send_json(
+                200,
+                _chunk_json(text, meta, True, prompt_tokens, output_tokens),
+            )
+        elif method == "streamGenerateContent":
+            sse = parse_qs(parsed.query).get("alt", [""])[0] == "sse"
+            self._stream(text, meta, prompt_tokens, output_tokens, sse)
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": method}})
+
+    def _stream(self, text, meta, prompt_tokens, output_tokens, sse):
+        # SSE（REST呼び出し）と、SDKのRESTトランスポートが読むJSON配列の両方に対応する
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", "text/event-stream" if sse else "application/json"
+        )
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        pieces = [text[i : i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+        pieces = pieces or [""]
+        delay = 0.0
+        if self.config.tokens_per_second:
+            delay = estimate_tokens(pieces[0]) / self.config.tokens_per_second
+
+        def write(data):
+            raw = data.encode("utf-8")
+            self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+
+        if not sse:
+            write("[")
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = _chunk_json(piece, meta, last, prompt_tokens, output_tokens)
+            data = json.dumps(chunk, ensure_ascii=False)
+            if sse:
+                write(f"data: {data}\r\n\r\n")
+            else:
+                write(("," if i else "") + data)
+            if delay and not last:
+                time.sleep(delay)
+        if not sse:
+            write("]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start(host="127.0.0.1", port=0, config=None):
+    # テストやベンチマークから、別スレッドでサーバーを起動する
+    handler = type("ConfiguredStubHandler", (StubHandler,), {})
+    handler.config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def endpoint(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gemini APIのローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", type=float, default=0.3, help="最初の応答までの秒数"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=200.0, help="出力速度（0で即時）"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="エラーを返す割合（0〜1）"
+    )
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--tail-rate", type=float, default=0.0, help="応答を遅らせる呼び出しの割合"
+    )
+    parser.add_argument(
+        "--tail-latency", type=float, default=0.0, help="遅らせる場合に追加する秒数"
+    )
+    parser.add_argument(
+        "--failing-models",
+        default="",
+        help="常にエラーを返すモデル（カンマ区切り、例: gemini-2.5-pro）",
+    )
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        args.latency,
+        args.tokens_per_second,
+        args.error_rate,
+        args.error_status,
+        args.seed,
+        args.tail_rate,
+        args.tail_latency,
+        [model for model in args.failing_models.split(",") if model],
+    )
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"stub server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# 各モデル呼び出しの計測結果を、ローカルのJSONLとメモリ上の直近履歴に残す
+TELEMETRY_DIR = os.environ.get(
+    "LLMO_TELEMETRY_DIR",
+    os.path.join(os.environ.get("LLMO_CACHE_DIR", ".cache"), "telemetry"),
+)
+LOG_PATH = os.path.join(TELEMETRY_DIR, "llm_calls.jsonl")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# パネルや集計で参照する直近の呼び出し件数
+RECENT_LIMIT = 1000
+
+# 100万トークンあたりの料金（USD、入力/出力）。料金改定時はここを更新する
+PRICES_PER_MILLION_TOKENS = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+# 暗黙のキャッシュから読まれた入力トークンは、通常の入力料金のこの割合で課金される
+# （キャッシュの保存料金は呼び出しごとの見積もりには含めない）
+CACHED_INPUT_PRICE_RATIO = 0.25
+
+_recent = deque(maxlen=RECENT_LIMIT)
+# Prometheus用に、プロセス起動からの累計をラベルの組ごとに持つ
+_totals = {}
+_lock = threading.Lock()
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(TELEMETRY_DIR, exist_ok=True)
+        logger = logging.getLogger("llmo.telemetry")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            LOG_PATH,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def short_model_name(model):
+    return model.split("/")[-1]
+
+
+def estimate_cost(model, input_tokens, output_tokens, cached_tokens=0):
+    prices = PRICES_PER_MILLION_TOKENS.get(short_model_name(model))
+    if prices is None:
+        return None
+    billed_input = input_tokens - cached_tokens * (1 - CACHED_INPUT_PRICE_RATIO)
+    return (billed_input * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+class Call:
+    # 1回のモデル呼び出しの計測値。trackの中で呼び出し側が値を埋める
+    def __init__(self, kind, model, cache_status):
+        self.kind = kind
+        self.model = short_model_name(model)
+        self.cache_status = cache_status
+        self.retry_count = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.ttft = None
+        self.status = "ok"
+        self.error = None
+        self._started = time.perf_counter()
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._started
+
+    def set_usage(self, input_tokens, output_tokens, cached_tokens=0):
+        # input_tokens は暗黙のキャッシュから読まれた分（cached_tokens）を含む
+        self.input_tokens = input_tokens or 0
+        self.output_tokens = output_tokens or 0
+        self.cached_tokens = cached_tokens or 0
+
+    def set_sdk_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.set_usage(
+                usage.prompt_token_count,
+                usage.candidates_token_count,
+                usage.cached_content_token_count,
+            )
+
+    def set_rest_usage(self, response_json):
+        usage = response_json.get("usageMetadata", {})
+        self.set_usage(
+            usage.get("promptTokenCount"),
+            usage.get("candidatesTokenCount"),
+            usage.get("cachedContentTokenCount"),
+        )
+
+    def to_record(self):
+        duration = time.perf_counter() - self._started
+        return {
+            "ts": time.time(),
+            "kind": self.kind,
+            "model": self.model,
+            "cache": self.cache_status,
+            "status": self.status,
+            "error": self.error,
+            "duration_seconds": round(duration, 4),
+            "ttft_seconds": None if self.ttft is None else round(self.ttft, 4),
+            "retry_count": self.retry_count,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": estimate_cost(
+                self.model, self.input_tokens, self.output_tokens, self.cached_tokens
+            ),
+        }
+
+
+class track:
+    # with telemetry.track("article", model_name) as call: ... の形で呼び出しを計測する
+    def __init__(self, kind, model, cache_status="miss"):
+        self.call = Call(kind, model, cache_status)
+
+    def __enter__(self):
+        return self.call
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.call.status = "error"
+            self.call.error = f"{exc_type.__name__}: {exc}"
+        record(self.call.to_record())
+        return False
+
+
+def record(entry):
+    labels = (
+        f'kind="{entry["kind"]}",model="{entry["model"]}",'
+        f'status="{entry["status"]}",cache="{entry["cache"]}"'
+    )
+    with _lock:
+        _recent.append(entry)
+        totals = _totals.setdefault(
+            labels,
+            {"count": 0, "duration": 0.0, "in": 0, "out": 0, "cached": 0, "cost": 0.0},
+        )
+        totals["count"] += 1
+        totals["duration"] += entry["duration_seconds"]
+        totals["in"] += entry["input_tokens"]
+        totals["out"] += entry["output_tokens"]
+        totals["cached"] += entry["cached_tokens"]
+        totals["cost"] += entry["cost_usd"] or 0.0
+    try:
+        _get_logger().info(json.dumps(entry, ensure_ascii=False))
+    except OSError:
+        # ログが書けなくてもアプリの動作は止めない
+        pass
+
+
+def record_cache_hit(kind, model):
+    with track(kind, model, cache_status="hit"):
+        pass
+
+
+def recent_calls():
+    with _lock:
+        return list(_recent)
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(calls=None):
+    # 呼び出し種別・モデルごとに集計する（パフォーマンスパネル用）
+    calls = recent_calls() if calls is None else calls
+    groups = {}
+    for call in calls:
+        groups.setdefault((call["kind"], call["model"]), []).append(call)
+
+    rows = []
+    for (kind, model), items in sorted(groups.items()):
+        live = [c for c in items if c["cache"] != "hit"]
+        durations = [c["duration_seconds"] for c in live if c["status"] == "ok"]
+        ttfts = [c["ttft_seconds"] for c in live if c["ttft_seconds"] is not None]
+        costs = [c["cost_usd"] for c in items if c["cost_usd"] is not None]
+        rows.append(
+            {
+                "種別": kind,
+                "モデル": model,
+                "回数": len(items),
+                "キャッシュヒット": sum(1 for c in items if c["cache"] == "hit"),
+                "エラー": sum(1 for c in items if c["status"] == "error"),
+                "p50(秒)": _percentile(durations, 0.5),
+                "p95(秒)": _percentile(durations, 0.95),
+                "TTFT p50(秒)": _percentile(ttfts, 0.5),
+                "入力トークン": sum(c["input_tokens"] for c in items),
+                "出力トークン": sum(c["output_tokens"] for c in items),
+                "キャッシュ済み入力": sum(c.get("cached_tokens", 0) for c in items),
+                "リトライ": sum(c["retry_count"] for c in items),
+                "コスト(USD)": round(sum(costs), 6) if costs else None,
+            }
+        )
+    return rows
+
+
+def prometheus_text():
+    # Prometheusのテキスト形式で、プロセス起動からの累計を返す
+    with _lock:
+        totals = {labels: dict(values) for labels, values in _totals.items()}
+
+    lines = [
+        "# HELP llmo_llm_calls_total Model calls since process start.",
+        "# TYPE llmo_llm_calls_total counter",
+    ]
+    lines += [f"llmo_llm_calls_total{{{k}}} {v['count']}" for k, v in totals.items()]
+    lines += [
+        "# HELP llmo_llm_call_duration_seconds_total Total wall time of model calls.",
+        "# TYPE llmo_llm_call_duration_seconds_total counter",
+    ]
+    lines += [
+        f"llmo_llm_call_duration_seconds_total{{{k}}} {v['duration']:.4f}"
+        for k, v in totals.items()
+    ]
+    lines += [
+        "# HELP llmo_llm_tokens_total Tokens used by model calls.",
+        "# TYPE llmo_llm_tokens_total counter",
+    ]
+    for k, v in totals.items():
+        lines.append(f'llmo_llm_tokens_total{{{k},direction="input"}} {v["in"]}')
+        lines.append(f'llmo_llm_tokens_total{{{k},direction="output"}} {v["out"]}')
+        lines.append(
+            f'llmo_llm_tokens_total{{{k},direction="cached_input"}} {v["cached"]}'
+        )
+    lines += [
+        "# HELP llmo_llm_cost_usd_total Estimated cost of model calls in USD.",
+        "# TYPE llmo_llm_cost_usd_total counter",
+    ]
+    lines += [
+        f"llmo_llm_cost_usd_total{{{k}}} {v['cost']:.6f}" for k, v in totals.items()
+    ]
+    return "\n".join(lines) + "\n"
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    # 環境変数 LLMO_METRICS_PORT が設定されている場合に、/metrics を公開する
+    # 既定ではこのマシンからだけ読めるようにする（外部から収集する場合は LLMO_METRICS_HOST で指定する）
+    global _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _metrics_server = server
+        return server
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+import article_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return article_store.ArticleStore(
+        db_path=str(tmp_path / "articles.sqlite3"), snapshot_interval=4
+    )
+
+
+@pytest.mark.parametrize(
+    "before, after",
+    [
+        ("", "一行目\n二行目\n"),
+        ("一行目\n二行目\n", ""),
+        ("a\nb\nc\n", "a\nB\nc\nd\n"),
+        ("a\nb\nc", "x\na\nb\nc"),
+        ("末尾に改行なし", "末尾に改行なし\n"),
+        ("a\r\nb\r\n", "a\r\nc\r\n"),
+        ("同じ\n同じ\n同じ\n", "同じ\n違う\n同じ\n"),
+    ],
+)
+def test_delta_round_trip(before, after):
+    assert (
+        article_store.apply_delta(before, article_store.make_delta(before, after))
+        == after
+    )
+
+
+def test_every_revision_is_restored_across_snapshots(store):
+    texts = [f"# 見出し\n\n段落{i}\n" + "共通の行\n" * 20 for i in range(10)]
+    article_id, _ = store.create("タイトル", texts[0], owner="a")
+    for text in texts[1:]:
+        store.commit(article_id, text, "manual")
+
+    revisions = store.revisions(article_id)
+    assert [r["number"] for r in revisions] == list(range(1, 11))
+    assert [r["number"] for r in revisions if r["snapshot"]] == [1, 5, 9]
+    # メモリ上の復元結果を使わず、保存した差分から復元する
+    reopened = article_store.ArticleStore(db_path=store.db_path, snapshot_interval=4)
+    for number, text in enumerate(texts, start=1):
+        assert reopened.load(article_id, number) == text
+    assert reopened.head(article_id) == (10, texts[-1])
+
+
+def test_commit_without_changes_does_not_add_revision(store):
+    article_id, number = store.create("タイトル", "本文", owner="a")
+    assert store.commit(article_id, "本文", "manual") == number
+    assert store.commit(article_id, "本文", "manual", {"note": "x"}) == number + 1
+
+
+def test_revert_adds_a_new_revision(store):
+    article_id, _ = store.create("タイトル", "一版目", owner="a")
+    store.commit(article_id, "二版目", "manual")
+    assert store.revert(article_id, 1) == 3
+    assert store.load(article_id) == "一版目"
+    assert store.revisions(article_id)[-1]["params"] == {"reverted_to": 1}
+
+
+def test_unknown_origin_is_rejected(store):
+    article_id, _ = store.create("タイトル", "本文", owner="a")
+    with pytest.raises(ValueError):
+        store.commit(article_id, "別の本文", "unknown")
+
+
+def test_articles_are_listed_per_owner(store):
+    mine, _ = store.create("自分の記事", "本文", owner="a")
+    store.create("他人の記事", "本文", owner="b")
+    assert [a["id"] for a in store.articles("a")] == [mine]
+    assert store.articles("c") == []
+    assert len(store.articles(article_store.ALL_OWNERS, limit=-1)) == 2
+
+
+def test_articles_without_owner_are_not_listed(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    # 所有者の列がない古い形式のデータベース
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE articles (id TEXT PRIMARY KEY, title TEXT NOT NULL,"
+        " head INTEGER NOT NULL, head_text BLOB NOT NULL,"
+        " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO articles VALUES ('old', '古い記事', 0, x'', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    store = article_store.ArticleStore(db_path=path)
+    assert store.articles(None) == []
+    assert [a["id"] for a in store.articles(article_store.ALL_OWNERS)] == ["old"]
@@ -0,0 +1,105 @@
+import incremental_grounding
+import paragraphs
+
+TEXT = "最初の段落です。\n\n二つ目の段落です。続きの文です。\n\n三つ目の段落です。"
+CHUNKS = [{"web": {"uri": "https://a.example"}}, {"web": {"uri": "https://b.example"}}]
+
+
+def _support(text, *indices):
+    return {"segment": {"text": text}, "groundingChunkIndices": list(indices)}
+
+
+def test_paragraph_spans_match_split_paragraphs():
+    text = "  a\n\n b \n \n\n  c\n"
+    spans = paragraphs.paragraph_spans(text)
+    assert [text[start:end] for start, end in spans] == paragraphs.split_paragraphs(
+        text
+    )
+
+
+def test_support_inside_one_paragraph():
+    meta = {
+        "groundingChunks": CHUNKS,
+        "groundingSupports": [_support("続きの文です。", 1)],
+    }
+    states = incremental_grounding.build_paragraph_states(TEXT, meta)
+    assert [len(state["supports"]) for state in states] == [0, 1, 0]
+    assert states[1]["chunks"] == [CHUNKS[1]]
+    assert states[1]["supports"][0]["groundingChunkIndices"] == [0]
+
+
+def test_support_spanning_paragraphs_is_split():
+    segment = "最初の段落です。\n\n二つ目の段落です。"
+    meta = {"groundingChunks": CHUNKS, "groundingSupports": [_support(segment, 0)]}
+    states = incremental_grounding.build_paragraph_states(TEXT, meta)
+    assert [s["supports"][0]["segment"]["text"] for s in states[:2]] == [
+        "最初の段落です。",
+        "二つ目の段落です。",
+    ]
+    assert states[0]["chunks"] == states[1]["chunks"] == [CHUNKS[0]]
+    assert states[2]["supports"] == []
+
+
+def test_support_with_different_whitespace_attaches_to_first_paragraph():
+    segment = "二つ目の段落です。\n三つ目の段落です。"
+    meta = {"groundingChunks": CHUNKS, "groundingSupports": [_support(segment, 0)]}
+    states = incremental_grounding.build_paragraph_states(TEXT, meta)
+    assert [len(state["supports"]) for state in states] == [0, 1, 0]
+
+
+def test_merge_round_trip_keeps_every_citation():
+    meta = {
+        "groundingChunks": CHUNKS,
+        "groundingSupports": [
+            _support("最初の段落です。\n\n二つ目の段落です。", 0),
+            _support("三つ目の段落です。", 1),
+        ],
+    }
+    states = incremental_grounding.build_paragraph_states(TEXT, meta)
+    merged = incremental_grounding.merge_paragraph_states(states)
+    assert merged["groundingChunks"] == CHUNKS
+    assert len(merged["groundingSupports"]) == 3
+
+
+def test_plan_groups_consecutive_changed_paragraphs():
+    states = incremental_grounding.build_paragraph_states(TEXT, {})
+    edited = (
+        "変更した段落。\n\n" + TEXT.replace("三つ目", "3つ目") + "\n\n追加した段落。"
+    )
+    items, runs = incremental_grounding.plan(edited, states)
+    assert [item["state"] is not None for item in items] == [
+        False,
+        True,
+        True,
+        False,
+        False,
+    ]
+    assert runs == [[0], [3, 4]]
+
+
+def test_reground_replaces_only_changed_runs(monkeypatch):
+    original = "# 見出し\n\n最初の段落です。  \n続きの行。\n\n\n\n二つ目の段落です。\n"
+    states = incremental_grounding.build_paragraph_states(original, {})
+    edited = original.replace("二つ目", "書き換えた二つ目")
+
+    def ground_run(api_key, items, run):
+        target = "\n\n".join(items[index]["text"] for index in run)
+        segment = "書き換えた二つ目の段落です。"
+        meta = {
+            "groundingChunks": CHUNKS[:1],
+            "groundingSupports": [_support(segment, 0)],
+        }
+        return target + "[出典]", meta, "gemini-2.5-flash"
+
+    monkeypatch.setattr(incremental_grounding, "_ground_run", ground_run)
+    progress = []
+    new_text, new_states, response_json = incremental_grounding.reground(
+        "key", edited, states, lambda *args: progress.append(args)
+    )
+    # まとまりが終わるたびに、進み具合と応答したモデルが通知される
+    assert progress == [(1, 1, "gemini-2.5-flash")]
+    # 変更のない段落の行末の空白や空行の数は、そのまま残る
+    assert new_text == edited.replace("です。\n", "です。[出典]\n")
+    assert [len(state["supports"]) for state in new_states] == [0, 0, 1]
+    content = response_json["candidates"][0]["content"]["parts"][0]["text"]
+    assert content == new_text
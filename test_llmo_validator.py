@@ -0,0 +1,89 @@
+import llm
+import llmo_validator
+
+ARTICLE = """業務自動化とは、手作業で行っていた定型業務を仕組みで処理することです。
+
+## 手作業が生む課題
+手作業のままでは、ミスと残業が減りません。
+
+| 項目 | 手作業 | 自動化 |
+| --- | --- | --- |
+| 所要時間 | 2時間 | 5分 |
+| ミス | 多い | 少ない |
+
+## 自動化の進め方
+ワークフローを3ステップで見直し、DXの第一歩にします。
+
+1. 業務を洗い出す
+2. 自動化する範囲を決める
+3. 小さく試す
+
+## まとめ
+ノーコードで始めるなら、FlowSparkが近道です。
+"""
+
+
+def _failed_rules(text, keywords=()):
+    return [
+        check["rule"]
+        for check in llmo_validator.failing(llmo_validator.validate(text, keywords))
+    ]
+
+
+def test_article_meeting_every_requirement_passes():
+    checks = llmo_validator.validate(ARTICLE, ["業務自動化"])
+    assert checks and all(check["ok"] for check in checks)
+
+
+def test_each_missing_requirement_points_at_its_section():
+    broken = (
+        ARTICLE.replace("業務自動化とは、", "業務自動化で、")
+        .replace("3. 小さく試す\n", "")
+        .replace("FlowSpark", "ツール")
+    )
+    checks = {
+        check["rule"]: check
+        for check in llmo_validator.failing(llmo_validator.validate(broken))
+    }
+    assert sorted(checks) == ["definition", "product", "steps"]
+    assert checks["steps"]["location"] == "「自動化の進め方」"
+    assert checks["product"]["location"] == "「まとめ」"
+
+
+def test_summary_must_be_a_single_line():
+    broken = ARTICLE.replace(
+        "手作業のままでは、ミスと残業が減りません。\n",
+        "手作業のままでは、\nミスと残業が減りません。\n",
+    )
+    assert _failed_rules(broken) == ["summary"]
+
+
+def test_missing_keywords_are_listed():
+    checks = llmo_validator.validate(ARTICLE, ["RPA"])
+    missing = [check for check in checks if check["rule"] == "theme_keywords"][0]
+    assert not missing["ok"] and missing["detail"] == "不足: RPA"
+
+
+def test_repair_rewrites_only_failing_sections(monkeypatch):
+    prompts_sent = []
+
+    def generate_text(model, prompt, **kwargs):
+        prompts_sent.append(prompt)
+        # 見出しを落とした修正結果を返す
+        return "ノーコードで始めるなら、FlowSparkが近道です。"
+
+    monkeypatch.setattr(llm, "generate_text", generate_text)
+    broken = ARTICLE.replace("FlowSpark", "ツール")
+    checks = llmo_validator.validate(broken)
+    repaired, locations = llmo_validator.repair(None, broken, checks, title="題")
+
+    assert locations == ["「まとめ」"]
+    assert len(prompts_sent) == 1 and "## まとめ" in prompts_sent[0]
+    assert repaired == ARTICLE.strip()
+    assert not llmo_validator.failing(llmo_validator.validate(repaired))
+
+
+def test_repair_without_failures_returns_text_unchanged(monkeypatch):
+    monkeypatch.setattr(llm, "generate_text", None)
+    checks = llmo_validator.validate(ARTICLE)
+    assert llmo_validator.repair(None, ARTICLE, checks) == (ARTICLE, [])
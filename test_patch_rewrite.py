@@ -0,0 +1,66 @@
+import pytest
+
+import patch_rewrite
+
+# 段落の間の空行の数や行末の空白がまちまちな記事
+TEXT = "# 見出し\n\n第一段落です。  \n続きの行。\n\n\n\n第二段落です。\n  \n- 項目A\n    - 項目B\n\n最後の段落です。\n"
+
+
+def _edit(paragraph, anchor, replacement):
+    return {"paragraph": paragraph, "anchor": anchor, "replacement": replacement}
+
+
+def test_untouched_paragraphs_keep_their_whitespace():
+    new_text, changed = patch_rewrite.apply_edits(
+        TEXT, [_edit(3, "第二段落", "書き換えた第二段落です。")]
+    )
+    assert changed == [3]
+    assert new_text == TEXT.replace("第二段落です。", "書き換えた第二段落です。")
+
+
+def test_anchor_is_used_when_paragraph_number_is_off():
+    new_text, changed = patch_rewrite.apply_edits(
+        TEXT, [_edit(1, "最後の段落", "締めの段落です。")]
+    )
+    assert changed == [5]
+    assert new_text.endswith("    - 項目B\n\n締めの段落です。\n")
+
+
+def test_multiple_edits_are_spliced_independently():
+    new_text, changed = patch_rewrite.apply_edits(
+        TEXT,
+        [_edit(5, "最後の段落", "最後。"), _edit(2, "第一段落", "一つ目。")],
+    )
+    assert changed == [2, 5]
+    assert new_text == (
+        "# 見出し\n\n一つ目。\n\n\n\n第二段落です。\n  \n- 項目A\n    - 項目B\n\n最後。\n"
+    )
+
+
+def test_deleting_a_paragraph_removes_its_separator():
+    new_text, _ = patch_rewrite.apply_edits(TEXT, [_edit(3, "第二段落", "")])
+    assert new_text == (
+        "# 見出し\n\n第一段落です。  \n続きの行。\n\n\n\n- 項目A\n    - 項目B\n\n最後の段落です。\n"
+    )
+
+
+def test_deleting_trailing_paragraphs_leaves_no_dangling_separator():
+    new_text, _ = patch_rewrite.apply_edits(
+        TEXT, [_edit(4, "-項目A", ""), _edit(5, "最後の段落", "")]
+    )
+    assert (
+        new_text == "# 見出し\n\n第一段落です。  \n続きの行。\n\n\n\n第二段落です。\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "edits",
+    [
+        [_edit(1, "", "x")],
+        [_edit(1, "存在しない", "x")],
+        [_edit(2, "第一段落", "x"), _edit(2, "第一段落", "y")],
+    ],
+)
+def test_invalid_edits_raise(edits):
+    with pytest.raises(patch_rewrite.PatchError):
+        patch_rewrite.apply_edits(TEXT, edits)
@@ -0,0 +1,74 @@
+import pytest
+
+import longform
+import prompts
+
+OUTLINE = longform.default_outline()
+FACTS = [{"text": "事実", "sources": [{"title": "出典"}]}]
+
+
+def test_every_prefix_constant_is_registered():
+    constants = [
+        value
+        for name, value in vars(prompts).items()
+        if name.endswith("_PREFIX") and isinstance(value, str)
+    ]
+    assert sorted(constants) == sorted(prompts.STATIC_PREFIXES)
+
+
+@pytest.mark.parametrize(
+    "prefix, prompt",
+    [
+        (prompts.TITLE_PREFIX, lambda: prompts.build_title_prompt("DX")),
+        (
+            prompts.ARTICLE_PREFIX,
+            lambda: prompts.build_article_prompt("題", "DX", "3000"),
+        ),
+        (
+            prompts.OUTLINE_PREFIX,
+            lambda: prompts.build_outline_prompt("題", "DX", "3000"),
+        ),
+        (
+            prompts.SECTION_PREFIX,
+            lambda: prompts.build_section_prompt(
+                "題", "DX", OUTLINE, OUTLINE["sections"][0], 500
+            ),
+        ),
+        (prompts.GROUNDING_PREFIX, lambda: prompts.build_grounding_prompt("本文")),
+        (
+            prompts.PARTIAL_GROUNDING_PREFIX,
+            lambda: prompts.build_partial_grounding_prompt("本文", "前", "後"),
+        ),
+        (
+            prompts.FAST_GROUNDING_PREFIX,
+            lambda: prompts.build_fast_grounding_prompt("本文", FACTS),
+        ),
+        (
+            prompts.SECTION_REPAIR_PREFIX,
+            lambda: prompts.build_section_repair_prompt("題", "## 見出し", ["直す"]),
+        ),
+        (prompts.REWRITE_PREFIX, lambda: prompts.build_rewrite_prompt("本文", "短く")),
+        (
+            prompts.PATCH_REWRITE_PREFIX,
+            lambda: prompts.build_patch_rewrite_prompt("[1]\n本文", "短く"),
+        ),
+    ],
+    ids=[
+        "titles",
+        "article",
+        "outline",
+        "section",
+        "grounding",
+        "partial_grounding",
+        "fast_grounding",
+        "section_repair",
+        "rewrite",
+        "patch_rewrite",
+    ],
+)
+def test_builders_start_with_a_cacheable_prefix(prefix, prompt):
+    # 暗黙のキャッシュに載るよう、どの呼び出しも固定の前置きで始まる
+    text = prompt()
+    found, rest = prompts.split_static_prefix(text)
+    assert found == prefix
+    assert rest and prefix + "\n\n" + rest == text
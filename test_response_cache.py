@@ -0,0 +1,61 @@
+import response_cache
+
+
+def _cache(tmp_path, **kwargs):
+    return response_cache.ResponseCache(
+        db_path=str(tmp_path / "responses.sqlite3"), **kwargs
+    )
+
+
+def test_make_key_keeps_markdown_indentation():
+    # リストやコードブロックの字下げだけが違う本文は、別のキーになる
+    flat = "次の記事を調整してください。\n\n- 項目\n- 項目\n"
+    nested = "次の記事を調整してください。\n\n- 項目\n    - 項目\n"
+    assert response_cache.make_key("m", flat) != response_cache.make_key("m", nested)
+
+
+def test_make_key_ignores_line_endings_and_outer_whitespace():
+    assert response_cache.make_key("m", "a\r\nb\n") == response_cache.make_key(
+        "m", "  a\nb"
+    )
+
+
+def test_make_key_depends_on_model_and_config():
+    key = response_cache.make_key("m", "p")
+    assert key != response_cache.make_key("n", "p")
+    assert key != response_cache.make_key("m", "p", {"temperature": 0})
+
+
+def test_memory_tier_honors_ttl(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    now[0] += 11
+    assert cache.get("k") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_disk_hit_keeps_original_timestamp(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    _cache(tmp_path, ttl_seconds=10).set("k", "v")
+    # 別プロセスに相当する新しいインスタンスで、ディスクからメモリに載せ直す
+    cache = _cache(tmp_path, ttl_seconds=10)
+    now[0] += 5
+    assert cache.get("k") == "v"
+    now[0] += 6
+    assert cache.get("k") is None
+
+
+def test_evicts_oldest_over_max_bytes(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = _cache(tmp_path, max_bytes=10)
+    for key in "abc":
+        cache.set(key, "12345")
+        now[0] += 1
+    assert cache.get("a") is None
+    assert cache.get("b") == "12345"
+    assert cache.get("c") == "12345"
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+import llm
+import response_cache
+import router
+import scheduler
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(router, "_samples", {})
+    monkeypatch.setattr(router, "ROUTES", {"k": ["m1", "m2"]})
+    monkeypatch.setattr(router, "LOG_PATH", str(tmp_path / "routing.jsonl"))
+    monkeypatch.setattr(router, "_finish", lambda decision, started, status: None)
+    lanes = {m: scheduler.Lane(m, 6000, 10**9, 4) for m in ("m1", "m2")}
+    monkeypatch.setattr(scheduler, "_lanes", lanes)
+    return lanes
+
+
+class _Response:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _recorded(model="m1"):
+    return [ok for _, _, ok in router._samples.get(("k", model), ())]
+
+
+def test_falls_back_to_next_model_on_error():
+    def attempt(model):
+        if model == "m1":
+            raise RuntimeError("unavailable")
+        return model, 10
+
+    assert router.run("k", "m1", attempt, 1) == "m2"
+    assert _recorded("m1") == [False]
+    assert _recorded("m2") == [True]
+
+
+def test_models_over_error_budget_are_tried_last(monkeypatch):
+    monkeypatch.setattr(router, "MIN_SAMPLES", 2)
+    router.record("k", "m1", 0.1, False)
+    router.record("k", "m1", 0.1, False)
+    assert router.candidates("k", "m1") == ["m2", "m1"]
+
+
+def test_cancellation_is_not_recorded_and_does_not_fall_back(isolated):
+    cancel = threading.Event()
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        # 応答が届く前にユーザーが取り消した
+        cancel.set()
+        return _Response(model), 10
+
+    with scheduler.cancel_on(cancel):
+        with pytest.raises(scheduler.RequestCancelled):
+            router.run("k", "m1", attempt, 1)
+    assert calls == ["m1"]
+    assert router._samples == {}
+    assert isolated["m1"].stats()["in_flight"] == 0
+
+
+def test_cancellation_raised_by_attempt_is_not_recorded():
+    def attempt(model):
+        raise scheduler.RequestCancelled("取り消し")
+
+    with pytest.raises(scheduler.RequestCancelled):
+        router.run("k", "m1", attempt, 1)
+    assert router._samples == {}
+
+
+def test_losing_hedge_is_cancelled_and_not_counted(monkeypatch, isolated):
+    monkeypatch.setattr(router, "hedge_delay", lambda kind, model: 0.05)
+    release = threading.Event()
+    responses = []
+
+    def attempt(model):
+        response = _Response(f"call{len(responses)}")
+        responses.append(response)
+        if response.name == "call0":
+            release.wait(2)
+        return response, 10
+
+    result = router.run("k", "m1", attempt, 1)
+    assert result is responses[1]
+    # 負けた呼び出しの枠は、応答を待たずに返している
+    assert isolated["m1"].stats()["in_flight"] == 0
+
+    release.set()
+    deadline = time.monotonic() + 2
+    while not responses[0].closed:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert _recorded("m1") == [True]
+    assert isolated["m1"].stats()["in_flight"] == 0
+
+
+class _Model:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if self.model_name.endswith("m1"):
+            raise RuntimeError("unavailable")
+        return type("Response", (), {"text": self.model_name, "usage_metadata": None})
+
+
+def test_fallback_response_is_not_cached_under_requested_model(monkeypatch, tmp_path):
+    cache = response_cache.ResponseCache(db_path=str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(response_cache, "get_cache", lambda: cache)
+    model = _Model("models/m1")
+    assert llm.generate_text(model, "p", kind="k") == "models/m2"
+    assert cache.get(response_cache.make_key("models/m1", "p")) is None
+    assert router.is_fallback("k", "m1", "models/m2")
+    assert not router.is_fallback("k", "m1", "models/m1")
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import scheduler
+
+
+@pytest.fixture
+def lane(monkeypatch):
+    lane = scheduler.Lane("m", 6000, 10**9, 1)
+    monkeypatch.setattr(scheduler, "_lanes", {"m": lane})
+    return lane
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_token_bucket_refills_at_rate_and_caps_at_capacity():
+    bucket = scheduler.TokenBucket(60)
+    bucket.tokens = 0
+    assert bucket.wait_seconds(1) == pytest.approx(1.0)
+    # 容量を超える量は容量まで丸めるので、いつかは必ず送信できる
+    assert bucket.wait_seconds(600) == pytest.approx(60.0)
+    bucket.refill(bucket.updated + 30)
+    assert bucket.tokens == pytest.approx(30)
+    bucket.refill(bucket.updated + 600)
+    assert bucket.tokens == bucket.capacity
+
+
+def test_sessions_are_served_round_robin(lane):
+    held = lane.acquire("x", 1, "other")
+    order = []
+
+    def worker(session_id, name):
+        ticket = lane.acquire(session_id, 1, "other")
+        order.append(name)
+        lane.release(ticket)
+
+    threads = []
+    for session_id, name in [("a", "a1"), ("a", "a2"), ("b", "b1")]:
+        thread = threading.Thread(target=worker, args=(session_id, name))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: lane.stats()["waiting"] == len(threads))
+
+    lane.release(held)
+    for thread in threads:
+        thread.join(2)
+    assert order == ["a1", "b1", "a2"]
+    assert lane.stats()["in_flight"] == 0
+
+
+def test_release_is_idempotent(lane):
+    ticket = lane.acquire("x", 1, "other")
+    lane.release(ticket)
+    lane.release(ticket)
+    assert lane.stats()["in_flight"] == 0
+
+
+def test_cancel_event_removes_queued_call(lane):
+    held = scheduler.acquire("m", 1)
+    cancel = threading.Event()
+    errors = []
+
+    def worker():
+        with scheduler.cancel_on(cancel):
+            try:
+                scheduler.acquire("m", 1)
+            except scheduler.RequestCancelled as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    _wait_until(lambda: lane.stats()["waiting"] == 1)
+    cancel.set()
+    thread.join(2)
+    assert len(errors) == 1
+    stats = lane.stats()
+    assert (stats["waiting"], stats["in_flight"], stats["cancelled"]) == (0, 1, 1)
+    scheduler.release(held)
+
+
+def test_nested_cancel_events_are_all_honored():
+    outer, inner = threading.Event(), threading.Event()
+    with scheduler.cancel_on(outer):
+        with scheduler.cancel_on(inner):
+            assert not scheduler.cancelled()
+            outer.set()
+            assert scheduler.cancelled()
+            with pytest.raises(scheduler.RequestCancelled):
+                scheduler.check_cancelled()
+    assert not scheduler.cancelled()
+
+
+def test_submit_carries_cancel_events_to_worker():
+    cancel = threading.Event()
+    cancel.set()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with scheduler.cancel_on(cancel):
+            future = scheduler.submit(executor, scheduler.cancelled)
+        assert future.result() is True
+        assert scheduler.submit(executor, scheduler.cancelled).result() is False
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+import llm
+import title_generation
+
+ITEMS = [
+    {"title": "手作業をなくす3つの方法", "department": "経理", "pain_point": "転記"},
+    {"title": "承認フローを自動化する", "department": "人事", "pain_point": "押印"},
+    {"title": "営業日報をDXする", "department": "営業", "pain_point": "報告"},
+]
+FULL = json.dumps({"titles": ITEMS}, ensure_ascii=False, indent=2)
+
+
+def test_parse_titles_reads_complete_json():
+    assert title_generation.parse_titles(FULL) == ITEMS
+
+
+# 各タイトル案の閉じ括弧の直後の位置
+ENDS = [FULL.index("}", FULL.index(item["pain_point"])) + 1 for item in ITEMS]
+
+
+@pytest.mark.parametrize(
+    "cut",
+    [
+        0,
+        FULL.index('"department"') + 4,
+        FULL.index(ITEMS[1]["title"]) + 3,
+        ENDS[0] - 1,
+        ENDS[0],
+        FULL.index(",", ENDS[0]) + 1,
+        ENDS[1],
+        len(FULL),
+    ],
+    ids=[
+        "empty",
+        "mid_key",
+        "mid_string",
+        "before_close",
+        "after_close",
+        "after_comma",
+        "second_closed",
+        "complete",
+    ],
+)
+def test_partial_json_yields_only_completed_titles(cut):
+    # どこで途切れても、閉じ括弧まで届いたタイトル案だけを先頭から順に返す
+    completed = sum(1 for end in ENDS if end <= cut)
+    assert title_generation.completed_titles(FULL[:cut]) == ITEMS[:completed]
+
+
+def test_truncated_output_falls_back_to_completed_titles():
+    truncated = FULL[: FULL.index(ITEMS[2]["title"])]
+    assert title_generation.parse_titles(truncated) == ITEMS[:2]
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "not json", '{"other": []}', "[]", '{"titles": "x"}', '{"titles": [1, {}]}'],
+)
+def test_unexpected_shapes_give_no_titles(text):
+    assert title_generation.parse_titles(text) == []
+
+
+def test_items_are_normalized():
+    text = json.dumps(
+        {"titles": [{"title": "  題  ", "department": None}, {"title": " "}]}
+    )
+    assert title_generation.parse_titles(text) == [
+        {"title": "題", "department": "", "pain_point": ""}
+    ]
+
+
+def test_stream_reports_each_title_once(monkeypatch):
+    def stream_text(model, prompt, placeholder, **kwargs):
+        for end in range(1, len(FULL) + 1):
+            placeholder.markdown(FULL[:end] + llm.STREAM_CURSOR)
+        return FULL
+
+    monkeypatch.setattr(llm, "stream_text", stream_text)
+    seen = []
+    titles = title_generation.generate(None, "DX", on_title=seen.append)
+    assert seen == ITEMS
+    assert titles == ITEMS
+
+
+def test_generate_drops_excluded_and_duplicate_titles(monkeypatch):
+    duplicated = json.dumps({"titles": ITEMS + ITEMS[:1]}, ensure_ascii=False)
+    monkeypatch.setattr(llm, "generate_text", lambda *args, **kwargs: duplicated)
+    titles = title_generation.generate(None, "DX", exclude=[ITEMS[1]["title"]])
+    assert titles == [ITEMS[0], ITEMS[2]]
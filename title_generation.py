@@ -0,0 +1,136 @@
+import json
+
+import llm
+import prompts
+
+# タイトル案の生成
+# 出力の形をJSONスキーマで固定し、番号の書き方などの揺れで解析に失敗しないようにする
+# ストリーミング中も、閉じ括弧まで届いたタイトル案から順に取り出して表示できるようにする
+
+TITLE_COUNT = 10
+
+# SDKの生成設定とREST（check_models.py）の両方でそのまま使えるよう、型名は大文字で書く
+TITLE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "titles": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "title": {"type": "STRING"},
+                    "department": {"type": "STRING"},
+                    "pain_point": {"type": "STRING"},
+                },
+                "required": ["title", "department", "pain_point"],
+            },
+        }
+    },
+    "required": ["titles"],
+}
+
+TITLE_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": TITLE_SCHEMA,
+}
+
+_decoder = json.JSONDecoder()
+
+
+def _normalize(item):
+    # タイトルが空のものや、形の違う要素は捨てる
+    if not isinstance(item, dict) or not isinstance(item.get("title"), str):
+        return None
+    title = item["title"].strip()
+    if not title:
+        return None
+    return {
+        "title": title,
+        "department": str(item.get("department") or "").strip(),
+        "pain_point": str(item.get("pain_point") or "").strip(),
+    }
+
+
+def completed_titles(text):
+    # 途中までのJSONから、"titles" の配列のうち閉じ括弧まで届いた要素だけを取り出す
+    key = text.find('"titles"')
+    start = text.find("[", key) if key >= 0 else -1
+    if start < 0:
+        return []
+    items = []
+    position = start + 1
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] != "{":
+            break
+        try:
+            item, position = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        item = _normalize(item)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def parse_titles(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # 出力が途中で切れた場合も、完成しているタイトル案は使う
+        return completed_titles(text)
+    items = data.get("titles", []) if isinstance(data, dict) else []
+    return [item for item in map(_normalize, items) if item is not None]
+
+
+class _TitleStream:
+    # llm.stream_textの描画先の代わりに、届いた本文から完成したタイトル案を取り出して渡す
+    def __init__(self, on_title):
+        self.on_title = on_title
+        self.count = 0
+
+    def markdown(self, text):
+        items = completed_titles(text.removesuffix(llm.STREAM_CURSOR))
+        for item in items[self.count :]:
+            self.on_title(item)
+        self.count = max(self.count, len(items))
+
+
+def generate(
+    model,
+    keywords_str,
+    summary="",
+    exclude=(),
+    count=TITLE_COUNT,
+    use_cache=True,
+    on_title=None,
+):
+    # タイトル案の一覧（title, department, pain_pointの辞書）を返す
+    # exclude には生成済みのタイトルを渡し、重複しない案を追加で作らせる
+    # on_title を渡すとストリーミングで生成し、完成したタイトル案ごとに呼び出す
+    prompt = prompts.build_title_prompt(keywords_str, summary, count, exclude)
+    if on_title is None:
+        text = llm.generate_text(
+            model,
+            prompt,
+            generation_config=TITLE_CONFIG,
+            use_cache=use_cache,
+            kind="titles",
+        )
+    else:
+        text = llm.stream_text(
+            model,
+            prompt,
+            _TitleStream(on_title),
+            generation_config=TITLE_CONFIG,
+            use_cache=use_cache,
+            kind="titles",
+        )
+    seen = set(exclude)
+    titles = []
+    for item in parse_titles(text):
+        if item["title"] not in seen:
+            seen.add(item["title"])
+            titles.append(item)
+    return titles